@@ -0,0 +1,11 @@
+"""
+OEIS 公式提取与分类
+
+    taxonomy           分类方案注册表（4 类、11 类，可 register_taxonomy 新增）
+    submit_pipeline    生成并提交 Batch 请求
+    download_pipeline  查询任务状态、下载并解析结果
+    result_store       分类结果存储（jsonl / sqlite / parquet）
+    json_backend       共用的 JSON 序列化层
+"""
+
+from oeis_classfy.taxonomy import Taxonomy, register_taxonomy, get_taxonomy, list_taxonomies
@@ -0,0 +1,91 @@
+import os
+import sys
+import re
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.data_onlyclean_json import clean_seq_lines, remove_from_start_end_content, remove_conjecture_lines
+
+
+def legacy_clean_formula_line(line: str) -> str:
+    """
+    原始实现：每行两次未预编译的 re.sub
+    """
+    line = re.sub(r"^%F\s+[A-Za-z0-9]+", "", line).strip()
+    line = re.sub(r" - _.*$", "", line)
+    return line.strip()
+
+
+def legacy_clean_seq_lines(lines):
+    """
+    原始的三遍处理：删除 (Start)/(End) 块 -> 删除 Conjecture 行 -> 清理 %F 行
+    """
+    lines = remove_from_start_end_content(lines)
+    lines = remove_conjecture_lines(lines)
+
+    formulas = []
+    for line in lines:
+        if line.startswith("%F"):
+            text = legacy_clean_formula_line(line)
+            if text:
+                formulas.append(text)
+    return formulas
+
+
+def load_sample(src_root, limit):
+    """
+    读取最多 limit 个 .seq 文件的内容到内存，避免磁盘 I/O 干扰计时
+    """
+    sample = []
+    for folder in sorted(os.listdir(src_root)):
+        folder_path = os.path.join(src_root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file in sorted(os.listdir(folder_path)):
+            if not file.endswith(".seq"):
+                continue
+            with open(os.path.join(folder_path, file), "r", encoding="utf-8", errors="ignore") as f:
+                sample.append(f.readlines())
+            if len(sample) >= limit:
+                return sample
+    return sample
+
+
+def run(clean_func, sample, repeat):
+    """返回 (最佳耗时秒数, 清理结果)"""
+    best = None
+    results = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [clean_func(lines) for lines in sample]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比三遍清理与单遍融合清理的吞吐量")
+    parser.add_argument("--src", default="oeis", help="原始 OEIS 数据路径")
+    parser.add_argument("--limit", type=int, default=20000, help="最多读取的 .seq 文件数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    sample = load_sample(args.src, args.limit)
+    total_lines = sum(len(lines) for lines in sample)
+    if total_lines == 0:
+        print("❌ 没有读取到任何 .seq 内容，请检查 --src 路径")
+        exit(1)
+
+    print(f"📂 样本: {len(sample)} 个文件，{total_lines} 行")
+
+    legacy_time, legacy_results = run(legacy_clean_seq_lines, sample, args.repeat)
+    fused_time, fused_results = run(clean_seq_lines, sample, args.repeat)
+
+    if legacy_results != fused_results:
+        print("❌ 两种实现的结果不一致！")
+        exit(1)
+
+    print(f"📊 三遍处理: {legacy_time:.3f} 秒, {total_lines / legacy_time:,.0f} 行/秒")
+    print(f"📊 单遍融合: {fused_time:.3f} 秒, {total_lines / fused_time:,.0f} 行/秒")
+    print(f"🚀 加速比: {legacy_time / fused_time:.2f}x（结果完全一致）")
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.bench_pipeline import FORMULA_TEMPLATES
+from oeis_classfy.result_store import open_result_store
+from oeis_classfy import json_backend, download_pipeline
+from oeis_classfy.taxonomy import get_taxonomy, list_taxonomies
+
+
+def generate_batch_output(path, num_sequences, categories, seed=0):
+    """
+    生成伪造的 batch 输出 JSONL（每行一个序列的分类结果，夹杂少量失败行），返回总行数
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f_out:
+        for i in range(num_sequences):
+            sequence_id = f"A{i:06d}"
+            if rng.random() < 0.001:
+                f_out.write(json.dumps({"custom_id": f"request-{i}-{sequence_id}", "status_code": 500}) + "\n")
+                continue
+
+            result = {
+                "sequence_id": sequence_id,
+                "extracted_formulas": [
+                    {
+                        "formula_text": rng.choice(FORMULA_TEMPLATES).format(a=rng.randint(1, 9), b=rng.randint(1, 9)),
+                        "formula_type": rng.choice(categories),
+                        "formula_latex": "",
+                        "confidence": round(rng.uniform(0.5, 1.0), 2)
+                    }
+                    for _ in range(rng.choice([1, 1, 2, 2, 3, 4, 6, 10]))
+                ]
+            }
+            response_line = {
+                "custom_id": f"request-{i}-{sequence_id}",
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant",
+                                                      "content": json.dumps(result, ensure_ascii=False)}}]}
+                }
+            }
+            f_out.write(json.dumps(response_line, ensure_ascii=False) + "\n")
+    return num_sequences
+
+
+def run(taxonomy, output_path, result_dir, workers):
+    """返回 (耗时秒数, 统计信息, 结果存储中的全部 (序列ID, 结果))"""
+    if os.path.exists(result_dir):
+        shutil.rmtree(result_dir)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        download_pipeline.process_results(output_path, result_dir, workers=workers, taxonomy=taxonomy,
+                                          min_parallel_bytes=0)
+        elapsed = time.perf_counter() - start
+
+    with open(os.path.join(result_dir, "formula_type_statistics.json"), "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    with open_result_store(result_dir, "jsonl") as store:
+        results = [(sequence_id, result) for sequence_id, _, result in store.iter_results()]
+    return elapsed, stats, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比串行解析与进程池并行解析 batch 输出的吞吐量")
+    parser.add_argument("--output", help="已有的 batch_output.jsonl（不指定则生成合成数据）")
+    parser.add_argument("--sequences", type=int, default=100000, help="合成数据的序列数量")
+    parser.add_argument("--taxonomy", choices=list_taxonomies(), default="4", help="分类方案（见 taxonomy.py）")
+    parser.add_argument("--workers", default="2,4,8", help="要测试的进程数，逗号分隔")
+    parser.add_argument("--work-dir", default="bench_parsing_work", help="临时工作目录（会被清空）")
+    args = parser.parse_args()
+
+    categories = list(get_taxonomy(args.taxonomy).formula_types)
+
+    if os.path.exists(args.work_dir):
+        shutil.rmtree(args.work_dir)
+    os.makedirs(args.work_dir)
+
+    output_path = args.output
+    if not output_path:
+        output_path = os.path.join(args.work_dir, "batch_output.jsonl")
+        print(f"🧪 生成合成 batch 输出: {args.sequences} 个序列")
+        generate_batch_output(output_path, args.sequences, categories)
+
+    size_mb = os.path.getsize(output_path) / 1024 / 1024
+    print(f"📂 结果文件: {output_path} ({size_mb:.1f} MB), JSON 后端 {json_backend.BACKEND}")
+
+    serial_time, serial_stats, serial_results = run(args.taxonomy, output_path,
+                                                    os.path.join(args.work_dir, "serial"), 1)
+    print(f"📊 串行:      {serial_time:8.2f} 秒, {size_mb / serial_time:8.2f} MB/秒, "
+          f"{serial_stats['total_formulas']} 个公式")
+
+    cpu_count = os.cpu_count() or 1
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        if workers > cpu_count:
+            print(f"⚠️ 只有 {cpu_count} 个 CPU 核，{workers} 进程会被限制为 {cpu_count} 个")
+        elapsed, stats, results = run(args.taxonomy, output_path,
+                                      os.path.join(args.work_dir, f"workers_{workers}"), workers)
+        if stats != serial_stats or results != serial_results:
+            print(f"❌ {workers} 进程的结果与串行不一致！")
+            exit(1)
+        print(f"📊 {workers:2d} 进程:   {elapsed:8.2f} 秒, {size_mb / elapsed:8.2f} MB/秒, "
+              f"加速比 {serial_time / elapsed:.2f}x（结果完全一致）")
+
+    shutil.rmtree(args.work_dir)
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+from multiprocessing import Process, Queue
+
+try:
+    import resource  # Windows 上不可用，此时不统计峰值内存
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.data_onlyclean_json import extract_F_lines, clean_seq_lines
+from oeis_classfy import json_backend, submit_pipeline, download_pipeline
+from oeis_classfy.taxonomy import get_taxonomy, list_taxonomies
+
+# 合成公式模板
+FORMULA_TEMPLATES = [
+    "G.f.: x/(1-{a}*x-{b}*x^2).",
+    "E.g.f.: exp({a}*x)/(1-x).",
+    "a(n) = {a}*a(n-1) + {b}*a(n-2).",
+    "a(n) = {a}*a(n-1) - a(n-{b}) for n > {b}.",
+    "a(n) = binomial({a}*n, n)/(n+{b}).",
+    "a(n) = Sum_{{k=0..n}} binomial(n, k)^{a}.",
+    "a(n) = Product_{{k=1..n}} ({a}*k - {b}).",
+    "a(n) = n^{a} + {b}*n.",
+    "a(n) ~ {a}^n / (sqrt(Pi) * n^(3/2)).",
+    "Lim_{{n->infinity}} a(n+1)/a(n) = {a}.",
+]
+
+
+def random_seq_lines(rng, sequence_id):
+    """生成一个类似 OEIS 内部格式的 .seq 文件内容"""
+    lines = [
+        f"%I {sequence_id} M0000",
+        f"%S {sequence_id} " + ",".join(str(rng.randint(0, 10 ** 6)) for _ in range(20)),
+        f"%N {sequence_id} Synthetic sequence for benchmarking.",
+    ]
+    for _ in range(rng.choice([0, 1, 1, 2, 2, 3, 4, 6, 10])):
+        formula = rng.choice(FORMULA_TEMPLATES).format(a=rng.randint(1, 9), b=rng.randint(1, 9))
+        roll = rng.random()
+        if roll < 0.05:
+            lines.append(f"%F {sequence_id} From _Jane Doe_, Jan 01 2020: (Start)")
+            lines.append(f"%F {sequence_id} {formula}")
+            lines.append(f"%F {sequence_id} (End)")
+        elif roll < 0.10:
+            lines.append(f"%F {sequence_id} Conjecture: {formula}")
+        elif roll < 0.40:
+            lines.append(f"%F {sequence_id} {formula} - _John Smith_, Feb 02 2012")
+        else:
+            lines.append(f"%F {sequence_id} {formula}")
+    lines.append(f"%K {sequence_id} nonn")
+    lines.append(f"%A {sequence_id} _Bench Author_")
+    return [line + "\n" for line in lines]
+
+
+def generate_corpus(work_dir, num_sequences, categories, seed=0):
+    """
+    生成合成 OEIS 数据（oeis/Annn/*.seq）以及与之对应的伪造 batch 输出 JSONL
+    """
+    rng = random.Random(seed)
+    src_root = os.path.join(work_dir, "oeis")
+    output_path = os.path.join(work_dir, "fake_batch_output.jsonl")
+    os.makedirs(src_root, exist_ok=True)
+
+    with open(output_path, "w", encoding="utf-8") as f_out:
+        request_index = 0
+        for i in range(num_sequences):
+            sequence_id = f"A{i:06d}"
+            folder = os.path.join(src_root, sequence_id[:4])
+            os.makedirs(folder, exist_ok=True)
+
+            lines = random_seq_lines(rng, sequence_id)
+            with open(os.path.join(folder, sequence_id + ".seq"), "w", encoding="utf-8") as f:
+                f.writelines(lines)
+
+            formulas = clean_seq_lines(lines)
+            if not formulas:
+                continue
+
+            # 模拟模型返回的分类结果
+            result = {
+                "sequence_id": sequence_id,
+                "extracted_formulas": [
+                    {
+                        "formula_text": formula,
+                        "formula_type": rng.choice(categories),
+                        "formula_latex": "",
+                        "confidence": round(rng.uniform(0.5, 1.0), 2)
+                    }
+                    for formula in formulas
+                ]
+            }
+            response_line = {
+                "custom_id": f"request-{request_index}-{sequence_id}",
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant",
+                                                      "content": json.dumps(result, ensure_ascii=False)}}]}
+                }
+            }
+            f_out.write(json.dumps(response_line, ensure_ascii=False) + "\n")
+            request_index += 1
+
+    return src_root, output_path
+
+
+def dir_stats(path, suffix):
+    """统计目录下指定后缀文件的数量和总字节数"""
+    count = 0
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.endswith(suffix):
+                count += 1
+                size += os.path.getsize(os.path.join(root, file))
+    return count, size
+
+
+def count_lines(paths):
+    """统计若干文件的总行数"""
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            total += sum(1 for _ in f)
+    return total
+
+
+def _stage_child(stage, params, queue):
+    """在子进程中运行单个阶段，返回耗时和峰值内存"""
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        if stage == "extract":
+            start = time.perf_counter()
+            extract_F_lines(params["src_root"], params["clean_root"])
+        elif stage == "build":
+            start = time.perf_counter()
+            submit_pipeline.create_batch_jsonl_with_formula_types(params["clean_root"], params["request_dir"],
+                                                                  taxonomy=params["taxonomy"])
+        elif stage == "validate":
+            start = time.perf_counter()
+            for shard in params["request_files"]:
+                submit_pipeline.validate_jsonl_file(shard)
+        elif stage == "parse":
+            start = time.perf_counter()
+            download_pipeline.process_results(params["output_path"], params["result_dir"],
+                                              taxonomy=params["taxonomy"])
+        else:
+            raise ValueError(f"未知阶段: {stage}")
+        elapsed = time.perf_counter() - start
+
+    peak_rss_mb = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位是 KB，macOS 上是字节
+        peak_rss_mb = peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+    queue.put((elapsed, peak_rss_mb))
+
+
+def run_stage(stage, params):
+    """在独立子进程中运行阶段，保证每个阶段的峰值内存互不影响"""
+    queue = Queue()
+    proc = Process(target=_stage_child, args=(stage, params, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def report_line(stage, elapsed, peak_rss_mb, items, size, unit):
+    rss_text = f"{peak_rss_mb:8.1f} MB" if peak_rss_mb is not None else "     n/a   "
+    print(f"  {stage:<9} {elapsed:8.2f} 秒  峰值内存 {rss_text}  "
+          f"{items / elapsed:12,.0f} {unit}/秒  {size / 1024 / 1024 / elapsed:8.2f} MB/秒")
+
+
+def run_benchmark(work_dir, num_sequences, taxonomy="4", seed=0, keep=False):
+    """
+    生成合成数据并依次对 clean -> build -> validate -> parse 四个阶段计时
+    """
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    categories = list(get_taxonomy(taxonomy).formula_types)
+
+    print(f"🧪 生成合成数据: {num_sequences} 个序列 -> {work_dir}")
+    start = time.perf_counter()
+    src_root, output_path = generate_corpus(work_dir, num_sequences, categories, seed)
+    print(f"  ✅ 生成完成，用时 {time.perf_counter() - start:.2f} 秒")
+
+    params = {
+        "taxonomy": taxonomy,
+        "src_root": src_root,
+        "clean_root": os.path.join(work_dir, "oeis_onlyclean_json"),
+        "request_dir": os.path.join(work_dir, "batch_requests"),
+        "output_path": output_path,
+        "result_dir": os.path.join(work_dir, "batch_results", "task_1"),
+    }
+
+    results = []
+
+    seq_count, seq_size = dir_stats(src_root, ".seq")
+    elapsed, rss = run_stage("extract", params)
+    results.append(("extract", elapsed, rss, seq_count, seq_size, "文件"))
+
+    json_count, json_size = dir_stats(params["clean_root"], ".json")
+    elapsed, rss = run_stage("build", params)
+    results.append(("build", elapsed, rss, json_count, json_size, "文件"))
+
+    params["request_files"] = sorted(
+        os.path.join(params["request_dir"], f) for f in os.listdir(params["request_dir"]) if f.endswith(".jsonl")
+    )
+    request_count = count_lines(params["request_files"])
+    request_size = sum(os.path.getsize(f) for f in params["request_files"])
+    elapsed, rss = run_stage("validate", params)
+    results.append(("validate", elapsed, rss, request_count, request_size, "请求"))
+
+    output_count = count_lines([output_path])
+    elapsed, rss = run_stage("parse", params)
+    results.append(("parse", elapsed, rss, output_count, os.path.getsize(output_path), "行"))
+
+    print(f"\n📊 基准测试结果 ({taxonomy} 类, {num_sequences} 个序列, JSON 后端 {json_backend.BACKEND}):")
+    for stage, elapsed, rss, items, size, unit in results:
+        report_line(stage, elapsed, rss, items, size, unit)
+
+    if not keep:
+        shutil.rmtree(work_dir)
+
+    return results
+
+
+if __name__ == "__main__":
+    # JSON 后端由环境变量 OEIS_JSON_BACKEND=orjson|msgspec|json 选择，对比各后端时分别运行即可
+    parser = argparse.ArgumentParser(description="使用合成 OEIS 数据对整个处理流程做离线基准测试")
+    parser.add_argument("--sequences", type=int, default=10000, help="合成序列数量（建议 10k-500k）")
+    parser.add_argument("--taxonomy", choices=list_taxonomies(), default="4", help="分类方案（见 taxonomy.py）")
+    parser.add_argument("--work-dir", default="bench_work", help="临时工作目录（会被清空）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留生成的数据和中间结果")
+    args = parser.parse_args()
+
+    run_benchmark(args.work_dir, args.sequences, taxonomy=args.taxonomy, seed=args.seed, keep=args.keep)
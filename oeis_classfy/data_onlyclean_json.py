@@ -1,6 +1,18 @@
 import os
+import sys
 import re
-import json  # 添加json模块
+import argparse
+import gzip
+import hashlib
+import io
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.json_backend import loads, dumps, dumps_pretty
+
+# 预编译的清理正则
+F_PREFIX_PATTERN = re.compile(r"^%F\s+[A-Za-z0-9]+")  # %F 和序列编号
+AUTHOR_SUFFIX_PATTERN = re.compile(r" - _.*$")  # 人名和日期部分
 
 
 def clean_formula_line(line: str) -> str:
@@ -8,10 +20,10 @@ def clean_formula_line(line: str) -> str:
     清理公式行：去掉 %F 和序列编号 + 人名和日期
     """
     # 删除 %F 和序列编号
-    line = re.sub(r"^%F\s+[A-Za-z0-9]+", "", line).strip()
+    line = F_PREFIX_PATTERN.sub("", line).strip()
 
     # 删除人名和日期部分
-    line = re.sub(r" - _.*$", "", line)
+    line = AUTHOR_SUFFIX_PATTERN.sub("", line)
 
     return line.strip()
 
@@ -45,58 +57,466 @@ def remove_conjecture_lines(lines: list) -> list:
     return [line for line in lines if "Conjecture" not in line]
 
 
-def extract_F_lines(src_root, dst_root):
+MANIFEST_NAME = ".extract_manifest.jsonl"  # 增量模式的清单文件（不以 .json 结尾，避免被当作序列文件）
+JSONL_SHARD_PREFIX = "formulas_"  # jsonl 输出格式的分片文件名前缀
+
+
+def clean_seq_lines(lines):
+    """
+    对 .seq 文件的所有行执行清理流程，返回清理后的公式列表
+
+    单次遍历完成 remove_from_start_end_content、remove_conjecture_lines
+    和 clean_formula_line 三个步骤，不产生中间列表；lines 可以是任意
+    行迭代器（包括打开的文件对象），结果与依次调用三个函数完全一致。
+    """
+    prefix_sub = F_PREFIX_PATTERN.sub
+    author_sub = AUTHOR_SUFFIX_PATTERN.sub
+    formulas = []
+    skip = False
+
+    for line in lines:
+        # Step 1: From 和 (Start) 到 (End) 之间的行全部跳过（对所有行生效）
+        if "From" in line and "(Start)" in line:
+            skip = True
+        if skip:
+            if "(End)" in line:
+                skip = False
+            continue
+
+        # Step 2: 只保留不含 "Conjecture" 的 %F 行
+        if not line.startswith("%F") or "Conjecture" in line:
+            continue
+
+        # Step 3: 清理公式
+        text = author_sub("", prefix_sub("", line).strip()).strip()
+        if text:  # 避免空行
+            formulas.append(text)
+
+    return formulas
+
+
+def process_seq_file(file_path):
+    """
+    读取并清理单个 .seq 文件，返回清理后的公式列表
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        return clean_seq_lines(f)
+
+
+def build_json_text(sequence_id, formulas):
+    """
+    生成单个序列的 JSON 文本（缩进 2 格，与 json.dump(indent=2) 写出的内容一致）
+    """
+    # 创建JSON数据结构
+    json_data = {
+        "sequence_id": sequence_id,
+        "formulas": formulas,
+        "formula_count": len(formulas)
+    }
+    return dumps_pretty(json_data)
+
+
+def process_folder(folder_path, dst_folder):
+    """
+    处理单个 aNNN 文件夹，返回 (只剩一行公式的序列数, 处理的序列数)
+    """
+    os.makedirs(dst_folder, exist_ok=True)
+
+    single_line_count = 0
+    total_sequences = 0
+
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith(".seq"):
+            continue
+
+        formulas = process_seq_file(os.path.join(folder_path, file))
+
+        if formulas:  # 只在有内容时生成文件
+            # 获取序列ID（从文件名）
+            sequence_id = file.replace(".seq", "")
+
+            # 保存为JSON文件
+            dst_file = os.path.join(dst_folder, file.replace(".seq", ".json"))
+            with open(dst_file, "w", encoding="utf-8") as out:
+                out.write(build_json_text(sequence_id, formulas))
+
+            # 统计只剩一行公式的序列
+            if len(formulas) == 1:
+                single_line_count += 1
+
+            # 统计总处理序列数
+            total_sequences += 1
+
+    return single_line_count, total_sequences
+
+
+def collect_folder_records(folder_path):
+    """
+    清理单个 aNNN 文件夹，返回 [(序列ID, 公式列表), ...]（不写文件，供 jsonl 输出使用）
+    """
+    records = []
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith(".seq"):
+            continue
+
+        formulas = process_seq_file(os.path.join(folder_path, file))
+        if formulas:
+            records.append((file.replace(".seq", ""), formulas))
+
+    return records
+
+
+class JsonlShardWriter:
+    """
+    把所有序列写入分片的 JSONL 数据集（每行一个序列），替代每个序列一个 JSON 文件
+    """
+
+    def __init__(self, dst_root, max_records_per_shard=50000):
+        self.dst_root = dst_root
+        self.max_records_per_shard = max_records_per_shard
+        self.shard_paths = []
+        self._f_out = None
+        self._current_records = 0
+
+    def _open_next_shard(self):
+        if self._f_out is not None:
+            self._f_out.close()
+        shard_path = os.path.join(self.dst_root, f"{JSONL_SHARD_PREFIX}{len(self.shard_paths) + 1:05d}.jsonl")
+        self._f_out = open(shard_path, "w", encoding="utf-8")
+        self.shard_paths.append(shard_path)
+        self._current_records = 0
+
+    def write(self, sequence_id, formulas):
+        if self._f_out is None or self._current_records >= self.max_records_per_shard:
+            self._open_next_shard()
+
+        record = {
+            "sequence_id": sequence_id,
+            "formulas": formulas,
+            "formula_count": len(formulas)
+        }
+        self._f_out.write(dumps(record) + "\n")
+        self._current_records += 1
+
+    def close(self):
+        if self._f_out is not None:
+            self._f_out.close()
+            self._f_out = None
+
+
+def remove_old_shards(dst_root):
+    """删除上次运行留下的 jsonl 分片，避免新旧数据混在一起"""
+    for name in os.listdir(dst_root):
+        if name.startswith(JSONL_SHARD_PREFIX) and name.endswith(".jsonl"):
+            os.remove(os.path.join(dst_root, name))
+
+
+def process_folder_incremental(folder_path, dst_folder, old_entries):
+    """
+    增量处理单个 aNNN 文件夹：只重新清理新增或修改过的 .seq 文件
+
+    old_entries 为上次运行时该文件夹的清单 {sequence_id: entry}。
+    返回 (只剩一行公式的序列数, 处理的序列数, 新清单条目, 重新生成的文件数)
+    """
+    os.makedirs(dst_folder, exist_ok=True)
+
+    single_line_count = 0
+    total_sequences = 0
+    rewritten = 0
+    entries = {}
+    dst_name = os.path.basename(dst_folder)
+
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith(".seq"):
+            continue
+
+        sequence_id = file.replace(".seq", "")
+        file_path = os.path.join(folder_path, file)
+        dst_file = os.path.join(dst_folder, file.replace(".seq", ".json"))
+        st = os.stat(file_path)
+        old = old_entries.get(sequence_id)
+
+        entry = None
+        if old is not None and (old["formula_count"] == 0 or os.path.exists(dst_file)):
+            if old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                # 大小和修改时间都未变化，直接沿用
+                entry = old
+            else:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() == old["source_sha256"]:
+                    # 内容未变（仅 mtime 变化），更新 mtime 后沿用
+                    entry = dict(old, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+        if entry is None:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            # 与 open(..., "r", errors="ignore") 相同的解码和换行处理
+            lines = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="ignore")
+            formulas = clean_seq_lines(lines)
+
+            output_sha256 = None
+            if formulas:
+                text = build_json_text(sequence_id, formulas)
+                with open(dst_file, "w", encoding="utf-8") as out:
+                    out.write(text)
+                output_sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            elif os.path.exists(dst_file):
+                # 修改后不再有公式，删除旧的输出
+                os.remove(dst_file)
+
+            entry = {
+                "sequence_id": sequence_id,
+                "folder": dst_name,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "source_sha256": hashlib.sha256(data).hexdigest(),
+                "formula_count": len(formulas),
+                "output_sha256": output_sha256
+            }
+            rewritten += 1
+
+        entries[sequence_id] = entry
+
+        if entry["formula_count"] > 0:
+            # 统计只剩一行公式的序列
+            if entry["formula_count"] == 1:
+                single_line_count += 1
+
+            # 统计总处理序列数
+            total_sequences += 1
+
+    return single_line_count, total_sequences, entries, rewritten
+
+
+def load_manifest(manifest_path):
+    """读取增量清单，返回 {sequence_id: entry}"""
+    manifest = {}
+    if not os.path.exists(manifest_path):
+        return manifest
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = loads(line)
+                manifest[entry["sequence_id"]] = entry
+    return manifest
+
+
+def save_manifest(manifest_path, entries):
+    """原子地写出增量清单（按序列ID排序）"""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for sequence_id in sorted(entries):
+            f.write(dumps(entries[sequence_id]) + "\n")
+    os.replace(tmp_path, manifest_path)
+
+
+def _process_folder_task(task):
+    """进程池工作函数：解包参数并处理一个文件夹"""
+    folder, folder_path, dst_folder, old_entries, output_format = task
+    if output_format == "jsonl":
+        records = collect_folder_records(folder_path)
+        single_line_count = sum(1 for _, formulas in records if len(formulas) == 1)
+        return folder, single_line_count, len(records), records, None
+    if old_entries is None:
+        single_line_count, total_sequences = process_folder(folder_path, dst_folder)
+        return folder, single_line_count, total_sequences, None, None
+    return (folder,) + process_folder_incremental(folder_path, dst_folder, old_entries)
+
+
+def extract_F_lines(src_root, dst_root, workers=1, incremental=False, output_format="json",
+                    max_records_per_shard=50000):
+    """
+    提取并清理所有 .seq 文件中的 %F 行
+
+    workers > 1 时按 aNNN 文件夹分片到进程池并行处理，
+    结果按文件夹顺序合并，输出与串行运行完全一致。
+    incremental=True 时根据 dst_root 下的清单只处理新增或修改的序列，
+    并删除源文件已不存在的序列对应的 JSON。
+    output_format="jsonl" 时不再按序列生成 JSON 文件，而是写入
+    dst_root 下的 formulas_NNNNN.jsonl 分片（每个分片最多 max_records_per_shard 行）。
+    """
+    if output_format not in ("json", "jsonl"):
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    if incremental and output_format != "json":
+        raise ValueError("增量模式仅支持 json 输出格式")
+
     if not os.path.exists(dst_root):
         os.makedirs(dst_root)
 
+    writer = None
+    if output_format == "jsonl":
+        remove_old_shards(dst_root)
+        writer = JsonlShardWriter(dst_root, max_records_per_shard)
+
     single_line_count = 0  # 统计只剩一行公式的序列数
     total_sequences = 0  # 统计总共处理的序列数
 
+    manifest_path = os.path.join(dst_root, MANIFEST_NAME)
+    old_manifest = load_manifest(manifest_path) if incremental else None
+
+    # 按输出文件夹拆分旧清单，每个任务只携带自己的部分
+    old_by_folder = {}
+    if incremental:
+        for sequence_id, entry in old_manifest.items():
+            old_by_folder.setdefault(entry["folder"], {})[sequence_id] = entry
+
+    tasks = []
     for folder in sorted(os.listdir(src_root)):
         folder_path = os.path.join(src_root, folder)
         if not os.path.isdir(folder_path):
             continue
 
         dst_folder = os.path.join(dst_root, folder.lower())  # a000 格式
-        os.makedirs(dst_folder, exist_ok=True)
+        old_entries = old_by_folder.get(folder.lower(), {}) if incremental else None
+        tasks.append((folder, folder_path, dst_folder, old_entries, output_format))
 
-        for file in sorted(os.listdir(folder_path)):
-            if not file.endswith(".seq"):
+    if workers > 1:
+        pool = Pool(processes=workers)
+        # imap 保证结果按提交顺序返回，计数合并与串行一致
+        results = pool.imap(_process_folder_task, tasks)
+    else:
+        pool = None
+        results = map(_process_folder_task, tasks)
+
+    new_manifest = {}
+    rewritten = 0
+
+    try:
+        for folder, folder_single, folder_total, entries, folder_rewritten in results:
+            single_line_count += folder_single
+            total_sequences += folder_total
+            if writer is not None:
+                for sequence_id, formulas in entries:
+                    writer.write(sequence_id, formulas)
+            elif incremental:
+                new_manifest.update(entries)
+                rewritten += folder_rewritten
+            print(f"📂 处理完成文件夹 {folder}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not None:
+            writer.close()
+
+    if incremental:
+        # 删除源文件已被移除的序列
+        removed = 0
+        for sequence_id, entry in old_manifest.items():
+            if sequence_id in new_manifest:
                 continue
+            stale_file = os.path.join(dst_root, entry["folder"], sequence_id + ".json")
+            if os.path.exists(stale_file):
+                os.remove(stale_file)
+            removed += 1
+
+        save_manifest(manifest_path, new_manifest)
+        print(f"♻️ 增量模式: 重新处理 {rewritten} 个文件，"
+              f"跳过 {len(new_manifest) - rewritten} 个未变化文件，删除 {removed} 个已移除序列")
 
-            file_path = os.path.join(folder_path, file)
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
+    if writer is not None:
+        print(f"🗂️ 已写入 {len(writer.shard_paths)} 个 JSONL 分片")
 
-            # Step 1: 删除 From 和 (Start) 到 (End) 之间的内容
-            lines = remove_from_start_end_content(lines)
+    print(f"✅ %F 行提取并清理完成！")
+    print(f"📊 总共有 {single_line_count} 个序列只剩下了一行公式。")
+    print(f"📊 总共有 {total_sequences} 个序列被处理！")
 
-            # Step 2: 删除包含 "Conjecture" 的行
-            lines = remove_conjecture_lines(lines)
+    return single_line_count, total_sequences
 
-            formulas = []
-            for line in lines:
-                if line.startswith("%F"):
-                    # Step 3: 清理公式
-                    text = clean_formula_line(line)
-                    if text:  # 避免空行
-                        formulas.append(text)
+
+def open_dump(dump_path):
+    """
+    以文本流方式打开 OEIS 合并格式文件，支持 .gz 和 .zst 压缩
+    """
+    if dump_path.endswith(".gz"):
+        return gzip.open(dump_path, "rt", encoding="utf-8", errors="ignore")
+
+    if dump_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("读取 .zst 文件需要安装 zstandard: pip install zstandard")
+        raw = open(dump_path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", errors="ignore")
+
+    return open(dump_path, "r", encoding="utf-8", errors="ignore")
+
+
+def iter_dump_records(dump_path):
+    """
+    流式读取合并格式文件，逐个产出 (序列ID, 该序列的所有行)
+
+    遇到 %I 行或序列ID变化时切分记录，内存中只保留当前一条序列。
+    """
+    sequence_id = None
+    lines = []
+
+    with open_dump(dump_path) as f:
+        for line in f:
+            if not line.startswith("%"):
+                continue  # 跳过记录之间的空行
+
+            parts = line.split(None, 2)
+            if len(parts) < 2:
+                continue
+            line_id = parts[1]
+
+            if line_id != sequence_id or parts[0] == "%I":
+                if lines:
+                    yield sequence_id, lines
+                sequence_id = line_id
+                lines = []
+
+            lines.append(line)
+
+    if lines:
+        yield sequence_id, lines
+
+
+def extract_F_lines_from_dump(dump_path, dst_root, output_format="json", max_records_per_shard=50000):
+    """
+    从单个合并格式文件（可为 .gz/.zst）中提取并清理 %F 行
+
+    一次顺序读取、常量内存，输出目录结构和内容与 extract_F_lines 相同。
+    """
+    if output_format not in ("json", "jsonl"):
+        raise ValueError(f"不支持的输出格式: {output_format}")
+
+    if not os.path.exists(dst_root):
+        os.makedirs(dst_root)
+
+    writer = None
+    if output_format == "jsonl":
+        remove_old_shards(dst_root)
+        writer = JsonlShardWriter(dst_root, max_records_per_shard)
+
+    single_line_count = 0  # 统计只剩一行公式的序列数
+    total_sequences = 0  # 统计总共处理的序列数
+    current_folder = None
+
+    try:
+        for sequence_id, lines in iter_dump_records(dump_path):
+            folder = sequence_id[:4].lower()  # a000 格式
+            if folder != current_folder:
+                if current_folder is not None:
+                    print(f"📂 处理完成文件夹 {current_folder}")
+                current_folder = folder
+                if writer is None:
+                    os.makedirs(os.path.join(dst_root, folder), exist_ok=True)
+
+            formulas = clean_seq_lines(lines)
 
             if formulas:  # 只在有内容时生成文件
-                # 获取序列ID（从文件名）
-                sequence_id = file.replace(".seq", "")
-
-                # 创建JSON数据结构
-                json_data = {
-                    "sequence_id": sequence_id,
-                    "formulas": formulas,
-                    "formula_count": len(formulas)
-                }
-
-                # 保存为JSON文件
-                dst_file = os.path.join(dst_folder, file.replace(".seq", ".json"))
-                with open(dst_file, "w", encoding="utf-8") as out:
-                    json.dump(json_data, out, indent=2, ensure_ascii=False)
+                if writer is not None:
+                    writer.write(sequence_id, formulas)
+                else:
+                    dst_file = os.path.join(dst_root, folder, sequence_id + ".json")
+                    with open(dst_file, "w", encoding="utf-8") as out:
+                        out.write(build_json_text(sequence_id, formulas))
 
                 # 统计只剩一行公式的序列
                 if len(formulas) == 1:
@@ -104,15 +524,39 @@ def extract_F_lines(src_root, dst_root):
 
                 # 统计总处理序列数
                 total_sequences += 1
+    finally:
+        if writer is not None:
+            writer.close()
 
-        print(f"📂 处理完成文件夹 {folder}")
+    if current_folder is not None:
+        print(f"📂 处理完成文件夹 {current_folder}")
+    if writer is not None:
+        print(f"🗂️ 已写入 {len(writer.shard_paths)} 个 JSONL 分片")
 
     print(f"✅ %F 行提取并清理完成！")
     print(f"📊 总共有 {single_line_count} 个序列只剩下了一行公式。")
     print(f"📊 总共有 {total_sequences} 个序列被处理！")
 
+    return single_line_count, total_sequences
+
 
 if __name__ == "__main__":
-    src_root = r"oeis"  # 原始 OEIS 数据路径
-    dst_root = r"oeis_onlyclean_json"  # 输出路径（改为json）
-    extract_F_lines(src_root, dst_root)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="提取并清理 OEIS 序列中的 %F 公式行")
+    parser.add_argument("--src", default="oeis", help="原始 OEIS 数据路径")
+    parser.add_argument("--dump", default=None,
+                        help="改为从单个合并格式文件读取（支持 .gz / .zst），忽略 --src")
+    parser.add_argument("--dst", default="oeis_onlyclean_json", help="输出路径（json）")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数（默认 1，即串行）")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"增量模式：根据 {MANIFEST_NAME} 只处理新增或修改的序列")
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json",
+                        help="输出格式：json 每个序列一个文件；jsonl 写入分片数据集")
+    parser.add_argument("--shard-size", type=int, default=50000, help="jsonl 格式下每个分片的最大序列数")
+    args = parser.parse_args()
+
+    if args.dump:
+        extract_F_lines_from_dump(args.dump, args.dst, output_format=args.format,
+                                  max_records_per_shard=args.shard_size)
+    else:
+        extract_F_lines(args.src, args.dst, workers=args.workers, incremental=args.incremental,
+                        output_format=args.format, max_records_per_shard=args.shard_size)
@@ -0,0 +1,997 @@
+"""
+Batch 任务的状态查询、结果下载和解析流程，所有分类方案共用（分类方案见 taxonomy.py）
+"""
+
+import os
+import json
+import time
+import gzip
+import hashlib
+import threading
+import contextlib
+import heapq
+import itertools
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Pool
+
+from oeis_classfy.result_store import open_result_store, RESULT_BACKENDS
+from oeis_classfy.json_backend import loads, decode_classification
+from oeis_classfy.taxonomy import DEFAULT_TAXONOMY, get_taxonomy, split_custom_id_namespace
+from oeis_classfy.zhipu_client import get_client
+from oeis_classfy.response_cache import ResponseCache, CachingResultStore
+from oeis_classfy.rule_classifier import RuleMergingResultStore, open_rule_store, materialize_rule_results
+from oeis_classfy.formula_dedupe import FormulaDedupeIndex, DedupeRecordingResultStore
+
+ACTIVE_STATUSES = ["validating", "in_progress", "finalizing"]  # 仍在处理中的任务状态
+DOWNLOAD_STATE_FILE = "download_state.json"  # 按 batch id 记录下载进度的状态文件
+# zhipuai SDK 的原始响应请求头（RAW_RESPONSE_HEADER）：值为 "stream" 时不读取响应体，
+# 直接返回未解析的流式响应，iter_bytes() 边接收边产出字节块
+STREAM_RESPONSE_HEADERS = {"X-Stainless-Raw-Response": "stream"}
+
+
+class DownloadState:
+    """
+    持久化的下载状态，保存在 output_base_dir/download_state.json，按 batch id 记录:
+        status          streaming / downloading / downloaded / finished
+        batch_status    任务最终状态（completed / failed / ...）
+        output_file_id  结果文件ID
+        output_bytes    已下载的结果文件字节数
+        output_sha256   结果文件校验和
+    重复运行时跳过 finished 的任务；停在 streaming 的任务（流式解析中断）改用可断点续传的下载。
+    每次更新都原子写入，可在多个下载线程间共享
+    """
+
+    def __init__(self, output_base_dir):
+        self.path = os.path.join(output_base_dir, DOWNLOAD_STATE_FILE)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, batch_id):
+        with self._lock:
+            return dict(self.entries.get(batch_id, {}))
+
+    def update(self, batch_id, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(batch_id, {})
+            entry.update(fields)
+            entry["updated_at"] = int(time.time())
+            self._save()
+
+    def is_finished(self, batch_id):
+        return self.get(batch_id).get("status") == "finished"
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def batch_output_dir(output_base_dir, batch_id):
+    """任务的输出目录由 batch id 决定，与任务ID文件中的顺序无关"""
+    return os.path.join(output_base_dir, f"task_{batch_id}")
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def download_file_resumable(file_id, dest_path, chunk_size=1024 * 1024):
+    """
+    断点续传下载远程文件，返回 (字节数, sha256)
+
+    数据流式写入 dest_path + ".part"（每块写入后立即 flush），下载完整后再改名；
+    中途断线时已收到的数据留在 .part 文件中，下次调用通过 HTTP Range 请求从断点继续下载。
+    服务端不支持 Range（未返回 206）时从头下载
+    """
+    part_path = dest_path + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+
+    sha = hashlib.sha256()
+    with open_file_response(file_id, headers) as response:
+        mode = 'wb'
+        if offset and response_status_code(response) == 206:
+            print(f"  🔁 从第 {offset} 字节继续下载: {os.path.basename(dest_path)}")
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    sha.update(chunk)
+            mode = 'ab'
+        else:
+            offset = 0
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_bytes(chunk_size):
+                f.write(chunk)
+                f.flush()
+                sha.update(chunk)
+                offset += len(chunk)
+
+    os.replace(part_path, dest_path)
+    return offset, sha.hexdigest()
+
+
+def download_error_file(batch_status, output_dir, state=None):
+    """下载任务的错误文件（如果有）"""
+    if not batch_status.error_file_id:
+        return
+    error_file_path = os.path.join(output_dir, "batch_errors.jsonl")
+    error_bytes, error_sha256 = download_file_resumable(batch_status.error_file_id, error_file_path)
+    if state is not None:
+        state.update(batch_status.id, error_file_id=batch_status.error_file_id,
+                     error_bytes=error_bytes, error_sha256=error_sha256)
+    print(f"  ⚠️  错误信息已下载至: {error_file_path}")
+
+
+@contextlib.contextmanager
+def open_download_store(output_base_dir, store_backend, taxonomy, response_cache=None, rule_results_dir=None,
+                        dedupe_index=None):
+    """
+    打开 output_base_dir 下的结果存储
+
+    指定 rule_results_dir（生成请求时的规则分类结果目录）时，模型结果与同一序列中规则已识别的公式合并后写入，
+    退出时把完全由规则分类的序列写入结果存储；
+    指定 response_cache（响应缓存数据库路径）时，新解析的模型结果同时写入缓存，
+    退出时把最近一次生成请求时命中缓存的序列从缓存写入结果存储；
+    指定 dedupe_index（生成请求时的公式去重索引路径）时，记录模型对每个唯一公式给出的类型，
+    退出时把标签展开到所有包含重复公式的序列
+    """
+    with open_result_store(output_base_dir, store_backend) as store, contextlib.ExitStack() as stack:
+        target = store
+        rule_store = None
+        if rule_results_dir:
+            rule_store = stack.enter_context(open_rule_store(rule_results_dir))
+            target = RuleMergingResultStore(store, rule_store)
+
+        cache = None
+        if response_cache:
+            cache = stack.enter_context(ResponseCache(response_cache))
+            # 缓存中保存的是模型对剩余公式的原始结果，合并规则结果在写入结果存储时进行
+            target = CachingResultStore(target, cache, taxonomy.name)
+
+        dedupe = None
+        if dedupe_index:
+            dedupe = stack.enter_context(FormulaDedupeIndex(dedupe_index))
+            # 去重索引按模型的原始结果（只含发送过的公式）记录标签
+            target = DedupeRecordingResultStore(target, dedupe, taxonomy.name)
+
+        yield target
+
+        if cache is not None:
+            materialized = cache.materialize_hits(taxonomy.name, target)
+            if materialized:
+                print(f"🗄️ 从响应缓存写入 {materialized} 个序列的结果")
+
+        if rule_store is not None:
+            materialized = materialize_rule_results(rule_store, store)
+            if materialized:
+                print(f"⚡ 写入 {materialized} 个完全由规则分类的序列")
+
+        if dedupe is not None:
+            expanded = dedupe.materialize(taxonomy.name, store, rule_store)
+            if expanded:
+                print(f"🔁 公式去重: 展开 {expanded} 个序列中重复公式的分类结果")
+            unresolved = dedupe.unresolved_owners(taxonomy.name)
+            if unresolved:
+                print(f"⚠️ 公式去重: {sum(unresolved.values())} 处重复公式的 owner 还没有分类结果"
+                      f"（{len(unresolved)} 个 owner 序列），用 reconcile --dedupe 重试这些请求")
+
+
+def read_task_ids(task_id_file):
+    """读取任务ID文件，文件不存在或为空时打印提示并返回空列表"""
+    if not os.path.exists(task_id_file):
+        print(f"❌ 任务ID文件不存在: {task_id_file}")
+        return []
+
+    with open(task_id_file, 'r') as f:
+        task_ids = [line.strip() for line in f if line.strip()]
+
+    if not task_ids:
+        print("❌ 任务ID文件中没有有效的任务ID")
+    return task_ids
+
+
+def check_and_download_results(task_id_file, output_base_dir="batch_results", stream_results=False,
+                               store_backend="jsonl", parse_workers=1, taxonomy=DEFAULT_TAXONOMY,
+                               response_cache=None, rule_results_dir=None, dedupe_index=None):
+    """
+    检查多个任务状态并下载所有结果，所有任务的分类结果写入 output_base_dir 下同一个结果存储
+
+    response_cache / rule_results_dir / dedupe_index 为生成请求时使用的响应缓存、规则分类结果和公式去重索引
+    （见 open_download_store）
+    """
+    taxonomy = get_taxonomy(taxonomy)
+    # 读取所有任务ID（使用响应缓存、规则分类或公式去重时即使没有任务，也要写入已有的结果）
+    task_ids = read_task_ids(task_id_file)
+    if not task_ids and not response_cache and not rule_results_dir and not dedupe_index:
+        return
+
+    print(f"📋 找到 {len(task_ids)} 个任务ID")
+
+    state = DownloadState(output_base_dir)
+
+    with open_download_store(output_base_dir, store_backend, taxonomy, response_cache, rule_results_dir,
+                             dedupe_index) as store:
+        # 为每个任务创建单独的输出目录
+        for i, task_id in enumerate(task_ids, 1):
+            if state.is_finished(task_id):
+                print(f"\n⏭️  任务 {i}/{len(task_ids)}: {task_id} 已下载并处理完毕，跳过")
+                continue
+
+            task_output_dir = batch_output_dir(output_base_dir, task_id)
+
+            # 确保输出目录存在
+            os.makedirs(task_output_dir, exist_ok=True)
+
+            output_result_file = os.path.join(task_output_dir, "batch_output.jsonl")
+
+            print(f"\n🔍 处理任务 {i}/{len(task_ids)}: {task_id}")
+            check_and_download_result(task_id, output_result_file, task_output_dir, stream_results, state, store,
+                                      parse_workers, taxonomy)
+
+
+def check_and_download_result(batch_id, output_result_path, output_dir, stream_results=False, state=None,
+                              store=None, parse_workers=1, taxonomy=DEFAULT_TAXONOMY):
+    """
+    检查单个任务状态并下载结果；state 为 DownloadState 时记录下载进度，
+    store 为结果存储（为空时写入 output_dir 下的 JSONL 存储），parse_workers 为解析结果文件的进程数
+    """
+    print(f"  ⏳ 检查任务状态...")
+
+    try:
+        batch_status = get_client().batches.retrieve(batch_id)
+        status = batch_status.status
+        print(f"  📊 任务状态: {status}")
+
+        if status in ACTIVE_STATUSES:
+            print(f"  ⏳ 任务仍在处理中 ({status})")
+            print("  💡 请稍后再运行此脚本")
+            return False
+
+        return download_batch_outputs(batch_status, output_result_path, output_dir, stream_results, state,
+                                      store, parse_workers, taxonomy)
+
+    except Exception as e:
+        print(f"  ❌ 检查任务状态时出错: {e}")
+        return False
+
+
+def download_batch_outputs(batch_status, output_result_path, output_dir, stream_results=False, state=None,
+                           store=None, parse_workers=1, taxonomy=DEFAULT_TAXONOMY):
+    """
+    下载已结束任务的结果文件和错误文件，并处理结果
+
+    stream_results=True 时结果文件边下载边解析，只在本地保留 output_result_path + ".gz" 压缩副本。
+    流式解析本身不能断点续传：state 为 DownloadState 时开始前把任务标记为 streaming，
+    下次运行发现上次停在 streaming 则不再流式解析，改用可断点续传的下载（download_file_resumable）。
+    state 为 DownloadState 时：结果文件已完整下载且校验和一致则不再重复下载，
+    全部处理完成后将任务标记为 finished
+    """
+    status = batch_status.status
+    entry = state.get(batch_status.id) if state is not None else {}
+
+    if status == "completed":
+        print("  🎉 任务已完成，开始下载结果...")
+
+        # 确保输出目录存在
+        os.makedirs(os.path.dirname(output_result_path), exist_ok=True)
+
+        # 下载结果文件
+        copy_path = output_result_path + ".gz"
+        stream_interrupted = (entry.get("status") == "streaming"
+                              and entry.get("output_file_id") == batch_status.output_file_id)
+        if batch_status.output_file_id and stream_results and not stream_interrupted:
+            if state is not None:
+                state.update(batch_status.id, status="streaming", output_file_id=batch_status.output_file_id)
+            output_bytes, output_sha256 = stream_and_process_results(batch_status.output_file_id, output_dir,
+                                                                     copy_path, store, taxonomy)
+            if state is not None:
+                state.update(batch_status.id, output_bytes=output_bytes, output_sha256=output_sha256)
+            print(f"  ✅ 结果已流式解析，压缩副本保存至: {copy_path}")
+        elif batch_status.output_file_id:
+            if stream_interrupted:
+                print("  ⚠️  上次流式解析中断，改用可断点续传的下载")
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)  # 不完整的压缩副本
+            if (entry.get("status") == "downloaded"
+                    and entry.get("output_file_id") == batch_status.output_file_id
+                    and os.path.exists(output_result_path)
+                    and os.path.getsize(output_result_path) == entry.get("output_bytes")
+                    and file_sha256(output_result_path) == entry.get("output_sha256")):
+                print(f"  ♻️  结果文件已完整下载，跳过下载: {output_result_path}")
+            else:
+                if state is not None:
+                    state.update(batch_status.id, status="downloading", output_file_id=batch_status.output_file_id)
+                output_bytes, output_sha256 = download_file_resumable(batch_status.output_file_id,
+                                                                      output_result_path)
+                if state is not None:
+                    state.update(batch_status.id, status="downloaded", output_bytes=output_bytes,
+                                 output_sha256=output_sha256)
+                print(f"  ✅ 结果已下载至: {output_result_path}")
+
+            # 处理结果
+            process_results(output_result_path, output_dir, store, parse_workers, taxonomy)
+        else:
+            print("  ⚠️  无输出文件ID")
+
+        # 下载错误信息（如果有）
+        download_error_file(batch_status, output_dir, state)
+
+        if state is not None:
+            state.update(batch_status.id, status="finished", batch_status=status)
+        return True
+
+    elif status in ["failed", "expired", "cancelled"]:
+        print(f"  ❌ 任务异常终止: {status}")
+
+        # 即使任务失败，也尝试下载错误信息
+        download_error_file(batch_status, output_dir, state)
+
+        if state is not None:
+            state.update(batch_status.id, status="finished", batch_status=status)
+        return True
+
+    return True
+
+
+def poll_batch_task(task_id, output_result_path, output_dir, stream_results=False, state=None, store=None,
+                    parse_workers=1, taxonomy=DEFAULT_TAXONOMY):
+    """
+    查询一次任务状态；任务已结束时立即下载并处理结果。返回任务状态
+    """
+    batch_status = get_client().batches.retrieve(task_id)
+    status = batch_status.status
+    if status not in ACTIVE_STATUSES:
+        download_batch_outputs(batch_status, output_result_path, output_dir, stream_results, state, store,
+                               parse_workers, taxonomy)
+    return status
+
+
+def watch_and_download_results(task_id_file, output_base_dir="batch_results", max_workers=4,
+                               initial_interval=30.0, max_interval=600.0, backoff=2.0, max_errors=5,
+                               stream_results=False, store_backend="jsonl", parse_workers=1,
+                               taxonomy=DEFAULT_TAXONOMY, response_cache=None, rule_results_dir=None,
+                               dedupe_index=None):
+    """
+    非交互地持续监控所有任务并下载结果
+
+    所有任务并发轮询，每个任务的轮询间隔按 backoff 指数增长（上限 max_interval）并加入随机抖动；
+    任务一结束就在工作线程中下载并处理结果，其余任务的轮询不受影响；全部任务结束后返回。
+    连续查询出错 max_errors 次的任务记为 "error" 并停止轮询。
+    下载状态文件中已标记 finished 的任务不再轮询，中断后重新运行只处理剩余任务。
+    """
+    taxonomy = get_taxonomy(taxonomy)
+    # 读取所有任务ID（使用响应缓存、规则分类或公式去重时即使没有任务，也要写入已有的结果）
+    task_ids = read_task_ids(task_id_file)
+    if not task_ids and not response_cache and not rule_results_dir and not dedupe_index:
+        return {}
+
+    print(f"📋 找到 {len(task_ids)} 个任务ID，开始持续监控（并发数 {max_workers}）")
+
+    state = DownloadState(output_base_dir)
+    final_status = {}
+    for task_id in task_ids:
+        if state.is_finished(task_id):
+            final_status[task_id] = state.get(task_id).get("batch_status", "completed")
+    if final_status:
+        print(f"⏭️  {len(final_status)} 个任务已下载并处理完毕，跳过")
+
+    # 轮询计划: (下次轮询时间, 任务序号, 任务ID, 当前间隔, 连续出错次数)
+    now = time.monotonic()
+    schedule = [(now, i, task_id, initial_interval, 0) for i, task_id in enumerate(task_ids, 1)
+                if task_id not in final_status]
+    heapq.heapify(schedule)
+    running = {}
+
+    with open_download_store(output_base_dir, store_backend, taxonomy, response_cache, rule_results_dir,
+                             dedupe_index) as store, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while schedule or running:
+            # 提交所有已到期的轮询
+            while schedule and schedule[0][0] <= time.monotonic():
+                _, i, task_id, interval, errors = heapq.heappop(schedule)
+                task_output_dir = batch_output_dir(output_base_dir, task_id)
+                os.makedirs(task_output_dir, exist_ok=True)
+                output_result_file = os.path.join(task_output_dir, "batch_output.jsonl")
+                future = executor.submit(poll_batch_task, task_id, output_result_file, task_output_dir,
+                                         stream_results, state, store, parse_workers, taxonomy)
+                running[future] = (i, task_id, interval, errors)
+
+            timeout = max(0.0, schedule[0][0] - time.monotonic()) if schedule else None
+            if not running:
+                time.sleep(timeout)
+                continue
+
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, task_id, interval, errors = running.pop(future)
+                try:
+                    status = future.result()
+                    errors = 0
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ [task_{i}] 查询或下载出错 ({errors}/{max_errors}): {e}")
+                    if errors >= max_errors:
+                        final_status[task_id] = "error"
+                        continue
+                    status = None
+
+                if status is not None and status not in ACTIVE_STATUSES:
+                    final_status[task_id] = status
+                    print(f"🏁 [task_{i}] {task_id} 已结束: {status} ({len(final_status)}/{len(task_ids)})")
+                    continue
+
+                # 指数退避 + 随机抖动，避免所有任务同时轮询
+                delay = interval * random.uniform(0.5, 1.5)
+                if status is not None:
+                    print(f"⏳ [task_{i}] {task_id}: {status}，{delay:.0f} 秒后再次检查")
+                heapq.heappush(schedule, (time.monotonic() + delay, i, task_id,
+                                          min(interval * backoff, max_interval), errors))
+
+    print(f"\n📊 任务状态汇总:")
+    for status in sorted(set(final_status.values())):
+        print(f"  {status}: {sum(1 for s in final_status.values() if s == status)}")
+
+    return final_status
+
+
+def parse_packed_custom_id(custom_id):
+    """
+    解析打包请求的 custom_id（pack-{序号}-{序列ID}_{序列ID}_...，可带分类方案命名空间前缀），
+    返回其中的序列ID列表；普通请求返回 None
+    """
+    _, custom_id = split_custom_id_namespace(custom_id)
+    if not custom_id.startswith("pack-"):
+        return None
+    parts = custom_id.split("-", 2)
+    if len(parts) < 3 or not parts[2]:
+        return []
+    return parts[2].split("_")
+
+
+def custom_id_sequence_ids(custom_id):
+    """custom_id 对应的序列ID列表：打包请求见 parse_packed_custom_id，普通请求为 request-{序号}-{序列ID}"""
+    packed_ids = parse_packed_custom_id(custom_id)
+    if packed_ids is not None:
+        return packed_ids
+    _, custom_id = split_custom_id_namespace(custom_id)
+    parts = custom_id.split("-", 2)
+    return [parts[2]] if len(parts) == 3 else []
+
+
+def iter_lines_from_chunks(chunks):
+    """
+    增量切分字节块为文本行：每收到一块就产出其中已完整的行，不缓冲整个文件
+    """
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+def digest_chunks(chunks, totals):
+    """边转发字节块边累计字节数（totals["bytes"]）和 sha256（totals["sha256"]）"""
+    for chunk in chunks:
+        totals["bytes"] += len(chunk)
+        totals["sha256"].update(chunk)
+        yield chunk
+
+
+def tee_chunks(chunks, copy_path):
+    """边转发字节块边写入 gzip 压缩副本"""
+    with gzip.open(copy_path, "wb") as f_copy:
+        for chunk in chunks:
+            f_copy.write(chunk)
+            yield chunk
+
+
+@contextlib.contextmanager
+def open_file_response(file_id, headers=None):
+    """
+    以流式响应打开远程文件内容：请求带上 STREAM_RESPONSE_HEADERS，响应体在迭代
+    iter_bytes() 时才逐块接收，不会先整体读入内存；退出时关闭连接
+    """
+    client = get_client()
+    response = client.files.content(file_id, extra_headers={**STREAM_RESPONSE_HEADERS, **(headers or {})})
+    try:
+        yield response
+    finally:
+        close = getattr(response, "close", None)
+        if close is not None:
+            close()
+
+
+def response_status_code(response):
+    """流式响应的 HTTP 状态码（SDK 的 APIResponse 直接提供，其他客户端挂在 .response 上）"""
+    status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(response, "response", None), "status_code", None)
+    return status_code
+
+
+@contextlib.contextmanager
+def open_file_chunks(file_id, chunk_size=1024 * 1024):
+    """以字节块迭代器的形式流式打开远程文件内容，见 open_file_response"""
+    with open_file_response(file_id) as response:
+        yield response.iter_bytes(chunk_size)
+
+
+def stream_and_process_results(file_id, output_dir, copy_path=None, store=None, taxonomy=DEFAULT_TAXONOMY):
+    """
+    流式下载结果文件并同时解析：HTTP 响应按块切分成行后直接交给 process_result_lines，
+    收到第一块数据即开始解析；copy_path 不为空时同时保存一份 gzip 压缩副本。
+    返回结果文件的 (字节数, sha256)；中途出错时不能从断点继续，见 download_batch_outputs
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    totals = {"bytes": 0, "sha256": hashlib.sha256()}
+    with open_file_chunks(file_id) as chunks:
+        chunks = digest_chunks(chunks, totals)
+        if copy_path:
+            chunks = tee_chunks(chunks, copy_path)
+        process_result_lines(iter_lines_from_chunks(chunks), output_dir, store, taxonomy=taxonomy)
+    return totals["bytes"], totals["sha256"].hexdigest()
+
+
+def parse_result_line(line, taxonomy):
+    """
+    解析结果文件中的一行（外层响应 + 模型返回的 JSON 内容），公式类型按 taxonomy（Taxonomy 对象）归并
+
+    返回 (序列结果列表, 失败的序列数, 警告列表)；序列结果为 (序列ID或None, 结果, 公式类型列表)，
+    警告为 (类型, 详情)，由调用方加上行号后打印
+    """
+    try:
+        # 解析响应行
+        response_data = loads(line.strip())
+
+        # 打包请求的 custom_id 中记录了其包含的所有序列ID
+        packed_ids = parse_packed_custom_id(response_data.get('custom_id', ''))
+        request_sequences = len(packed_ids) if packed_ids is not None else 1
+
+        # 提取响应状态和主体
+        response_status = response_data.get('status_code', 200)
+        if response_status != 200:
+            return [], request_sequences, [("status", response_status)]
+
+        # 提取模型响应
+        response_body = response_data.get('response', {}).get('body', {})
+        choices = response_body.get('choices', [])
+        if not choices:
+            return [], 0, []
+
+        message_content = choices[0].get('message', {}).get('content', '{}')
+
+        # 解析模型返回的JSON内容
+        try:
+            result = decode_classification(message_content, packed=packed_ids is not None)
+        except ValueError:
+            return [], request_sequences, [("json", None)]
+
+        failed = 0
+        warnings = []
+        # 打包请求的结果在 "results" 列表中，逐个拆回单个序列
+        if packed_ids is not None:
+            sequence_results = [r for r in result.get('results', []) if isinstance(r, dict)]
+            returned_ids = {r.get('sequence_id') for r in sequence_results}
+            missing_ids = [sid for sid in packed_ids if sid not in returned_ids]
+            if missing_ids:
+                failed = len(missing_ids)
+                warnings.append(("missing", missing_ids))
+        else:
+            sequence_results = [result]
+
+        parsed = []
+        for result in sequence_results:
+            # 统计公式类型
+            formula_types = [taxonomy.normalize_type(formula.get('formula_type', taxonomy.default_type))
+                             for formula in result.get('extracted_formulas', [])]
+            parsed.append((result.get('sequence_id'), result, formula_types))
+        return parsed, failed, warnings
+
+    except Exception as e:
+        return [], 1, [("error", e)]
+
+
+def format_line_warning(kind, line_num, detail):
+    """把 parse_result_line 返回的警告格式化为带行号的提示"""
+    if kind == "status":
+        return f"  ⚠️ 第 {line_num} 行请求失败，状态码: {detail}"
+    if kind == "json":
+        return f"  ❌ 第 {line_num} 行: 无法解析模型返回的JSON内容"
+    if kind == "missing":
+        return f"  ⚠️ 第 {line_num} 行缺少 {len(detail)} 个序列的结果: {', '.join(detail)}"
+    return f"  ❌ 处理第 {line_num} 行时出错: {detail}"
+
+
+def parse_result_chunk(lines, taxonomy):
+    """
+    解析一批结果行，返回该批的汇总: 行数、序列结果 (批内行号, 序列ID, 结果)、
+    失败序列数、警告 (批内行号, 类型, 详情)、公式类型计数
+    """
+    chunk = {"lines": 0, "results": [], "failed": 0, "warnings": [], "type_counts": {}, "formulas": 0}
+    for line_num, line in enumerate(lines, 1):
+        chunk["lines"] = line_num
+        parsed, failed, warnings = parse_result_line(line, taxonomy)
+        chunk["failed"] += failed
+        for kind, detail in warnings:
+            chunk["warnings"].append((line_num, kind, str(detail) if kind == "error" else detail))
+        for sequence_id, result, formula_types in parsed:
+            chunk["results"].append((line_num, sequence_id, result))
+            for formula_type in formula_types:
+                chunk["type_counts"][formula_type] = chunk["type_counts"].get(formula_type, 0) + 1
+            chunk["formulas"] += len(formula_types)
+    return chunk
+
+
+def parse_result_range(task):
+    """
+    进程池任务: 解析结果文件中 [start, end) 字节范围内的行（范围边界已对齐到行首）
+    """
+    path, start, end, taxonomy = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    return parse_result_chunk((line.decode('utf-8') for line in lines), taxonomy)
+
+
+# 小于该大小的结果文件总是串行解析：进程间传回结果的开销超过并行解析省下的时间
+PARALLEL_PARSE_MIN_BYTES = 256 * 1024 * 1024
+
+
+def split_file_ranges(path, num_chunks):
+    """
+    把文件按字节大致均分为 num_chunks 段，返回 [(start, end)]；每段起点都对齐到换行符之后
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, num_chunks):
+            position = max(size * i // num_chunks, boundaries[-1])
+            f.seek(position)
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def iter_line_batches(lines, batch_size):
+    """把行迭代器按 batch_size 分批"""
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def process_results(result_file_path, output_dir, store=None, workers=1, taxonomy=DEFAULT_TAXONOMY,
+                    min_parallel_bytes=PARALLEL_PARSE_MIN_BYTES):
+    """
+    处理已下载到本地的结果文件
+
+    workers > 1 且文件不小于 min_parallel_bytes 时把文件按字节范围切成多段，在进程池中并行解析
+    （进程数不超过 CPU 核数），合并后的统计与串行处理完全一致。
+    解析出的结果要 pickle 传回主进程并在主进程写入存储，这部分开销与串行解析本身相当，
+    只有多核且文件很大时并行才可能更快，用 bench_parsing.py 在目标机器上实测后再开启
+    """
+    if not os.path.exists(result_file_path):
+        print(f"  ❌ 结果文件不存在: {result_file_path}")
+        return
+
+    taxonomy = get_taxonomy(taxonomy)
+    workers = min(workers, os.cpu_count() or 1)
+    if workers > 1 and os.path.getsize(result_file_path) >= min_parallel_bytes:
+        tasks = [(result_file_path, start, end, taxonomy)
+                 for start, end in split_file_ranges(result_file_path, workers * 4)]
+        with Pool(workers) as pool:
+            collect_result_chunks(pool.imap(parse_result_range, tasks), output_dir, store, taxonomy)
+    else:
+        with open(result_file_path, 'r', encoding='utf-8') as f:
+            process_result_lines(f, output_dir, store, taxonomy=taxonomy)
+
+
+def process_result_lines(lines, output_dir, store=None, batch_size=1000, taxonomy=DEFAULT_TAXONOMY):
+    """
+    处理结果文件 - 按 taxonomy 指定的分类方案统计公式类型
+
+    lines 为结果 JSONL 的逐行迭代器（文件对象或流式下载的行），每 batch_size 行解析一批。
+    每个序列的结果批量写入 store（按 task 记录来自哪个任务目录）；store 为空时在 output_dir 下打开一个 JSONL 结果存储
+    """
+    taxonomy = get_taxonomy(taxonomy)
+    chunks = (parse_result_chunk(batch, taxonomy) for batch in iter_line_batches(lines, batch_size))
+    collect_result_chunks(chunks, output_dir, store, taxonomy)
+
+
+def type_distribution(taxonomy, type_counts, total):
+    """
+    返回用于打印的 [(显示名称, 数量, 百分比)]：封闭分类按类型定义的顺序，开放分类按数量从多到少
+    """
+    if taxonomy.closed:
+        items = [(taxonomy.category_names[t], type_counts.get(t, 0)) for t in taxonomy.formula_types]
+    else:
+        items = sorted(type_counts.items(), key=lambda x: x[1], reverse=True)
+    return [(name, count, round(count / total * 100, 2)) for name, count in items]
+
+
+def collect_result_chunks(chunks, output_dir, store=None, taxonomy=DEFAULT_TAXONOMY):
+    """
+    按顺序合并各批的解析结果: 写入结果存储、累加统计，并保存 formula_type_statistics.json
+    """
+    taxonomy = get_taxonomy(taxonomy)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    own_store = store is None
+    if own_store:
+        store = open_result_store(output_dir, "jsonl")
+    task = os.path.basename(os.path.normpath(output_dir))
+
+    formula_type_counts = taxonomy.empty_counts()
+    total_formulas = 0
+    processed_sequences = 0
+    failed_sequences = 0
+    line_base = 0
+
+    for chunk in chunks:
+        for line_num, kind, detail in chunk["warnings"]:
+            print(format_line_warning(kind, line_base + line_num, detail))
+
+        for line_num, sequence_id, result in chunk["results"]:
+            # 保存单个序列的结果；缺少序列ID的结果按任务和行号命名，多个任务写入同一存储时不会互相覆盖
+            store.add(sequence_id or f'unknown_{task}_{line_base + line_num}', result, task)
+
+        for formula_type, count in chunk["type_counts"].items():
+            formula_type_counts[formula_type] = formula_type_counts.get(formula_type, 0) + count
+        total_formulas += chunk["formulas"]
+        processed_sequences += len(chunk["results"])
+        failed_sequences += chunk["failed"]
+        line_base += chunk["lines"]
+
+        if chunk["results"]:
+            print(f"  📊 已处理 {processed_sequences} 个序列，{total_formulas} 个公式")
+
+    if own_store:
+        store.close()
+    else:
+        store.flush()
+
+    # 保存统计信息
+    stats_file = os.path.join(output_dir, "formula_type_statistics.json")
+    with open(stats_file, 'w', encoding='utf-8') as f:
+        stats_data = {
+            "total_sequences": processed_sequences + failed_sequences,
+            "successful_sequences": processed_sequences,
+            "failed_sequences": failed_sequences,
+            "total_formulas": total_formulas,
+            "type_counts": formula_type_counts
+        }
+        if taxonomy.closed:
+            stats_data["type_categories"] = taxonomy.category_names
+
+        # 计算百分比（避免除以零）
+        if total_formulas > 0:
+            stats_data["type_percentages"] = {
+                k: round(v / total_formulas * 100, 2) for k, v in formula_type_counts.items()
+            }
+
+        json.dump(stats_data, f, indent=2, ensure_ascii=False)
+
+    print(f"  📊 处理完成! 成功处理 {processed_sequences} 个序列，失败 {failed_sequences} 个序列")
+    print(f"  📊 总共提取 {total_formulas} 个公式")
+    print(f"  📈 统计信息已保存至: {stats_file}")
+
+    # 打印简要统计
+    if total_formulas > 0:
+        label = f" ({taxonomy.label})" if taxonomy.label else ""
+        print(f"\n  📊 公式类型分布{label}:")
+        for name, count, percentage in type_distribution(taxonomy, formula_type_counts, total_formulas):
+            print(f"    {name}: {count} ({percentage}%)")
+
+
+def check_batch_status_only(task_id_file):
+    """
+    仅检查任务状态，不下载结果
+    """
+    # 读取所有任务ID
+    task_ids = read_task_ids(task_id_file)
+    if not task_ids:
+        return
+
+    print(f"📋 找到 {len(task_ids)} 个任务ID")
+
+    completed = 0
+    in_progress = 0
+    failed = 0
+
+    for i, task_id in enumerate(task_ids, 1):
+        print(f"\n🔍 检查任务 {i}/{len(task_ids)}: {task_id}")
+
+        try:
+            batch_status = get_client().batches.retrieve(task_id)
+            status = batch_status.status
+            print(f"  📊 任务状态: {status}")
+
+            if status == "completed":
+                completed += 1
+            elif status in ["validating", "in_progress", "finalizing"]:
+                in_progress += 1
+            else:  # failed, expired, cancelled
+                failed += 1
+
+        except Exception as e:
+            print(f"  ❌ 检查任务状态时出错: {e}")
+            failed += 1
+
+    print(f"\n📊 任务状态汇总:")
+    print(f"  ✅ 已完成: {completed}")
+    print(f"  ⏳ 处理中: {in_progress}")
+    print(f"  ❌ 失败: {failed}")
+
+    if in_progress == 0 and completed > 0:
+        print("\n🎉 所有任务已完成，可以运行下载脚本获取结果!")
+    elif in_progress > 0:
+        print(f"\n⏳ 仍有 {in_progress} 个任务在处理中，请稍后再检查")
+
+
+def generate_summary_report(output_base_dir="batch_results", store_backend="jsonl", taxonomy=DEFAULT_TAXONOMY):
+    """
+    生成所有任务的汇总报告（直接查询结果存储）
+    """
+    if not os.path.exists(output_base_dir):
+        print(f"❌ 结果目录不存在: {output_base_dir}")
+        return
+
+    taxonomy = get_taxonomy(taxonomy)
+
+    with open_result_store(output_base_dir, store_backend) as store:
+        stats = store.summary()
+
+    print(f"📊 生成汇总报告，结果存储中共有 {stats['total_tasks']} 个任务的 {stats['total_sequences']} 个序列")
+
+    # 封闭分类中不在类型列表中的类型归为 fallback_type
+    formula_type_counts_all = taxonomy.empty_counts()
+    for formula_type, count in stats["type_counts"].items():
+        category = taxonomy.normalize_type(formula_type)
+        formula_type_counts_all[category] = formula_type_counts_all.get(category, 0) + count
+    total_formulas_all = stats["total_formulas"]
+
+    # 生成汇总报告
+    summary_file = os.path.join(output_base_dir, "summary_report.json")
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        summary_data = {
+            "total_tasks": stats["total_tasks"],
+            "total_sequences": stats["total_sequences"],
+            "total_formulas": total_formulas_all,
+            "formula_type_counts": formula_type_counts_all,
+            "formula_categories": taxonomy.category_names
+        }
+
+        # 计算百分比 - 修复版本
+        if total_formulas_all > 0:
+            summary_data["formula_type_percentages"] = {}
+            for category, count in formula_type_counts_all.items():
+                percentage = round(count / total_formulas_all * 100, 2)
+                summary_data["formula_type_percentages"][category] = percentage
+        else:
+            summary_data["formula_type_percentages"] = {category: 0 for category in formula_type_counts_all}
+
+        json.dump(summary_data, f, indent=2, ensure_ascii=False)
+
+    print(f"📈 汇总报告已保存至: {summary_file}")
+
+    # 打印汇总统计
+    if total_formulas_all > 0:
+        label = f" ({taxonomy.label})" if taxonomy.label else ""
+        print(f"\n📊 总体公式类型分布{label}:")
+        for name, count, percentage in type_distribution(taxonomy, formula_type_counts_all, total_formulas_all):
+            print(f"    {name}: {count} ({percentage}%)")
+    else:
+        print("⚠️  没有找到任何公式数据")
+
+
+def lookup_sequence_result(output_base_dir, sequence_id, store_backend="jsonl"):
+    """
+    按序列ID从结果存储中查询分类结果并打印
+    """
+    with open_result_store(output_base_dir, store_backend) as store:
+        result = store.get(sequence_id)
+    if result is None:
+        print(f"❌ 结果存储中没有序列 {sequence_id}")
+    else:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    return result
+
+
+def run_download_cli(task_id_file, output_base_dir, taxonomy=DEFAULT_TAXONOMY, response_cache=None,
+                     rule_results_dir=None, dedupe_index=None):
+    """
+    下载脚本的命令行入口：解析参数后执行非交互模式（--lookup / --watch）或交互菜单
+    """
+    taxonomy = get_taxonomy(taxonomy)
+
+    parser = argparse.ArgumentParser(description="智谱AI Batch任务结果下载工具")
+    parser.add_argument("--watch", action="store_true",
+                        help="非交互模式：持续轮询所有任务，完成即下载，全部结束后退出")
+    parser.add_argument("--stream", action="store_true",
+                        help="结果文件边下载边解析，本地只保留 gzip 压缩副本"
+                             "（不能断点续传，中断后的下一次运行改用普通下载）")
+    parser.add_argument("--store", choices=RESULT_BACKENDS, default="jsonl",
+                        help="分类结果存储后端（parquet 需要 pyarrow）")
+    parser.add_argument("--lookup", metavar="SEQUENCE_ID", help="从结果存储中查询指定序列的分类结果")
+    parser.add_argument("--parse-workers", type=int, default=1,
+                        help="并行解析结果文件的进程数（1 为串行；不超过 CPU 核数，小于 256MB 的文件和 --stream 模式下不生效）")
+    parser.add_argument("--cache", metavar="PATH", default=response_cache,
+                        help="生成请求时使用的响应缓存数据库：新结果写入缓存，命中缓存的序列从缓存写入结果")
+    parser.add_argument("--rules", metavar="DIR", default=rule_results_dir,
+                        help="生成请求时的规则分类结果目录：与模型结果合并后写入结果存储")
+    parser.add_argument("--dedupe", metavar="PATH", default=dedupe_index,
+                        help="生成请求时的公式去重索引：把唯一公式的分类结果展开到所有重复的序列")
+    args = parser.parse_args()
+
+    if args.lookup:
+        lookup_sequence_result(output_base_dir, args.lookup, args.store)
+        return
+
+    if args.watch:
+        watch_and_download_results(task_id_file, output_base_dir, stream_results=args.stream,
+                                   store_backend=args.store, parse_workers=args.parse_workers,
+                                   taxonomy=taxonomy, response_cache=args.cache, rule_results_dir=args.rules,
+                                   dedupe_index=args.dedupe)
+        return
+
+    if taxonomy.label:
+        print(f"🔍 智谱AI Batch任务结果下载工具 ({taxonomy.label}公式分类)")
+        print("=" * 60)
+    else:
+        print("🔍 智谱AI Batch任务结果下载工具")
+        print("=" * 50)
+
+    # 提供选项
+    print("\n请选择操作:")
+    print("1. 仅检查任务状态")
+    print("2. 检查并下载结果")
+    print("3. 生成汇总报告")
+
+    choice = input("请输入选项 (1, 2 或 3): ").strip()
+
+    if choice == "1":
+        print("\n" + "=" * 50)
+        print("仅检查任务状态")
+        print("=" * 50)
+        check_batch_status_only(task_id_file)
+    elif choice == "2":
+        print("\n" + "=" * 50)
+        print("检查任务状态并下载结果")
+        print("=" * 50)
+        check_and_download_results(task_id_file, output_base_dir, stream_results=args.stream,
+                                   store_backend=args.store, parse_workers=args.parse_workers,
+                                   taxonomy=taxonomy, response_cache=args.cache, rule_results_dir=args.rules,
+                                   dedupe_index=args.dedupe)
+    elif choice == "3":
+        print("\n" + "=" * 50)
+        print("生成汇总报告")
+        print("=" * 50)
+        generate_summary_report(output_base_dir, args.store, taxonomy=taxonomy)
+    else:
+        print("❌ 无效选项，请输入 1, 2 或 3")
@@ -0,0 +1,285 @@
+"""
+本地模拟的智谱AI文件 / Batch 接口，用于离线测试提交、轮询和下载流程。
+
+启动后把客户端指向本服务即可，例如:
+    python fake_zhipuai_server.py --port 8765 --delay 5
+    ZhipuAI(api_key="test", base_url="http://127.0.0.1:8765/api/paas/v4")
+
+支持的接口（路径前缀任意）:
+    POST /files                  上传文件（multipart/form-data）
+    GET  /files/{id}/content     下载文件内容（支持 Range 断点续传）
+    POST /batches                创建 Batch 任务
+    GET  /batches/{id}           查询 Batch 任务状态
+任务在创建 delay 秒后变为 completed，并为每个请求生成一条伪造的分类结果。
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILES = {}  # file_id -> {"filename", "purpose", "content"(bytes), "created_at"}
+BATCHES = {}  # batch_id -> batch 信息
+LOCK = threading.Lock()
+CONFIG = {"delay": 0.0, "error_rate": 0.0, "pause_after": None, "cut_after": None}
+# cut_after 不为空时，下一次文件下载只发送前 cut_after 字节就断开连接（仅生效一次），
+# 用于模拟下载中途断线
+# pause_after 不为空时，文件内容只先发送前 pause_after 字节，等 BODY_RESUMED 被设置
+# （最多 BODY_PAUSE_TIMEOUT 秒）后再发送剩余部分；超时记录在 CONFIG["pause_timed_out"]
+BODY_RESUMED = threading.Event()
+BODY_PAUSE_TIMEOUT = 5.0
+
+
+def new_id(prefix):
+    return f"{prefix}-{int(time.time() * 1000)}-{random.randint(100000, 999999)}"
+
+
+def parse_multipart(body, content_type):
+    """简单的 multipart/form-data 解析，返回 {字段名: (文件名, 内容bytes)}"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        return {}
+    boundary = b"--" + match.group(1).encode()
+
+    fields = {}
+    for part in body.split(boundary):
+        if b"\r\n\r\n" not in part:
+            continue
+        headers, content = part.split(b"\r\n\r\n", 1)
+        if content.endswith(b"\r\n"):
+            content = content[:-2]
+        header_text = headers.decode("utf-8", errors="ignore")
+        name = re.search(r'name="([^"]*)"', header_text)
+        filename = re.search(r'filename="([^"]*)"', header_text)
+        if name:
+            fields[name.group(1)] = (filename.group(1) if filename else None, content)
+    return fields
+
+
+def fake_classify(request):
+    """根据请求中的用户消息生成伪造的模型输出"""
+    user_prompt = request["body"]["messages"][-1]["content"]
+    results = []
+    for block in user_prompt.split("\n\n"):
+        lines = block.split("\n")
+        if not lines or not lines[0].startswith("Sequence ID: "):
+            continue
+        sequence_id = lines[0][len("Sequence ID: "):].strip()
+        formulas = []
+        for line in lines[2:]:
+            text = line.split(". ", 1)[1] if ". " in line else line
+            formula_type = "generating_function" if "G.f." in text else (
+                "recurrence" if "a(n-1)" in text else "other")
+            formulas.append({"formula_text": text, "formula_type": formula_type,
+                             "formula_latex": "", "confidence": 0.9})
+        results.append({"sequence_id": sequence_id, "extracted_formulas": formulas})
+
+    # custom_id 可能带有分类方案命名空间前缀，如 "11:pack-..."
+    if request["custom_id"].split(":", 1)[-1].startswith("pack-"):
+        return {"results": results}
+    return results[0] if results else {}
+
+
+def complete_batch(batch):
+    """生成 Batch 的输出文件和错误文件"""
+    input_content = FILES[batch["input_file_id"]]["content"].decode("utf-8")
+    output_lines = []
+    error_lines = []
+
+    for line in input_content.splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if random.random() < CONFIG["error_rate"]:
+            error_lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 500,
+                             "body": {"error": {"code": "500", "message": "模拟的服务端错误"}}}
+            }, ensure_ascii=False))
+            continue
+
+        content = json.dumps(fake_classify(request), ensure_ascii=False)
+        output_lines.append(json.dumps({
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200,
+                         "body": {"choices": [{"index": 0, "finish_reason": "stop",
+                                               "message": {"role": "assistant", "content": content}}]}}
+        }, ensure_ascii=False))
+
+    output_id = new_id("file")
+    FILES[output_id] = {"filename": "output.jsonl", "purpose": "batch",
+                        "content": ("\n".join(output_lines) + "\n").encode("utf-8"),
+                        "created_at": int(time.time())}
+    batch["output_file_id"] = output_id
+
+    if error_lines:
+        error_id = new_id("file")
+        FILES[error_id] = {"filename": "errors.jsonl", "purpose": "batch",
+                           "content": ("\n".join(error_lines) + "\n").encode("utf-8"),
+                           "created_at": int(time.time())}
+        batch["error_file_id"] = error_id
+
+    total = len(output_lines) + len(error_lines)
+    batch["request_counts"] = {"total": total, "completed": len(output_lines), "failed": len(error_lines)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+class FakeZhipuAIHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+
+        if re.search(r"/files/?$", path):
+            fields = parse_multipart(self._read_body(), self.headers.get("Content-Type", ""))
+            if "file" not in fields:
+                return self._send_json({"error": {"message": "缺少 file 字段"}}, status=400)
+            filename, content = fields["file"]
+            purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+            file_id = new_id("file")
+            with LOCK:
+                FILES[file_id] = {"filename": filename, "purpose": purpose, "content": content,
+                                  "created_at": int(time.time())}
+            return self._send_json({"id": file_id, "object": "file", "bytes": len(content),
+                                    "created_at": FILES[file_id]["created_at"],
+                                    "filename": filename, "purpose": purpose, "status": "processed"})
+
+        if re.search(r"/batches/?$", path):
+            data = json.loads(self._read_body() or b"{}")
+            if data.get("input_file_id") not in FILES:
+                return self._send_json({"error": {"message": "input_file_id 不存在"}}, status=400)
+            batch_id = new_id("batch")
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": data.get("endpoint"),
+                "input_file_id": data["input_file_id"],
+                "completion_window": data.get("completion_window", "24h"),
+                "status": "validating",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": int(time.time()),
+                "completed_at": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "metadata": data.get("metadata"),
+            }
+            with LOCK:
+                BATCHES[batch_id] = batch
+            return self._send_json(batch)
+
+        self._send_json({"error": {"message": f"未知接口: {path}"}}, status=404)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+
+        match = re.search(r"/files/([^/]+)/content/?$", path)
+        if match:
+            entry = FILES.get(match.group(1))
+            if entry is None:
+                return self._send_json({"error": {"message": "文件不存在"}}, status=404)
+            content = entry["content"]
+            total = len(content)
+            status = 200
+            # 支持 "Range: bytes=起始-[结束]"，用于断点续传
+            range_match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+            if range_match:
+                start = int(range_match.group(1))
+                end = int(range_match.group(2)) if range_match.group(2) else total - 1
+                if start >= total:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{total}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                content = content[start:min(end, total - 1) + 1]
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{start + len(content) - 1}/{total}")
+            self.end_headers()
+            with LOCK:
+                cut_after, CONFIG["cut_after"] = CONFIG["cut_after"], None
+            if cut_after is not None and cut_after < len(content):
+                self.wfile.write(content[:cut_after])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            pause_after = CONFIG["pause_after"]
+            if pause_after is not None and pause_after < len(content):
+                self.wfile.write(content[:pause_after])
+                self.wfile.flush()
+                CONFIG["pause_timed_out"] = not BODY_RESUMED.wait(BODY_PAUSE_TIMEOUT)
+                content = content[pause_after:]
+            self.wfile.write(content)
+            return
+
+        match = re.search(r"/batches/([^/]+)/?$", path)
+        if match:
+            with LOCK:
+                batch = BATCHES.get(match.group(1))
+                if batch is None:
+                    return self._send_json({"error": {"message": "任务不存在"}}, status=404)
+                if batch["status"] != "completed":
+                    if time.time() - batch["created_at"] >= CONFIG["delay"]:
+                        complete_batch(batch)
+                    else:
+                        batch["status"] = "in_progress"
+            return self._send_json(batch)
+
+        self._send_json({"error": {"message": f"未知接口: {path}"}}, status=404)
+
+    def log_message(self, format, *args):
+        pass  # 不输出每个请求的访问日志
+
+
+def start_server(host="127.0.0.1", port=0, delay=0.0, error_rate=0.0):
+    """
+    在后台线程启动模拟服务，返回 (server, base_url)；port=0 时自动选择空闲端口
+    """
+    CONFIG["delay"] = delay
+    CONFIG["error_rate"] = error_rate
+    CONFIG["pause_after"] = None
+    CONFIG["cut_after"] = None
+    CONFIG.pop("pause_timed_out", None)
+    BODY_RESUMED.clear()
+    server = ThreadingHTTPServer((host, port), FakeZhipuAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/api/paas/v4"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟的智谱AI文件/Batch接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="任务创建后多少秒变为 completed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机失败的请求比例（写入错误文件）")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, args.delay, args.error_rate)
+    print(f"🧪 模拟服务已启动: {base_url}")
+    print("  💡 使用 ZhipuAI(api_key=\"test\", base_url=...) 或设置环境变量 ZHIPUAI_BASE_URL 指向该地址")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
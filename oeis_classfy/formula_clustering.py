@@ -0,0 +1,361 @@
+"""
+公式近似去重：MinHash/LSH 聚类，每个簇只把代表公式发给模型，标签传播给与代表足够相似的成员
+
+很多公式只差常数或下标，如 a(n) = 3*a(n-1) - a(n-2) 与 a(n) = 4*a(n-1) - a(n-2)。
+离线对 extract_F_lines 清洗后的语料聚类:
+    1. 公式按 normalize_formula 精确去重，每条唯一公式计算 MinHash 签名
+       （shingle 为 token 的 3-gram，另加把数字换成 "#" 之后的 3-gram，只差常数的公式共享这部分）
+    2. 签名分成 bands 段做 LSH，同一段完全相同的公式互为候选，估计相似度达到阈值的候选合并为一簇
+    3. 簇的代表为语料中最早出现的公式；重新计算成员与代表的精确 Jaccard 相似度，
+       低于阈值的成员不传播标签，仍单独发送
+
+签名使用单次哈希的 MinHash（one permutation hashing，空桶按旋转方式填充），每条公式只哈希一次 shingle，
+签名紧凑地保存在 array 中；LSH 逐段构建桶，新公式与桶中已有的成员逐一比较。
+每个桶最多保留 max_bucket_size 个成员，超大桶（大量公式在某一段签名相同）中之后的公式只与这些成员比较，
+这是召回率与耗时的折中；报告中按抽样的暴力比较估计召回率（--recall-sample）。
+
+聚类结果写入公式去重索引（FormulaDedupeIndex 的 clusters 表），生成请求和下载结果时传入同一个索引即可:
+    python -m oeis_classfy.formula_clustering oeis_onlyclean_json --index formula_dedupe.sqlite
+    python -m oeis_classfy.submit_pipeline oeis_onlyclean_json --dedupe formula_dedupe.sqlite
+
+报告对比不同阈值下节省的公式数与标签一致率（--labels 指定一份未使用近似去重的完整结果时按模型标签比较，
+否则以规则分类的形式 classify_formula_kind 作为近似标签）。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.formula_dedupe import FormulaDedupeIndex, normalize_formula
+from oeis_classfy.rule_classifier import classify_formula_kind
+from oeis_classfy.result_store import open_result_store, RESULT_BACKENDS
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 32  # 签名长度，必须是 2 的幂
+DEFAULT_BANDS = 8
+SHINGLE_SIZE = 3
+MAX_BUCKET_SIZE = 8  # LSH 每个桶最多保留的成员数
+DEFAULT_RECALL_SAMPLE = 100
+
+TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_MASK = 0xFFFFFFFF
+
+
+def formula_shingles(text, size=SHINGLE_SIZE):
+    """公式的 shingle 集合：原始 token 的 n-gram，加上数字换成 "#" 后的 n-gram"""
+    tokens = TOKEN_RE.findall(text)
+    shape = ["#" if token.isdigit() else token for token in tokens]
+    shingles = set()
+    for prefix, seq in (("r", tokens), ("s", shape)):
+        if len(seq) <= size:
+            shingles.add(prefix + "\x1f".join(seq))
+            continue
+        for i in range(len(seq) - size + 1):
+            shingles.add(prefix + "\x1f".join(seq[i:i + size]))
+    return shingles
+
+
+def minhash_signature(text, num_perm=DEFAULT_NUM_PERM):
+    """
+    单次哈希的 MinHash 签名（num_perm 个 32 位整数）：
+    每个 shingle 哈希一次，高位决定桶、另一组混合位作为桶内的排序值，空桶取右侧最近的非空桶并加上偏移
+    """
+    shift = 32 - (num_perm.bit_length() - 1)
+    signature = [None] * num_perm
+    for shingle in formula_shingles(text):
+        h = zlib.crc32(shingle.encode("utf-8"))
+        bucket = ((h * 0x9E3779B1) & _MASK) >> shift
+        value = (h * 0x85EBCA77 + 0xC2B2AE3D) & _MASK
+        current = signature[bucket]
+        if current is None or value < current:
+            signature[bucket] = value
+
+    filled = [i for i, value in enumerate(signature) if value is not None]
+    if not filled:
+        return [0] * num_perm
+    if len(filled) < num_perm:
+        for i in range(num_perm):
+            if signature[i] is None:
+                j = next((j for j in filled if j > i), filled[0])
+                distance = (j - i) % num_perm
+                signature[i] = (signature[j] + distance * 0x9E3779B9) & _MASK
+    return signature
+
+
+def jaccard_similarity(text_a, text_b):
+    """两条公式 shingle 集合的精确 Jaccard 相似度"""
+    a, b = formula_shingles(text_a), formula_shingles(text_b)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def estimate_similarity(signatures, i, j, num_perm):
+    """两条公式签名相同位置的比例，即 Jaccard 相似度的估计"""
+    a = i * num_perm
+    b = j * num_perm
+    return sum(1 for x, y in zip(signatures[a:a + num_perm], signatures[b:b + num_perm]) if x == y) / num_perm
+
+
+class FormulaCorpus:
+    """
+    语料中的唯一公式（按 normalize_formula 规范化）：编号按第一次出现的顺序，与生成请求时的遍历顺序一致
+    """
+
+    def __init__(self):
+        self.ids = {}  # 规范化文本 -> 编号
+        self.texts = []
+        self.counts = array('I')  # 每条唯一公式在语料中出现的次数
+
+    def add(self, formula):
+        normalized = normalize_formula(formula)
+        formula_id = self.ids.get(normalized)
+        if formula_id is None:
+            formula_id = self.ids[normalized] = len(self.texts)
+            self.texts.append(normalized)
+            self.counts.append(0)
+        self.counts[formula_id] += 1
+        return formula_id
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def read_formula_corpus(input_dir, input_format="json"):
+    """读取 data_onlyclean_json.py 的输出，返回 FormulaCorpus"""
+    from oeis_classfy.submit_pipeline import read_json_files, read_jsonl_dataset
+
+    corpus = FormulaCorpus()
+    records = read_jsonl_dataset(input_dir) if input_format == "jsonl" else read_json_files(input_dir)
+    for record in records:
+        formulas = record.get('formulas')
+        if isinstance(formulas, list):
+            for formula in formulas:
+                corpus.add(formula)
+    return corpus
+
+
+def compute_signatures(texts, num_perm=DEFAULT_NUM_PERM):
+    """所有公式的签名依次拼接在一个 array('I') 中"""
+    signatures = array('I')
+    for text in texts:
+        signatures.extend(minhash_signature(text, num_perm))
+    return signatures
+
+
+def cluster_formulas(texts, signatures, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS,
+                     threshold=DEFAULT_THRESHOLD, max_bucket_size=MAX_BUCKET_SIZE):
+    """
+    LSH 聚类，返回 (representatives, similarities)：
+    representatives[i] 为公式 i 的代表编号（代表自身时为 i），similarities[i] 为与代表的精确相似度。
+    每个桶最多保留 max_bucket_size 个成员参与比较
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) 必须能被 bands ({bands}) 整除")
+    n = len(signatures) // num_perm
+    rows = num_perm // bands
+    parent = array('i', range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # 每次只保留一个段的桶: 段内签名 -> 桶中的成员（最多 max_bucket_size 个）
+    for band in range(bands):
+        buckets = {}
+        offset = band * rows
+        for i in range(n):
+            start = i * num_perm + offset
+            members = buckets.setdefault(signatures[start:start + rows].tobytes(), [])
+            for j in members:
+                root_a, root_b = find(j), find(i)
+                if root_a != root_b and estimate_similarity(signatures, j, i, num_perm) >= threshold:
+                    # 编号小的作为根，连通分量的根即最早出现的公式
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+            if len(members) < max_bucket_size:
+                members.append(i)
+
+    representatives = array('i', range(n))
+    similarities = array('f', [1.0]) * n
+    for i in range(n):
+        root = find(i)
+        if root != i:
+            similarity = jaccard_similarity(texts[root], texts[i])
+            if similarity >= threshold:
+                representatives[i] = root
+                similarities[i] = similarity
+    return representatives, similarities
+
+
+def sample_neighbors(texts, sample_size=DEFAULT_RECALL_SAMPLE, min_similarity=0.5, seed=0):
+    """
+    暴力比较抽样公式与所有公式的精确 Jaccard 相似度，返回 [(i, j, 相似度)]（只保留不低于 min_similarity 的对），
+    用于估计聚类的召回率
+    """
+    rng = random.Random(seed)
+    sample = rng.sample(range(len(texts)), min(sample_size, len(texts)))
+    shingles = [formula_shingles(text) for text in texts]
+    pairs = []
+    for i in sample:
+        a = shingles[i]
+        for j, b in enumerate(shingles):
+            if j != i:
+                union = len(a | b)
+                similarity = len(a & b) / union if union else 1.0
+                if similarity >= min_similarity:
+                    pairs.append((i, j, similarity))
+    return pairs
+
+
+def estimate_recall(neighbor_pairs, representatives, threshold):
+    """精确相似度不低于阈值的抽样公式对中，被归入同一簇（代表相同）的比例；没有这样的对时返回 None"""
+    pairs = [(i, j) for i, j, similarity in neighbor_pairs if similarity >= threshold]
+    if not pairs:
+        return None
+    return round(sum(1 for i, j in pairs if representatives[i] == representatives[j]) / len(pairs), 4)
+
+
+def load_result_labels(result_dir, store_backend, corpus):
+    """从一份完整的分类结果中读取语料公式的标签，返回按公式编号排列的列表（未找到为 None）"""
+    labels = [None] * len(corpus)
+    with open_result_store(result_dir, store_backend) as store:
+        for _, _, result in store.iter_results():
+            for formula in result.get('extracted_formulas', []):
+                if not isinstance(formula, dict):
+                    continue
+                formula_id = corpus.ids.get(normalize_formula(formula.get('formula_text', '')))
+                if formula_id is not None:
+                    labels[formula_id] = formula.get('formula_type', 'unknown')
+    return labels
+
+
+def rule_kind_labels(corpus):
+    """以规则形式作为近似标签（规则无法确定的公式为 None，不参与一致率统计）"""
+    return [classify_formula_kind(text) for text in corpus.texts]
+
+
+def clustering_report(corpus, representatives, similarities, labels, threshold):
+    """
+    一个阈值下的聚类效果: 需要发送的公式数、节省比例，以及传播的标签与成员自身标签的一致率
+    """
+    unique = len(corpus)
+    members = [i for i in range(unique) if representatives[i] != i]
+    compared = agreed = 0
+    for i in members:
+        member_label, representative_label = labels[i], labels[representatives[i]]
+        if member_label is not None and representative_label is not None:
+            compared += 1
+            agreed += member_label == representative_label
+    propagated_occurrences = sum(corpus.counts[i] for i in members)
+    return {
+        "threshold": threshold,
+        "unique_formulas": unique,
+        "clusters": unique - len(members),
+        "propagated_formulas": len(members),
+        "propagated_occurrences": propagated_occurrences,
+        "request_savings": round(len(members) / unique, 4) if unique else 0.0,
+        "label_pairs_compared": compared,
+        "label_agreement": round(agreed / compared, 4) if compared else None,
+        "mean_member_similarity": round(sum(similarities[i] for i in members) / len(members), 4) if members else None
+    }
+
+
+def save_clusters(index_path, corpus, representatives, similarities):
+    """把成员 -> 代表写入公式去重索引，返回成员数"""
+    rows = [(corpus.texts[i], corpus.texts[representatives[i]], round(similarities[i], 4))
+            for i in range(len(corpus)) if representatives[i] != i]
+    with FormulaDedupeIndex(index_path) as index:
+        index.save_clusters(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MinHash/LSH 近似公式聚类，簇代表发给模型、标签传播给成员")
+    parser.add_argument("input_dir", help="data_onlyclean_json.py 的输出目录")
+    parser.add_argument("--input-format", choices=["json", "jsonl"], default="json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="传播标签所需的最低估计相似度")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash 签名长度（2 的幂）")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS, help="LSH 分段数（须整除签名长度）")
+    parser.add_argument("--max-bucket-size", type=int, default=MAX_BUCKET_SIZE,
+                        help="LSH 每个桶最多保留的成员数（新公式与这些成员逐一比较）")
+    parser.add_argument("--recall-sample", type=int, default=DEFAULT_RECALL_SAMPLE,
+                        help="估计召回率时暴力比较的抽样公式数（0 为不估计）")
+    parser.add_argument("--sweep", default="0.6,0.7,0.8,0.9", help="报告中对比的阈值，逗号分隔")
+    parser.add_argument("--labels", metavar="DIR", help="一份未使用近似去重的完整结果目录，用于计算标签一致率")
+    parser.add_argument("--labels-store", choices=RESULT_BACKENDS, default="jsonl", help="--labels 的存储后端")
+    parser.add_argument("--index", metavar="PATH", help="写入聚类结果的公式去重索引（生成请求时用 --dedupe PATH）")
+    parser.add_argument("--report", metavar="PATH", default="cluster_report.json", help="报告输出文件")
+    args = parser.parse_args()
+
+    if args.num_perm & (args.num_perm - 1):
+        parser.error("--num-perm 必须是 2 的幂")
+
+    start = time.perf_counter()
+    corpus = read_formula_corpus(args.input_dir, args.input_format)
+    total = sum(corpus.counts)
+    print(f"📂 {total} 个公式，精确去重后 {len(corpus)} 个唯一公式（{time.perf_counter() - start:.1f} 秒）")
+
+    start = time.perf_counter()
+    signatures = compute_signatures(corpus.texts, args.num_perm)
+    elapsed = time.perf_counter() - start
+    print(f"🔢 MinHash 签名: {elapsed:.1f} 秒（{len(corpus) / elapsed if elapsed else 0:,.0f} 公式/秒），"
+          f"占用 {signatures.itemsize * len(signatures) / 1024 / 1024:.1f} MB")
+
+    if args.labels:
+        labels = load_result_labels(args.labels, args.labels_store, corpus)
+        label_source = f"模型结果 {args.labels}"
+    else:
+        labels = rule_kind_labels(corpus)
+        label_source = "规则形式（近似）"
+
+    thresholds = sorted({float(t) for t in args.sweep.split(",") if t.strip()} | {args.threshold})
+    neighbor_pairs = []
+    if args.recall_sample > 0:
+        start = time.perf_counter()
+        neighbor_pairs = sample_neighbors(corpus.texts, args.recall_sample, min(thresholds))
+        print(f"🎯 召回率抽样: {min(args.recall_sample, len(corpus))} 个公式，"
+              f"{len(neighbor_pairs)} 个近似公式对（{time.perf_counter() - start:.1f} 秒）")
+
+    reports = []
+    chosen = None
+    print(f"\n📊 各阈值的请求节省与标签一致率（标签来源: {label_source}）")
+    for threshold in thresholds:
+        start = time.perf_counter()
+        representatives, similarities = cluster_formulas(corpus.texts, signatures, args.num_perm, args.bands,
+                                                         threshold, args.max_bucket_size)
+        report = clustering_report(corpus, representatives, similarities, labels, threshold)
+        report["estimated_recall"] = estimate_recall(neighbor_pairs, representatives, threshold)
+        report["seconds"] = round(time.perf_counter() - start, 2)
+        reports.append(report)
+        if threshold == args.threshold:
+            chosen = (representatives, similarities)
+        agreement = f"{report['label_agreement']:.2%}" if report['label_agreement'] is not None else "-"
+        recall = f"{report['estimated_recall']:.2%}" if report['estimated_recall'] is not None else "-"
+        print(f"    阈值 {threshold:.2f}: {report['clusters']} 个簇，传播 {report['propagated_formulas']} 个公式，"
+              f"节省 {report['request_savings']:.1%}，标签一致率 {agreement}"
+              f"（比较 {report['label_pairs_compared']} 对），召回率 {recall}，用时 {report['seconds']} 秒")
+
+    if args.index:
+        members = save_clusters(args.index, corpus, *chosen)
+        print(f"\n💾 阈值 {args.threshold} 的 {members} 个成员公式已写入 {args.index}")
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({
+            "total_formulas": total,
+            "unique_formulas": len(corpus),
+            "num_perm": args.num_perm,
+            "bands": args.bands,
+            "max_bucket_size": args.max_bucket_size,
+            "recall_sample": args.recall_sample,
+            "label_source": "results" if args.labels else "rule_kind",
+            "thresholds": reports
+        }, f, indent=2, ensure_ascii=False)
+    print(f"📄 报告已保存: {args.report}")
@@ -0,0 +1,287 @@
+"""
+公式级精确去重：同一条公式（规范化后的文本相同）在所有序列中只发给模型一次
+
+生成请求时（TaxonomyRequestBuilder 的 dedupe）:
+    每条公式规范化后分配一个 formula_id，第一次出现的序列是它的 owner，公式照常写入该序列的请求；
+    之后再出现的序列不再发送这条公式，所有公式都已出现过的序列不生成请求
+下载结果时（download_pipeline 的 dedupe_index）:
+    owner 序列的模型结果按位置（数量不一致时按规范化文本）记录每个 formula_id 的类型和置信度，
+    全部结果写入后再把标签展开回所有包含重复公式的序列（materialize）
+
+索引保存在 SQLite 中，按分类方案区分（规则分类之后剩余的公式才参与去重，不同方案的剩余公式不同）。
+
+clusters 表由近似去重（formula_clustering.py）离线写入: 成员公式 -> 簇的代表公式。
+生成请求时成员公式与代表公式视为同一条公式，只发送代表（即簇中最早出现的公式），标签同样展开到成员。
+"""
+
+import sqlite3
+import threading
+from collections import defaultdict
+
+DEDUPE_TASK = "dedupe"
+
+
+def normalize_formula(text):
+    """去重用的规范化文本：合并空白、去掉末尾的句点"""
+    return " ".join(text.split()).rstrip(" .")
+
+
+class FormulaDedupeIndex:
+    """
+    formulas 表: (分类方案, formula_id) -> 规范化文本、owner 序列、模型给出的类型和置信度
+    occurrences 表: 每个序列中每条参与去重的公式，canonical=1 表示随该序列发送
+    """
+
+    def __init__(self, path, batch_size=5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS formulas (
+                taxonomy TEXT,
+                formula_id INTEGER,
+                normalized TEXT,
+                owner TEXT,
+                formula_type TEXT,
+                confidence REAL,
+                PRIMARY KEY (taxonomy, formula_id)
+            );
+            CREATE TABLE IF NOT EXISTS occurrences (
+                taxonomy TEXT,
+                sequence_id TEXT,
+                position INTEGER,
+                formula_id INTEGER,
+                formula_text TEXT,
+                canonical INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_occurrences_sequence ON occurrences (taxonomy, sequence_id);
+            CREATE TABLE IF NOT EXISTS clusters (
+                member TEXT PRIMARY KEY,
+                representative TEXT,
+                similarity REAL
+            );
+        """)
+        self._lock = threading.Lock()
+        self._ids = {}  # 分类方案 -> {规范化文本: formula_id}（生成请求时使用）
+        self._stats = {}  # 分类方案 -> [公式出现次数, 唯一公式数, 无需请求的序列数, 按近似簇合并的公式数]
+        self._clusters = None  # 成员公式的规范化文本 -> 代表公式的规范化文本
+        self._pending_formulas = []
+        self._pending_occurrences = []
+        self._pending_labels = []
+
+    # ---- 近似去重的簇 ----
+
+    def save_clusters(self, rows):
+        """替换全部近似簇，rows 为 (成员规范化文本, 代表规范化文本, 相似度)"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM clusters")
+            self.conn.executemany("INSERT OR REPLACE INTO clusters VALUES (?, ?, ?)", rows)
+        self._clusters = None
+
+    def _load_clusters(self):
+        if self._clusters is None:
+            self._clusters = dict(self.conn.execute("SELECT member, representative FROM clusters").fetchall())
+        return self._clusters
+
+    # ---- 生成请求 ----
+
+    def begin_build(self, taxonomy_name):
+        """清空该分类方案上一次生成请求时的索引"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM formulas WHERE taxonomy = ?", (taxonomy_name,))
+            self.conn.execute("DELETE FROM occurrences WHERE taxonomy = ?", (taxonomy_name,))
+            self._load_clusters()
+        self._ids[taxonomy_name] = {}
+        self._stats[taxonomy_name] = [0, 0, 0, 0]
+
+    def assign(self, taxonomy_name, sequence_id, formulas, positions=None):
+        """
+        登记一个序列中参与去重的公式，返回需要随该序列发送的公式（第一次出现的公式）及其下标 [(下标, 公式), ...]
+
+        positions 为这些公式在序列全部公式（%F 顺序）中的下标，为空时依次为 0, 1, ...；
+        展开标签时重复公式按这里的下标插回原来的位置
+        """
+        ids = self._ids[taxonomy_name]
+        clusters = self._clusters
+        stats = self._stats[taxonomy_name]
+        unique = []
+        with self._lock:
+            for position, formula in zip(positions if positions is not None else range(len(formulas)), formulas):
+                normalized = normalize_formula(formula)
+                key = clusters.get(normalized, normalized)
+                formula_id = ids.get(key)
+                canonical = formula_id is None
+                if canonical:
+                    formula_id = ids[key] = len(ids)
+                    self._pending_formulas.append((taxonomy_name, formula_id, key, sequence_id, None, None))
+                    unique.append((position, formula))
+                elif key != normalized:
+                    stats[3] += 1
+                self._pending_occurrences.append(
+                    (taxonomy_name, sequence_id, position, formula_id, formula, int(canonical)))
+            stats[0] += len(formulas)
+            stats[1] = len(ids)
+            if formulas and not unique:
+                stats[2] += 1
+            if len(self._pending_occurrences) >= self.batch_size:
+                self._flush_locked()
+        return unique
+
+    def build_report(self, taxonomy_name):
+        """
+        去重统计: 公式出现次数、唯一公式数、去重率（省掉的公式占比）、无需请求的序列数，
+        以及其中按近似簇合并到代表公式的公式数
+        """
+        occurrences, unique, skipped_sequences, clustered = self._stats[taxonomy_name]
+        return {
+            "formula_occurrences": occurrences,
+            "unique_formulas": unique,
+            "dedupe_ratio": round(1 - unique / occurrences, 4) if occurrences else 0.0,
+            "skipped_sequences": skipped_sequences,
+            "clustered_formulas": clustered
+        }
+
+    # ---- 下载结果 ----
+
+    def record_result(self, taxonomy_name, sequence_id, result):
+        """记录 owner 序列的模型结果中每条公式的类型和置信度"""
+        formulas = result.get('extracted_formulas') if isinstance(result, dict) else None
+        if not isinstance(formulas, list):
+            return
+        formulas = [f for f in formulas if isinstance(f, dict)]
+
+        with self._lock:
+            sent = self.conn.execute(
+                "SELECT formula_id, formula_text FROM occurrences "
+                "WHERE taxonomy = ? AND sequence_id = ? AND canonical = 1 ORDER BY position",
+                (taxonomy_name, sequence_id)).fetchall()
+            if not sent:
+                return
+
+            if len(sent) == len(formulas):
+                # 模型一般按发送顺序返回，数量一致时按位置对应
+                pairs = zip((formula_id for formula_id, _ in sent), formulas)
+            else:
+                by_text = {normalize_formula(text): formula_id for formula_id, text in sent}
+                pairs = [(by_text[normalize_formula(f.get('formula_text', ''))], f) for f in formulas
+                         if normalize_formula(f.get('formula_text', '')) in by_text]
+
+            for formula_id, formula in pairs:
+                self._pending_labels.append((formula.get('formula_type', 'unknown'), formula.get('confidence'),
+                                             taxonomy_name, formula_id))
+            if len(self._pending_labels) >= self.batch_size:
+                self._flush_locked()
+
+    def materialize(self, taxonomy_name, store, rule_store=None):
+        """
+        把 owner 的标签展开到包含重复公式的序列，返回更新的序列数
+
+        重复公式按生成请求时记录的下标插回原来的位置；再次运行时先按下标（且文本一致）去掉上次插入的条目，
+        结果不变。同一序列中重复出现的公式只有非 canonical 的位置会被替换，随请求发送的那一条保持不动。
+        序列完全没有发送过请求时以规则结果（如果有）为基础生成结果。
+        owner 还没有标签（请求失败、缺失或结果中没有这条公式）的重复公式暂不展开，见 unresolved_owners
+        """
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT o.sequence_id, o.position, o.formula_text, f.formula_type, f.confidence "
+                "FROM occurrences o JOIN formulas f ON f.taxonomy = o.taxonomy AND f.formula_id = o.formula_id "
+                "WHERE o.taxonomy = ? AND o.canonical = 0 AND f.formula_type IS NOT NULL "
+                "ORDER BY o.sequence_id, o.position", (taxonomy_name,)).fetchall()
+
+        expanded = defaultdict(list)
+        for sequence_id, position, formula_text, formula_type, confidence in rows:
+            expanded[sequence_id].append((position, {
+                "formula_text": formula_text,
+                "formula_type": formula_type,
+                "formula_latex": "",
+                "confidence": confidence
+            }))
+        if not expanded:
+            return 0
+
+        existing = {sequence_id: (task, result) for sequence_id, task, result in store.iter_results()
+                    if sequence_id in expanded}
+        for sequence_id, duplicates in expanded.items():
+            task, result = existing.get(sequence_id, (DEDUPE_TASK, None))
+            if result is None:
+                partial = rule_store.get(sequence_id) if rule_store is not None else None
+                result = {"sequence_id": sequence_id,
+                          "extracted_formulas": partial.get('extracted_formulas', []) if partial else []}
+            formulas = list(result.get('extracted_formulas', []))
+            # 去掉上次展开时插入的条目（从后往前删，前面的下标不变）
+            for position, duplicate in reversed(duplicates):
+                if position < len(formulas) and isinstance(formulas[position], dict) and \
+                        normalize_formula(formulas[position].get('formula_text', '')) == \
+                        normalize_formula(duplicate["formula_text"]):
+                    del formulas[position]
+            # 按下标从小到大插入，插入后 formulas[position] 即该重复公式
+            for position, duplicate in duplicates:
+                formulas.insert(position, duplicate)
+            store.add(sequence_id, dict(result, extracted_formulas=formulas), task)
+        return len(expanded)
+
+    def unresolved_owners(self, taxonomy_name):
+        """
+        返回 {owner 序列ID: 等待其标签的重复公式出现次数}：这些 owner 的公式还没有模型标签，
+        重复公式无法展开，需要重试 owner 的请求（reconcile.py 的 dedupe_index）
+        """
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT f.owner, COUNT(*) "
+                "FROM occurrences o JOIN formulas f ON f.taxonomy = o.taxonomy AND f.formula_id = o.formula_id "
+                "WHERE o.taxonomy = ? AND o.canonical = 0 AND f.formula_type IS NULL "
+                "GROUP BY f.owner", (taxonomy_name,)).fetchall()
+        return dict(rows)
+
+    # ---- 通用 ----
+
+    def _flush_locked(self):
+        with self.conn:
+            if self._pending_formulas:
+                self.conn.executemany("INSERT OR REPLACE INTO formulas VALUES (?, ?, ?, ?, ?, ?)",
+                                      self._pending_formulas)
+                self._pending_formulas = []
+            if self._pending_occurrences:
+                self.conn.executemany("INSERT INTO occurrences VALUES (?, ?, ?, ?, ?, ?)",
+                                      self._pending_occurrences)
+                self._pending_occurrences = []
+            if self._pending_labels:
+                self.conn.executemany("UPDATE formulas SET formula_type = ?, confidence = ? "
+                                      "WHERE taxonomy = ? AND formula_id = ?", self._pending_labels)
+                self._pending_labels = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DedupeRecordingResultStore:
+    """
+    包装一个 ResultStore：写入模型结果前先在去重索引中记录公式标签，其余操作原样转发
+    """
+
+    def __init__(self, store, index, taxonomy_name):
+        self.store = store
+        self.index = index
+        self.taxonomy_name = taxonomy_name
+
+    def add(self, sequence_id, result, task=""):
+        self.index.record_result(self.taxonomy_name, sequence_id, result)
+        self.store.add(sequence_id, result, task)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
@@ -0,0 +1,164 @@
+"""
+共用的 JSON 序列化层：优先使用 orjson，其次 msgspec，都未安装时退回标准库 json
+
+可通过环境变量 OEIS_JSON_BACKEND=orjson|msgspec|json 强制指定后端（json 同时关闭 msgspec 结构体校验）。
+标准库后端的输出与原来的 json.dumps(..., ensure_ascii=False) 完全一致；orjson / msgspec 输出紧凑格式
+（没有 ", " 和 ": " 中的空格），内容等价。
+
+安装了 msgspec 时，batch 请求信封使用类型化的 Struct 解码，解码的同时完成字段校验；
+后端为 msgspec 时模型返回的 extracted_formulas 结构同样按 Struct 解码。
+"""
+
+import os
+import json
+from typing import List, Optional
+
+_requested = os.environ.get("OEIS_JSON_BACKEND", "").strip().lower()
+
+orjson = None
+msgspec = None
+if _requested in ("", "orjson"):
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+if _requested in ("", "orjson", "msgspec"):
+    try:
+        import msgspec
+    except ImportError:
+        msgspec = None
+
+if _requested and _requested not in ("orjson", "msgspec", "json"):
+    raise ValueError(f"未知的 JSON 后端: {_requested}（可选: orjson, msgspec, json）")
+
+if orjson is not None:
+    BACKEND = "orjson"
+elif msgspec is not None and _requested != "orjson":
+    BACKEND = "msgspec"
+else:
+    BACKEND = "json"
+
+REQUEST_KEYS = ("custom_id", "method", "url", "body")
+
+
+class SchemaError(ValueError):
+    """JSON 格式正确，但缺少必需字段或字段类型不符"""
+
+
+if BACKEND == "orjson":
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def dumps_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+
+elif BACKEND == "msgspec":
+    _encoder = msgspec.json.Encoder()
+    _decoder = msgspec.json.Decoder()
+
+    def loads(data):
+        return _decoder.decode(data)
+
+    def dumps_bytes(obj):
+        return _encoder.encode(obj)
+
+    def dumps(obj):
+        return _encoder.encode(obj).decode("utf-8")
+
+    def dumps_pretty(obj):
+        return msgspec.json.format(_encoder.encode(obj), indent=2).decode("utf-8")
+
+else:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    def dumps_pretty(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+if msgspec is not None:
+    class ChatMessage(msgspec.Struct):
+        role: str
+        content: str
+
+    class RequestBody(msgspec.Struct):
+        model: str
+        messages: List[ChatMessage]
+
+    class BatchRequest(msgspec.Struct):
+        """batch 请求信封（只声明需要校验的字段，其余字段解码时忽略）"""
+        custom_id: str
+        method: str
+        url: str
+        body: RequestBody
+
+    class ExtractedFormula(msgspec.Struct):
+        formula_text: str = ""
+        formula_type: str = "unknown"
+        formula_latex: str = ""
+        confidence: Optional[float] = None
+
+    class ClassificationResult(msgspec.Struct):
+        """模型对单个序列返回的分类结果"""
+        sequence_id: str
+        extracted_formulas: List[ExtractedFormula] = []
+
+    class PackedClassificationResults(msgspec.Struct):
+        """打包请求的返回: 每个序列一个 ClassificationResult"""
+        results: List[ClassificationResult]
+
+    _request_decoder = msgspec.json.Decoder(BatchRequest)
+    _result_decoder = msgspec.json.Decoder(ClassificationResult)
+    _packed_result_decoder = msgspec.json.Decoder(PackedClassificationResults)
+else:
+    _request_decoder = None
+    _result_decoder = None
+    _packed_result_decoder = None
+
+
+def decode_request(line):
+    """
+    解析并校验一行 batch 请求，返回其 custom_id
+
+    JSON 格式错误抛出 ValueError，缺少必需字段（或 msgspec 校验出类型不符）抛出 SchemaError
+    """
+    if _request_decoder is not None:
+        try:
+            return _request_decoder.decode(line).custom_id
+        except msgspec.ValidationError as e:
+            raise SchemaError(str(e))
+
+    data = loads(line)
+    if not isinstance(data, dict) or not all(key in data for key in REQUEST_KEYS):
+        raise SchemaError("缺少必需字段")
+    return data["custom_id"]
+
+
+def decode_classification(text, packed=False):
+    """
+    解析模型返回的分类结果，返回普通的 dict
+
+    后端为 msgspec 时先按 ClassificationResult（packed=True 时为 PackedClassificationResults）
+    类型化解码，得到的 dict 按结构补齐缺省字段、去掉多余字段；不符合结构时退回普通解析，
+    交给调用方宽松处理。orjson 的普通解析比类型化解码再转 dict 更快，因此不走这条路径。
+    JSON 格式错误抛出 ValueError
+    """
+    decoder = _packed_result_decoder if packed else _result_decoder
+    if decoder is not None and BACKEND == "msgspec":
+        try:
+            return msgspec.to_builtins(decoder.decode(text))
+        except msgspec.ValidationError:
+            pass
+    return loads(text)
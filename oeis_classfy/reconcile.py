@@ -0,0 +1,220 @@
+"""
+对账与定向重提交：找出没有拿到有效结果的请求，只把这些请求写入重试分片
+
+把生成请求时写出的所有 custom_id 与各任务的输出文件（batch_output.jsonl / .jsonl.gz）
+和错误文件（batch_errors.jsonl）逐一对照，每个请求归入以下状态之一:
+    ok         输出中有状态码 200 且能解析的结果（打包请求的所有序列都有结果）
+    failed     出现在错误文件中，或输出状态码不是 200，或模型返回的内容无法解析
+    truncated  模型输出因 max_tokens 被截断（finish_reason == "length"）且无法解析
+    partial    打包请求中有部分序列缺少结果
+    missing    输出和错误文件中都没有出现
+同一个 custom_id 只要在任一输出（包括之前重试任务的输出）中成功就算 ok。
+指定公式去重索引（--dedupe）时，包含还没有标签的 owner 序列（见 FormulaDedupeIndex.unresolved_owners）
+的 ok 请求改为 partial，一并重试，否则依赖这些 owner 的重复公式无法展开。
+除 ok 以外的请求原样复制到重试分片，custom_id 不变，重试结果下载到同一个结果目录即可覆盖。
+
+用法:
+    python -m oeis_classfy.reconcile batch_requests2 batch_results2 --task-id-file batch_task_ids2.txt
+    python -m oeis_classfy.reconcile batch_requests2 batch_results2 --task-id-file batch_task_ids2.txt --submit
+    python -m oeis_classfy.reconcile batch_requests2 batch_results2 --dedupe formula_dedupe.sqlite
+"""
+
+import os
+import sys
+import gzip
+import json
+import glob
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.json_backend import loads, decode_request
+from oeis_classfy.taxonomy import DEFAULT_TAXONOMY, get_taxonomy, list_taxonomies
+from oeis_classfy.submit_pipeline import BatchShardWriter, submit_batch_tasks
+from oeis_classfy.download_pipeline import batch_output_dir, parse_result_line, read_task_ids, custom_id_sequence_ids
+from oeis_classfy.formula_dedupe import FormulaDedupeIndex
+
+RETRY_STATUSES = ("failed", "truncated", "partial", "missing")
+
+
+def find_request_shards(request_dir):
+    """生成请求时写出的分片（不包括旁路清单）"""
+    return sorted(glob.glob(os.path.join(request_dir, "batch_requests_*.jsonl")))
+
+
+def find_task_dirs(output_base_dir, task_id_file=None):
+    """要对账的任务目录：指定任务ID文件时只包括其中的任务，否则为结果目录下所有 task_* 目录"""
+    if task_id_file:
+        return [batch_output_dir(output_base_dir, task_id) for task_id in read_task_ids(task_id_file)]
+    return sorted(glob.glob(os.path.join(output_base_dir, "task_*")))
+
+
+def open_output_file(task_dir):
+    """打开任务的输出文件（流式下载模式只保留 gzip 副本），不存在时返回 None"""
+    path = os.path.join(task_dir, "batch_output.jsonl")
+    if os.path.exists(path):
+        return open(path, 'r', encoding='utf-8')
+    if os.path.exists(path + ".gz"):
+        return gzip.open(path + ".gz", 'rt', encoding='utf-8')
+    return None
+
+
+def classify_output_line(line, taxonomy):
+    """返回 (custom_id, 状态)，状态见模块说明；无法解析的行返回 (None, None)"""
+    try:
+        data = loads(line)
+    except ValueError:
+        return None, None
+    custom_id = data.get('custom_id')
+
+    response = data.get('response') or {}
+    status_code = data.get('status_code', response.get('status_code', 200))
+    if status_code != 200:
+        return custom_id, "failed"
+
+    choices = (response.get('body') or {}).get('choices') or []
+    if not choices:
+        return custom_id, "failed"
+
+    parsed, failed, warnings = parse_result_line(line, taxonomy)
+    kinds = {kind for kind, _ in warnings}
+    if "json" in kinds or "error" in kinds or (failed and not parsed):
+        return custom_id, "truncated" if choices[0].get('finish_reason') == "length" else "failed"
+    if "missing" in kinds:
+        return custom_id, "partial"
+    return custom_id, "ok"
+
+
+def reconcile_batch_results(request_dir, output_base_dir, retry_dir=None, task_id_file=None,
+                            taxonomy=DEFAULT_TAXONOMY, max_requests_per_file=50000, max_file_size_mb=100,
+                            dedupe_index=None):
+    """
+    对账并写出重试分片，返回 (重试分片列表, 对账报告)；报告同时保存到 output_base_dir/reconcile_report.json
+
+    retry_dir 默认为 request_dir 旁边的 "{request_dir}_retry"，每次对账前清空其中旧的重试分片；
+    dedupe_index 为生成请求时的公式去重索引路径，指定时重试还没有标签的 owner 序列所在的请求
+    """
+    taxonomy = get_taxonomy(taxonomy)
+    retry_dir = retry_dir or request_dir.rstrip("/\\") + "_retry"
+
+    # 1. 生成请求时写出的所有 custom_id
+    shards = find_request_shards(request_dir)
+    expected = {}
+    for shard in shards:
+        with open(shard, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    expected[decode_request(line)] = None
+    print(f"📋 {len(shards)} 个请求分片，共 {len(expected)} 个请求")
+
+    # 2. 扫描输出文件和错误文件（成功优先于失败）
+    status = {}
+    unexpected = 0
+    task_dirs = find_task_dirs(output_base_dir, task_id_file)
+    for task_dir in task_dirs:
+        f_out = open_output_file(task_dir)
+        if f_out is not None:
+            with f_out:
+                for line in f_out:
+                    if not line.strip():
+                        continue
+                    custom_id, line_status = classify_output_line(line, taxonomy)
+                    if custom_id not in expected:
+                        unexpected += 1
+                    elif status.get(custom_id) != "ok":
+                        status[custom_id] = line_status
+
+        error_path = os.path.join(task_dir, "batch_errors.jsonl")
+        if os.path.exists(error_path):
+            with open(error_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        custom_id = loads(line).get('custom_id')
+                    except ValueError:
+                        continue
+                    if custom_id in expected and custom_id not in status:
+                        status[custom_id] = "failed"
+
+    for custom_id in expected:
+        status.setdefault(custom_id, "missing")
+
+    unresolved_owners = {}
+    if dedupe_index:
+        with FormulaDedupeIndex(dedupe_index) as dedupe:
+            unresolved_owners = dedupe.unresolved_owners(taxonomy.name)
+        for custom_id in expected:
+            if status[custom_id] == "ok" and any(sequence_id in unresolved_owners
+                                                 for sequence_id in custom_id_sequence_ids(custom_id)):
+                status[custom_id] = "partial"
+    counts = Counter(status[custom_id] for custom_id in expected)
+
+    # 3. 把需要重试的请求原样复制到重试分片
+    os.makedirs(retry_dir, exist_ok=True)
+    for old_path in glob.glob(os.path.join(retry_dir, "batch_requests_*.jsonl*")):
+        os.remove(old_path)
+
+    writer = BatchShardWriter(retry_dir, max_requests_per_file, max_file_size_mb)
+    for shard in shards:
+        with open(shard, 'rb') as f:
+            for line in f:
+                line = line.rstrip(b"\r\n")
+                if not line:
+                    continue
+                custom_id = decode_request(line)
+                if status[custom_id] in RETRY_STATUSES:
+                    writer.write(line, custom_id)
+    writer.close()
+
+    report = {
+        "request_dir": request_dir,
+        "task_dirs": len(task_dirs),
+        "total_requests": len(expected),
+        "status_counts": {key: counts.get(key, 0) for key in ("ok",) + RETRY_STATUSES},
+        "unexpected_custom_ids": unexpected,
+        "dedupe_unresolved_owners": sorted(unresolved_owners),
+        "retry_requests": writer.total_requests,
+        "retry_files": writer.jsonl_files,
+        "retry_custom_ids": {key: [cid for cid in expected if status[cid] == key] for key in RETRY_STATUSES}
+    }
+    os.makedirs(output_base_dir, exist_ok=True)
+    with open(os.path.join(output_base_dir, "reconcile_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n📊 对账结果（{len(task_dirs)} 个任务目录）:")
+    for key, count in report["status_counts"].items():
+        print(f"  {key}: {count}")
+    if unexpected:
+        print(f"  ⚠️ 输出中有 {unexpected} 行的 custom_id 不属于这些请求分片")
+    if unresolved_owners:
+        print(f"  ⚠️ 公式去重: {len(unresolved_owners)} 个 owner 序列还没有分类结果，其请求需要重试")
+    if writer.total_requests:
+        percentage = round(writer.total_requests / len(expected) * 100, 2)
+        print(f"🔁 需要重试 {writer.total_requests} 个请求（{percentage}%），重试分片: {retry_dir}")
+    else:
+        print("✅ 所有请求都已拿到有效结果，无需重试")
+
+    return writer.jsonl_files, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对账 Batch 结果，只为失败、截断或缺失的请求生成重试分片")
+    parser.add_argument("request_dir", help="生成请求时的输出目录（如 batch_requests2）")
+    parser.add_argument("output_base_dir", help="下载结果的目录（如 batch_results2）")
+    parser.add_argument("--task-id-file", help="只对账该文件中的任务（推荐，默认扫描所有 task_* 目录）")
+    parser.add_argument("--retry-dir", help="重试分片目录（默认 {request_dir}_retry）")
+    parser.add_argument("--taxonomy", choices=list_taxonomies(), default=DEFAULT_TAXONOMY, help="分类方案")
+    parser.add_argument("--dedupe", metavar="PATH",
+                        help="生成请求时的公式去重索引，重试还没有标签的 owner 序列所在的请求")
+    parser.add_argument("--submit", action="store_true",
+                        help="立即提交重试分片，新任务ID追加到 --task-id-file，之后照常运行下载脚本即可")
+    args = parser.parse_args()
+
+    retry_files, _ = reconcile_batch_results(args.request_dir, args.output_base_dir, args.retry_dir,
+                                             args.task_id_file, args.taxonomy, dedupe_index=args.dedupe)
+    if args.submit and retry_files:
+        if not args.task_id_file:
+            print("❌ --submit 需要同时指定 --task-id-file")
+            exit(1)
+        submit_batch_tasks(retry_files, args.task_id_file, taxonomy=args.taxonomy, append=True)
@@ -0,0 +1,155 @@
+"""
+按内容寻址的模型响应缓存：公式没有变化的序列重新运行时不再提交
+
+缓存键 = sha256(模型, 分类方案, 提示词版本, 用户消息)，用户消息由序列ID和清洗后的公式列表生成，
+提示词版本为 system prompt 的哈希，修改提示词或换模型后旧结果自动失效。
+
+使用流程:
+    生成请求时   TaxonomyRequestBuilder(cache=...) 查询缓存，命中的序列不写请求；
+                 本次构建中每个序列的键和是否命中记录在 build_plan 表中
+    下载结果时   新解析出的结果按 build_plan 中记录的键写入缓存（CachingResultStore），
+                 命中的序列直接从缓存写入结果存储（materialize_hits）
+"""
+
+import hashlib
+import sqlite3
+import threading
+
+from oeis_classfy.json_backend import loads, dumps
+
+
+def prompt_version(system_prompt):
+    """system prompt 的短哈希，作为提示词版本"""
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(model, taxonomy_name, version, user_prompt):
+    """计算缓存键（各部分之间用 \\0 分隔，避免拼接产生歧义）"""
+    h = hashlib.sha256()
+    for part in (model, taxonomy_name, version, user_prompt):
+        h.update(part.encode('utf-8'))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite 实现的响应缓存，responses 表以缓存键为主键保存解析后的单个序列结果，
+    build_plan 表保存最近一次生成请求时每个 (分类方案, 序列ID) 的缓存键和是否命中
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                taxonomy TEXT,
+                sequence_id TEXT,
+                result TEXT
+            );
+            CREATE TABLE IF NOT EXISTS build_plan (
+                taxonomy TEXT,
+                sequence_id TEXT,
+                cache_key TEXT,
+                hit INTEGER,
+                PRIMARY KEY (taxonomy, sequence_id)
+            );
+        """)
+        self._lock = threading.Lock()
+        self._known_keys = {}  # 分类方案 -> 已缓存的键集合（生成请求时一次性加载）
+        self._pending_plan = []
+        self._pending_keys = {}  # 分类方案 -> {序列ID: 缓存键}，等待模型结果的序列
+        self._pending_results = []
+
+    # ---- 生成请求 ----
+
+    def begin_build(self, taxonomy_name):
+        """开始为某个分类方案生成请求：清空该方案上一次的 build_plan 并加载已缓存的键"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM build_plan WHERE taxonomy = ?", (taxonomy_name,))
+            self._known_keys[taxonomy_name] = {row[0] for row in self.conn.execute(
+                "SELECT cache_key FROM responses WHERE taxonomy = ?", (taxonomy_name,))}
+
+    def lookup(self, taxonomy_name, sequence_id, key):
+        """记录序列本次的缓存键，返回是否命中"""
+        hit = key in self._known_keys[taxonomy_name]
+        with self._lock:
+            self._pending_plan.append((taxonomy_name, sequence_id, key, int(hit)))
+            if len(self._pending_plan) >= self.batch_size:
+                self._flush_locked()
+        return hit
+
+    # ---- 下载结果 ----
+
+    def record_result(self, taxonomy_name, sequence_id, result):
+        """把新解析出的结果写入缓存（只接受最近一次构建中未命中的序列）"""
+        with self._lock:
+            pending = self._pending_keys.get(taxonomy_name)
+            if pending is None:
+                pending = self._pending_keys[taxonomy_name] = dict(self.conn.execute(
+                    "SELECT sequence_id, cache_key FROM build_plan WHERE taxonomy = ? AND hit = 0",
+                    (taxonomy_name,)).fetchall())
+            key = pending.get(sequence_id)
+            if key is None:
+                return
+            self._pending_results.append((key, taxonomy_name, sequence_id, dumps(result)))
+            if len(self._pending_results) >= self.batch_size:
+                self._flush_locked()
+
+    def materialize_hits(self, taxonomy_name, store, task="cache"):
+        """把最近一次构建中命中缓存的序列结果写入结果存储，返回写入的序列数"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT p.sequence_id, r.result FROM build_plan p JOIN responses r ON r.cache_key = p.cache_key "
+                "WHERE p.taxonomy = ? AND p.hit = 1", (taxonomy_name,)).fetchall()
+        for sequence_id, result in rows:
+            store.add(sequence_id, loads(result), task)
+        return len(rows)
+
+    # ---- 通用 ----
+
+    def _flush_locked(self):
+        with self.conn:
+            if self._pending_plan:
+                self.conn.executemany("INSERT OR REPLACE INTO build_plan VALUES (?, ?, ?, ?)", self._pending_plan)
+                self._pending_plan = []
+            if self._pending_results:
+                self.conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                      self._pending_results)
+                self._pending_results = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CachingResultStore:
+    """
+    包装一个 ResultStore：写入结果的同时写入响应缓存，其余操作原样转发
+    """
+
+    def __init__(self, store, cache, taxonomy_name):
+        self.store = store
+        self.cache = cache
+        self.taxonomy_name = taxonomy_name
+
+    def add(self, sequence_id, result, task=""):
+        self.store.add(sequence_id, result, task)
+        self.cache.record_result(self.taxonomy_name, sequence_id, result)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
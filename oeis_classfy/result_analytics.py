@@ -0,0 +1,424 @@
+"""
+分类结果的列式分析：把结果存储载入按列保存的表，分组统计和直方图都是对整列的向量化运算
+
+每个公式一行:
+    formula_sequence  int32    所属序列在 sequence_ids 中的下标
+    formula_type      int16    类型编码（type_names 中的下标）
+    confidence        float32  模型给出的置信度，缺失为 NaN
+每个序列一行:
+    block             int32    序列号 // 1000（A000045 -> 0，与 aNNN 目录对应），无法解析的序列ID为 -1
+    task              int16    任务编码（task_names 中的下标）
+    formula_count     int32    公式数
+
+安装了 numpy 时列为 numpy 数组；否则退回标准库 array，查询用纯 Python 循环完成，结果相同。
+第一次查询时遍历结果存储建表，列以原始二进制写入 {结果目录}/analytics/{存储后端}/，
+之后结果存储的数据文件没有变化时直接读取（见 result_store_files）。
+
+例:
+    python -m oeis_classfy.result_analytics batch_results --taxonomy 4 summary
+    python -m oeis_classfy.result_analytics batch_results confidence --by-type --bins 20
+    python -m oeis_classfy.result_analytics batch_results blocks --json
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+from array import array
+from bisect import bisect_right
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.result_store import open_result_store, result_store_files, RESULT_BACKENDS
+from oeis_classfy.taxonomy import get_taxonomy, list_taxonomies
+
+ANALYTICS_DIR = "analytics"
+SEQUENCE_ID_RE = re.compile(r"A(\d+)$")
+
+# 列名 -> array 类型码（numpy 使用相同宽度的 dtype）
+FORMULA_COLUMNS = {"formula_sequence": "i", "formula_type": "h", "confidence": "f"}
+SEQUENCE_COLUMNS = {"block": "i", "task": "h", "formula_count": "i"}
+NUMPY_DTYPES = {"i": "int32", "h": "int16", "f": "float32"}
+
+
+def sequence_block(sequence_id):
+    """A000045 -> 0，A123456 -> 123；不是 A+数字 形式的序列ID返回 -1"""
+    match = SEQUENCE_ID_RE.match(sequence_id)
+    return int(match.group(1)) // 1000 if match else -1
+
+
+def store_fingerprint(output_base_dir, store_backend):
+    """结果存储数据文件的 (文件名, 大小, 修改时间)，任一变化即视为缓存过期"""
+    fingerprint = []
+    for path in result_store_files(output_base_dir, store_backend):
+        st = os.stat(path)
+        fingerprint.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return fingerprint
+
+
+class ResultTable:
+    """
+    分类结果的列式表：公式列和序列列见模块说明，字符串类型的列按编码保存（type_names / task_names）
+    """
+
+    def __init__(self, sequence_ids, type_names, task_names, columns):
+        self.sequence_ids = sequence_ids
+        self.type_names = type_names
+        self.task_names = task_names
+        self.columns = columns
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["columns"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def num_formulas(self):
+        return len(self.columns["formula_type"])
+
+    @property
+    def num_sequences(self):
+        return len(self.sequence_ids)
+
+    # ---- 建表和缓存 ----
+
+    @classmethod
+    def from_store(cls, store):
+        """遍历结果存储建表"""
+        type_codes = {}
+        task_codes = {}
+        sequence_ids = []
+        formula_sequence = array('i')
+        formula_type = array('h')
+        confidence = array('f')
+        block = array('i')
+        task = array('h')
+        formula_count = array('i')
+        nan = float('nan')
+
+        for sequence_id, task_name, result in store.iter_results():
+            row = len(sequence_ids)
+            sequence_ids.append(sequence_id)
+            block.append(sequence_block(sequence_id))
+            task.append(task_codes.setdefault(task_name, len(task_codes)))
+            count = 0
+            for formula in result.get('extracted_formulas', []):
+                if not isinstance(formula, dict):
+                    continue
+                formula_name = formula.get('formula_type', 'unknown')
+                formula_sequence.append(row)
+                formula_type.append(type_codes.setdefault(formula_name, len(type_codes)))
+                value = formula.get('confidence')
+                confidence.append(value if isinstance(value, (int, float)) else nan)
+                count += 1
+            formula_count.append(count)
+
+        columns = {"formula_sequence": formula_sequence, "formula_type": formula_type, "confidence": confidence,
+                   "block": block, "task": task, "formula_count": formula_count}
+        if np is not None:
+            columns = {name: np.frombuffer(column, dtype=NUMPY_DTYPES[column.typecode]).copy()
+                       for name, column in columns.items()}
+        return cls(sequence_ids, list(type_codes), list(task_codes), columns)
+
+    def save(self, cache_dir, fingerprint):
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in {**FORMULA_COLUMNS, **SEQUENCE_COLUMNS}:
+            with open(os.path.join(cache_dir, f"{name}.bin"), 'wb') as f:
+                f.write(self.columns[name].tobytes())
+        with open(os.path.join(cache_dir, "sequence_ids.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(self.sequence_ids))
+        # meta.json 最后写入，中断时不会留下看似完整的缓存
+        with open(os.path.join(cache_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": fingerprint, "type_names": self.type_names, "task_names": self.task_names,
+                       "num_formulas": self.num_formulas, "num_sequences": self.num_sequences},
+                      f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, cache_dir, fingerprint=None):
+        """读取缓存的列；缓存不存在、不完整或与 fingerprint 不符时返回 None"""
+        meta_path = os.path.join(cache_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if fingerprint is not None and meta["fingerprint"] != fingerprint:
+            return None
+
+        columns = {}
+        for names, length in ((FORMULA_COLUMNS, meta["num_formulas"]), (SEQUENCE_COLUMNS, meta["num_sequences"])):
+            for name, typecode in names.items():
+                path = os.path.join(cache_dir, f"{name}.bin")
+                if np is not None:
+                    columns[name] = np.fromfile(path, dtype=NUMPY_DTYPES[typecode])
+                else:
+                    columns[name] = array(typecode)
+                    with open(path, 'rb') as f:
+                        columns[name].frombytes(f.read())
+                if len(columns[name]) != length:
+                    return None
+        with open(os.path.join(cache_dir, "sequence_ids.txt"), 'r', encoding='utf-8') as f:
+            sequence_ids = f.read().split("\n") if meta["num_sequences"] else []
+        return cls(sequence_ids, meta["type_names"], meta["task_names"], columns)
+
+    # ---- 查询 ----
+
+    def type_codes(self, taxonomy=None):
+        """
+        返回 (每个公式的类型编码列, 类型名列表)；指定分类方案时按 normalize_type 归并类型，
+        封闭分类的类型名按方案中的顺序列出
+        """
+        if taxonomy is None:
+            return self.formula_type, list(self.type_names)
+        taxonomy = get_taxonomy(taxonomy)
+        names = list(taxonomy.formula_types) if taxonomy.closed else []
+        mapping = []
+        for name in self.type_names:
+            name = taxonomy.normalize_type(name)
+            if name not in names:
+                names.append(name)
+            mapping.append(names.index(name))
+        if np is not None:
+            return np.asarray(mapping, dtype=np.int16)[self.formula_type], names
+        return array('h', (mapping[code] for code in self.formula_type)), names
+
+    def type_counts(self, taxonomy=None):
+        """{类型: 公式数}"""
+        codes, names = self.type_codes(taxonomy)
+        return dict(zip(names, _bincount(codes, len(names))))
+
+    def task_counts(self):
+        """{任务: 序列数}"""
+        return dict(zip(self.task_names, _bincount(self.task, len(self.task_names))))
+
+    def confidence_histogram(self, bins=10, by_type=False, taxonomy=None):
+        """
+        置信度直方图: {"edges": 区间边界, "counts": 各区间公式数, "missing": 没有置信度的公式数}，
+        区间为 [edges[i], edges[i+1])，最后一个区间包含 1.0；by_type=True 时返回 {类型: 直方图}
+        """
+        edges = [i * (1.0 / bins) for i in range(bins)] + [1.0]
+        if not by_type:
+            return _histogram(self.confidence, edges)
+        codes, names = self.type_codes(taxonomy)
+        if np is not None:
+            return {name: _histogram(self.confidence[codes == code], edges) for code, name in enumerate(names)}
+        grouped = [array('f') for _ in names]
+        for code, value in zip(codes, self.confidence):
+            grouped[code].append(value)
+        return {name: _histogram(grouped[code], edges) for code, name in enumerate(names)}
+
+    def confidence_stats(self, taxonomy=None):
+        """{类型: {"formulas", "with_confidence", "mean", "min", "max"}}"""
+        codes, names = self.type_codes(taxonomy)
+        stats = {}
+        if np is not None:
+            valid = ~np.isnan(self.confidence)
+            totals = np.bincount(codes, minlength=len(names))
+            counts = np.bincount(codes[valid], minlength=len(names))
+            sums = np.bincount(codes[valid], weights=self.confidence[valid].astype(np.float64), minlength=len(names))
+            for code, name in enumerate(names):
+                values = self.confidence[valid & (codes == code)] if counts[code] else None
+                stats[name] = _confidence_summary(int(totals[code]), int(counts[code]), float(sums[code]),
+                                                  float(values.min()) if counts[code] else None,
+                                                  float(values.max()) if counts[code] else None)
+            return stats
+
+        totals = [0] * len(names)
+        counts = [0] * len(names)
+        sums = [0.0] * len(names)
+        lows = [None] * len(names)
+        highs = [None] * len(names)
+        for code, value in zip(codes, self.confidence):
+            totals[code] += 1
+            if value == value:
+                counts[code] += 1
+                sums[code] += value
+                lows[code] = value if lows[code] is None else min(lows[code], value)
+                highs[code] = value if highs[code] is None else max(highs[code], value)
+        for code, name in enumerate(names):
+            stats[name] = _confidence_summary(totals[code], counts[code], sums[code], lows[code], highs[code])
+        return stats
+
+    def block_breakdown(self, taxonomy=None):
+        """按 aNNN 分块统计: {块号: {类型: 公式数}}（只列出数量不为 0 的类型）"""
+        codes, names = self.type_codes(taxonomy)
+        if np is not None:
+            formula_blocks = self.block[self.formula_sequence]
+            blocks, block_index = np.unique(formula_blocks, return_inverse=True)
+            counts = np.bincount(block_index * len(names) + codes, minlength=len(blocks) * len(names))
+            counts = counts.reshape(len(blocks), len(names))
+            return {int(block): {names[code]: int(count) for code, count in enumerate(row) if count}
+                    for block, row in zip(blocks, counts)}
+
+        pairs = Counter(zip((self.block[row] for row in self.formula_sequence), codes))
+        breakdown = {}
+        for block, code in sorted(pairs):
+            breakdown.setdefault(block, {})[names[code]] = pairs[block, code]
+        return breakdown
+
+    def formulas_per_sequence(self, max_count=20):
+        """每个序列的公式数分布: {公式数: 序列数}，超过 max_count 的序列合并到 f">{max_count}" """
+        if np is not None:
+            counts = np.bincount(np.minimum(self.formula_count, max_count + 1), minlength=max_count + 2)
+        else:
+            counts = _bincount(array('i', (min(count, max_count + 1) for count in self.formula_count)),
+                               max_count + 2)
+        histogram = {str(n): int(counts[n]) for n in range(max_count + 1)}
+        histogram[f">{max_count}"] = int(counts[max_count + 1])
+        return histogram
+
+    def summary(self, taxonomy=None):
+        return {
+            "total_sequences": self.num_sequences,
+            "total_formulas": self.num_formulas,
+            "total_tasks": len(self.task_names),
+            "type_counts": self.type_counts(taxonomy),
+            "task_counts": self.task_counts(),
+            "confidence": self.confidence_stats(taxonomy)
+        }
+
+
+def _bincount(codes, length):
+    if np is not None:
+        return [int(count) for count in np.bincount(codes, minlength=length)]
+    counts = [0] * length
+    for code in codes:
+        counts[code] += 1
+    return counts
+
+
+def _histogram(values, edges):
+    """按 edges 统计（NaN 计入 missing，超出范围的值不计入）"""
+    bins = len(edges) - 1
+    if np is not None:
+        missing = int(np.isnan(values).sum())
+        counts, _ = np.histogram(values[~np.isnan(values)], bins=np.asarray(edges))
+        return {"edges": edges, "counts": [int(count) for count in counts], "missing": missing}
+
+    counts = [0] * bins
+    missing = 0
+    for value in values:
+        if value != value:
+            missing += 1
+        elif edges[0] <= value <= edges[-1]:
+            counts[min(bisect_right(edges, value) - 1, bins - 1)] += 1
+    return {"edges": edges, "counts": counts, "missing": missing}
+
+
+def _confidence_summary(total, count, total_confidence, low, high):
+    return {
+        "formulas": total,
+        "with_confidence": count,
+        "mean": round(total_confidence / count, 4) if count else None,
+        "min": round(low, 4) if low is not None else None,
+        "max": round(high, 4) if high is not None else None
+    }
+
+
+def load_result_table(output_base_dir, store_backend="jsonl", refresh=False):
+    """
+    载入 output_base_dir 下结果存储的列式表，返回 (ResultTable, 是否来自缓存)
+    """
+    cache_dir = os.path.join(output_base_dir, ANALYTICS_DIR, store_backend)
+    fingerprint = store_fingerprint(output_base_dir, store_backend)
+    table = None if refresh else ResultTable.load(cache_dir, fingerprint)
+    if table is not None:
+        return table, True
+
+    with open_result_store(output_base_dir, store_backend) as store:
+        table = ResultTable.from_store(store)
+    # 打开存储时可能创建或补写文件，建表后重新计算
+    table.save(cache_dir, store_fingerprint(output_base_dir, store_backend))
+    return table, False
+
+
+def print_counts(title, counts, total):
+    print(f"\n📊 {title}:")
+    for name, count in counts.items():
+        percentage = round(count / total * 100, 2) if total else 0
+        print(f"    {name}: {count} ({percentage}%)")
+
+
+def print_histogram(title, histogram):
+    print(f"\n📊 {title}（无置信度: {histogram['missing']}）:")
+    peak = max(histogram["counts"]) if histogram["counts"] else 0
+    for i, count in enumerate(histogram["counts"]):
+        bar = "█" * (math.ceil(count / peak * 40) if peak else 0)
+        print(f"    [{histogram['edges'][i]:.2f}, {histogram['edges'][i + 1]:.2f}{']' if i == len(histogram['counts']) - 1 else ')'} "
+              f"{count:>9} {bar}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分类结果的列式分析（类型分布、置信度、aNNN 分块、每序列公式数）")
+    parser.add_argument("output_base_dir", help="下载结果的目录（与 download_pipeline 的 output_base_dir 相同）")
+    parser.add_argument("query", nargs="?", default="summary",
+                        choices=["summary", "types", "confidence", "blocks", "per-sequence"])
+    parser.add_argument("--store", choices=RESULT_BACKENDS, default="jsonl", help="结果存储后端")
+    parser.add_argument("--taxonomy", choices=list_taxonomies(), help="按分类方案归并类型（不指定时按原始类型统计）")
+    parser.add_argument("--bins", type=int, default=10, help="置信度直方图的区间数")
+    parser.add_argument("--by-type", action="store_true", help="置信度直方图按类型分别统计")
+    parser.add_argument("--max-count", type=int, default=20, help="每序列公式数分布中单独列出的最大公式数")
+    parser.add_argument("--refresh", action="store_true", help="忽略缓存，重新遍历结果存储建表")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出查询结果")
+    # 允许查询名出现在选项之后（如 --taxonomy 4 summary）
+    args = parser.parse_intermixed_args()
+
+    if not os.path.exists(args.output_base_dir):
+        print(f"❌ 结果目录不存在: {args.output_base_dir}")
+        exit(1)
+
+    start = time.perf_counter()
+    table, cached = load_result_table(args.output_base_dir, args.store, args.refresh)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.query == "summary":
+        result = table.summary(args.taxonomy)
+    elif args.query == "types":
+        result = table.type_counts(args.taxonomy)
+    elif args.query == "confidence":
+        result = table.confidence_histogram(args.bins, args.by_type, args.taxonomy)
+    elif args.query == "blocks":
+        result = table.block_breakdown(args.taxonomy)
+    else:
+        result = table.formulas_per_sequence(args.max_count)
+    query_seconds = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        exit(0)
+
+    print(f"📂 {table.num_sequences} 个序列，{table.num_formulas} 个公式"
+          f"（{'读取列缓存' if cached else '遍历结果存储建表'} {load_seconds:.2f} 秒，"
+          f"查询 {query_seconds * 1000:.1f} 毫秒，{'numpy' if np is not None else '标准库 array'}）")
+
+    if args.query == "summary":
+        print_counts("公式类型分布", result["type_counts"], result["total_formulas"])
+        print_counts("各任务的序列数", result["task_counts"], result["total_sequences"])
+        print("\n📊 各类型的置信度:")
+        for name, stats in result["confidence"].items():
+            print(f"    {name}: 平均 {stats['mean']}，最小 {stats['min']}，最大 {stats['max']}"
+                  f"（{stats['with_confidence']}/{stats['formulas']} 个公式有置信度）")
+    elif args.query == "types":
+        print_counts("公式类型分布", result, table.num_formulas)
+    elif args.query == "confidence":
+        if args.by_type:
+            for name, histogram in result.items():
+                print_histogram(f"{name} 的置信度分布", histogram)
+        else:
+            print_histogram("置信度分布", result)
+    elif args.query == "blocks":
+        print("\n📊 按 aNNN 分块的公式类型分布:")
+        for block, counts in result.items():
+            label = f"a{block:03d}" if block >= 0 else "其他"
+            print(f"    {label}: " + "，".join(f"{name} {count}" for name, count in counts.items()))
+    else:
+        print_counts("每个序列的公式数（序列数）", result, table.num_sequences)
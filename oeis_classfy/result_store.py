@@ -0,0 +1,353 @@
+"""
+分类结果存储：替代每个序列一个 {sequence_id}_classified.json 文件
+
+三种可选后端，接口一致:
+    jsonl    分片 JSONL（results_NNNNN.jsonl）+ 序列ID索引文件 index.tsv
+    sqlite   单个 SQLite 数据库，结果表以 sequence_id 为主键，另有逐公式的类型表
+    parquet  Parquet 分片（需要 pip install pyarrow）
+
+写入先缓冲在内存中，每 batch_size 条批量落盘；同一序列重复写入时以最后一次为准。
+汇总统计（summary）直接查询存储，不再遍历任务目录。
+"""
+
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from oeis_classfy.json_backend import loads, dumps, dumps_bytes
+
+RESULT_BACKENDS = ("jsonl", "sqlite", "parquet")
+RESULT_SHARD_PREFIX = "results_"
+
+
+def formula_types_of(result):
+    """返回结果中每个公式的类型列表"""
+    return [formula.get('formula_type', 'unknown') for formula in result.get('extracted_formulas', [])
+            if isinstance(formula, dict)]
+
+
+class ResultStore:
+    """
+    结果存储基类：子类实现 _write_batch / get / iter_results，summary 可按需改写为更高效的查询
+    """
+
+    def __init__(self, root, batch_size=1000):
+        self.root = root
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def add(self, sequence_id, result, task=""):
+        """缓冲一条结果，达到 batch_size 时批量写入；可在多个线程间共享"""
+        with self._lock:
+            self._pending.append((sequence_id, task, result))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            self._write_batch(self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def get(self, sequence_id):
+        """按序列ID查询结果，不存在时返回 None"""
+        raise NotImplementedError
+
+    def iter_results(self):
+        """逐条产出 (sequence_id, task, result)，每个序列只产出最新的一条"""
+        raise NotImplementedError
+
+    def summary(self):
+        """
+        汇总统计: {"total_tasks", "total_sequences", "total_formulas", "type_counts"}
+        """
+        tasks = set()
+        type_counts = Counter()
+        total_sequences = 0
+        for _, task, result in self.iter_results():
+            tasks.add(task)
+            type_counts.update(formula_types_of(result))
+            total_sequences += 1
+        return {
+            "total_tasks": len(tasks),
+            "total_sequences": total_sequences,
+            "total_formulas": sum(type_counts.values()),
+            "type_counts": dict(type_counts)
+        }
+
+
+class JsonlResultStore(ResultStore):
+    """
+    分片 JSONL 后端：每行 {"sequence_id", "task", "result"}，index.tsv 记录
+    序列ID -> (分片, 偏移, 长度)，查询时直接 seek 到对应位置
+    """
+
+    INDEX_NAME = "index.tsv"
+
+    def __init__(self, root, batch_size=1000, max_records_per_shard=50000):
+        super().__init__(root, batch_size)
+        self.max_records_per_shard = max_records_per_shard
+        self.index_path = os.path.join(root, self.INDEX_NAME)
+        self.index = {}  # sequence_id -> (分片文件名, 偏移, 长度)
+        self._shard_records = Counter()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        continue  # 上次写入中断留下的不完整行
+                    sequence_id, shard, offset, length = parts
+                    self.index[sequence_id] = (shard, int(offset), int(length))
+                    self._shard_records[shard] += 1
+
+    def _current_shard(self):
+        shards = sorted(self._shard_records)
+        if shards and self._shard_records[shards[-1]] < self.max_records_per_shard:
+            return shards[-1]
+        return f"{RESULT_SHARD_PREFIX}{len(shards) + 1:05d}.jsonl"
+
+    def _write_batch(self, records):
+        index_lines = []
+        position = 0
+        while position < len(records):
+            shard = self._current_shard()
+            room = self.max_records_per_shard - self._shard_records[shard]
+            chunk = records[position:position + room]
+            position += len(chunk)
+
+            with open(os.path.join(self.root, shard), 'ab') as f_out:
+                offset = f_out.tell()
+                for sequence_id, task, result in chunk:
+                    line = dumps_bytes({"sequence_id": sequence_id, "task": task, "result": result}) + b"\n"
+                    f_out.write(line)
+                    self.index[sequence_id] = (shard, offset, len(line))
+                    index_lines.append(f"{sequence_id}\t{shard}\t{offset}\t{len(line)}\n")
+                    offset += len(line)
+            self._shard_records[shard] += len(chunk)
+
+        # 数据写完后再追加索引，中断时索引不会指向不存在的数据
+        with open(self.index_path, 'a', encoding='utf-8') as f_index:
+            f_index.writelines(index_lines)
+
+    def get(self, sequence_id):
+        self.flush()
+        location = self.index.get(sequence_id)
+        if location is None:
+            return None
+        shard, offset, length = location
+        with open(os.path.join(self.root, shard), 'rb') as f:
+            f.seek(offset)
+            return loads(f.read(length))["result"]
+
+    def iter_results(self):
+        self.flush()
+        # 按分片顺序扫描，只保留索引指向的（即最新的）记录
+        latest = {(shard, offset) for shard, offset, _ in self.index.values()}
+        for shard in sorted(self._shard_records):
+            with open(os.path.join(self.root, shard), 'rb') as f:
+                offset = 0
+                for line in f:
+                    if (shard, offset) in latest:
+                        record = loads(line)
+                        yield record["sequence_id"], record["task"], record["result"]
+                    offset += len(line)
+
+
+class SqliteResultStore(ResultStore):
+    """
+    SQLite 后端：results 表以 sequence_id 为主键保存完整结果，
+    formulas 表逐公式保存类型和置信度，summary 用 GROUP BY 查询完成
+    """
+
+    DB_NAME = "results.sqlite"
+
+    def __init__(self, root, batch_size=1000):
+        super().__init__(root, batch_size)
+        self.db_path = os.path.join(root, self.DB_NAME)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                sequence_id TEXT PRIMARY KEY,
+                task TEXT,
+                formula_count INTEGER,
+                result TEXT
+            );
+            CREATE TABLE IF NOT EXISTS formulas (
+                sequence_id TEXT,
+                position INTEGER,
+                formula_type TEXT,
+                confidence REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_formulas_sequence ON formulas (sequence_id);
+            CREATE INDEX IF NOT EXISTS idx_formulas_type ON formulas (formula_type);
+        """)
+
+    def _write_batch(self, records):
+        result_rows = []
+        formula_rows = []
+        for sequence_id, task, result in records:
+            formulas = [f for f in result.get('extracted_formulas', []) if isinstance(f, dict)]
+            result_rows.append((sequence_id, task, len(formulas), dumps(result)))
+            for position, formula in enumerate(formulas):
+                formula_rows.append((sequence_id, position, formula.get('formula_type', 'unknown'),
+                                     formula.get('confidence')))
+
+        with self.conn:
+            # 同一序列重复写入时先删除旧的公式行
+            self.conn.executemany("DELETE FROM formulas WHERE sequence_id = ?",
+                                  [(row[0],) for row in result_rows])
+            self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", result_rows)
+            self.conn.executemany("INSERT INTO formulas VALUES (?, ?, ?, ?)", formula_rows)
+
+    def get(self, sequence_id):
+        self.flush()
+        with self._lock:
+            row = self.conn.execute("SELECT result FROM results WHERE sequence_id = ?", (sequence_id,)).fetchone()
+        return loads(row[0]) if row else None
+
+    def iter_results(self):
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute("SELECT sequence_id, task, result FROM results ORDER BY sequence_id").fetchall()
+        for sequence_id, task, result in rows:
+            yield sequence_id, task, loads(result)
+
+    def summary(self):
+        self.flush()
+        with self._lock:
+            total_tasks, total_sequences = self.conn.execute(
+                "SELECT COUNT(DISTINCT task), COUNT(*) FROM results").fetchone()
+            type_counts = dict(self.conn.execute(
+                "SELECT formula_type, COUNT(*) FROM formulas GROUP BY formula_type").fetchall())
+        return {
+            "total_tasks": total_tasks,
+            "total_sequences": total_sequences,
+            "total_formulas": sum(type_counts.values()),
+            "type_counts": type_counts
+        }
+
+    def close(self):
+        super().close()
+        self.conn.close()
+
+
+class ParquetResultStore(ResultStore):
+    """
+    Parquet 后端：每次批量写入生成一个 part-NNNNN.parquet，
+    列为 sequence_id / task / formula_types / result(JSON 文本)
+    """
+
+    def __init__(self, root, batch_size=50000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet 结果存储需要安装 pyarrow: pip install pyarrow")
+        super().__init__(root, batch_size)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+
+    def _part_paths(self):
+        return sorted(os.path.join(self.root, name) for name in os.listdir(self.root)
+                      if name.startswith("part-") and name.endswith(".parquet"))
+
+    def _write_batch(self, records):
+        table = self.pa.table({
+            "sequence_id": [r[0] for r in records],
+            "task": [r[1] for r in records],
+            "formula_types": [formula_types_of(r[2]) for r in records],
+            "result": [dumps(r[2]) for r in records],
+        })
+        part_path = os.path.join(self.root, f"part-{len(self._part_paths()) + 1:05d}.parquet")
+        self.pq.write_table(table, part_path)
+
+    def _latest_rows(self, columns):
+        """按写入顺序读取所有分片，同一序列只保留最后一次写入"""
+        latest = {}
+        for part_path in self._part_paths():
+            table = self.pq.read_table(part_path, columns=["sequence_id"] + columns).to_pydict()
+            for i, sequence_id in enumerate(table["sequence_id"]):
+                latest[sequence_id] = tuple(table[column][i] for column in columns)
+        return latest
+
+    def get(self, sequence_id):
+        self.flush()
+        for part_path in reversed(self._part_paths()):
+            table = self.pq.read_table(part_path, columns=["sequence_id", "result"],
+                                       filters=[("sequence_id", "=", sequence_id)])
+            if table.num_rows:
+                return loads(table.column("result")[table.num_rows - 1].as_py())
+        return None
+
+    def iter_results(self):
+        self.flush()
+        for sequence_id, (task, result) in sorted(self._latest_rows(["task", "result"]).items()):
+            yield sequence_id, task, loads(result)
+
+    def summary(self):
+        self.flush()
+        latest = self._latest_rows(["task", "formula_types"])
+        type_counts = Counter()
+        for _, formula_types in latest.values():
+            type_counts.update(formula_types)
+        return {
+            "total_tasks": len({task for task, _ in latest.values()}),
+            "total_sequences": len(latest),
+            "total_formulas": sum(type_counts.values()),
+            "type_counts": dict(type_counts)
+        }
+
+
+def open_result_store(root, backend="jsonl", **kwargs):
+    """
+    打开 root 目录下指定后端的结果存储（不存在则创建）
+    """
+    if backend == "jsonl":
+        return JsonlResultStore(os.path.join(root, "results_jsonl"), **kwargs)
+    if backend == "sqlite":
+        return SqliteResultStore(root, **kwargs)
+    if backend == "parquet":
+        return ParquetResultStore(os.path.join(root, "results_parquet"), **kwargs)
+    raise ValueError(f"未知的结果存储后端: {backend}（可选: {', '.join(RESULT_BACKENDS)}）")
+
+
+def result_store_files(root, backend="jsonl"):
+    """
+    root 目录下指定后端结果存储的全部数据文件路径（不打开存储），用于判断派生的缓存是否过期
+    """
+    if backend == "jsonl":
+        directory = os.path.join(root, "results_jsonl")
+        names = [name for name in os.listdir(directory) if name.startswith(RESULT_SHARD_PREFIX) or
+                 name == JsonlResultStore.INDEX_NAME] if os.path.isdir(directory) else []
+    elif backend == "sqlite":
+        directory = root
+        names = [name for name in (SqliteResultStore.DB_NAME, SqliteResultStore.DB_NAME + "-wal")
+                 if os.path.exists(os.path.join(root, name))]
+    elif backend == "parquet":
+        directory = os.path.join(root, "results_parquet")
+        names = [name for name in os.listdir(directory) if name.startswith("part-") and name.endswith(".parquet")
+                 ] if os.path.isdir(directory) else []
+    else:
+        raise ValueError(f"未知的结果存储后端: {backend}（可选: {', '.join(RESULT_BACKENDS)}）")
+    return [os.path.join(directory, name) for name in sorted(names)]
@@ -0,0 +1,184 @@
+"""
+规则快速分类：在提交给模型之前，用预编译的正则表达式离线识别格式明确的公式
+
+只识别几乎不会出错的形式（其余公式一律交给模型）:
+    gf / gf_complex     以 "G.f.:"（或 "O.g.f.:"、"G.f. A(x) satisfies:"）开头的生成函数；
+                        含 Product / Sum / 连分数等写法的记为 gf_complex
+    egf / egf_complex   以 "E.g.f.:" 开头的指数生成函数
+    recurrence          a(n) = c*a(n-1) + ... 形式的线性递推（系数为整数或 n 的一次式），可带初始条件
+    closed_form         a(n) = 只含 n、整数、四则运算、乘方、阶乘和 binomial/floor/ceiling 的表达式
+
+规则形式到公式类型的映射由分类方案的 rule_types 决定（见 taxonomy.py），映射中没有的形式同样交给模型。
+规则分类的结果与模型结果的结构相同（sequence_id + extracted_formulas），置信度记为 1.0。
+
+生成请求时（TaxonomyRequestBuilder 的 rule_store）:
+    所有公式都被规则识别的序列不生成请求，结果以 task="rules" 写入规则结果存储；
+    部分识别的序列只把剩余公式发给模型，已识别的部分以 task="rules_partial" 写入
+下载结果时（download_pipeline 的 rule_results_dir）:
+    模型结果与同一序列的 rules_partial 合并后写入结果存储，rules 结果直接写入结果存储
+
+单独运行时统计语料的规则覆盖率和分类速度:
+    python -m oeis_classfy.rule_classifier oeis_onlyclean_json --taxonomy 4
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from oeis_classfy.taxonomy import DEFAULT_TAXONOMY, get_taxonomy, list_taxonomies
+from oeis_classfy.result_store import open_result_store
+
+RULE_CONFIDENCE = 1.0
+RULE_TASK = "rules"
+RULE_PARTIAL_TASK = "rules_partial"
+
+GF_RE = re.compile(r"(?:G\.f\.|O\.g\.f\.)(?:\s+A\(x\))?(?:\s+satisfies)?\s*:")
+EGF_RE = re.compile(r"E\.g\.f\.(?:\s+A\(x\))?(?:\s+satisfies)?\s*:")
+# 生成函数中出现这些写法时，细分类方案可能归为乘积、求和、连分数等类型
+GF_COMPLEX_RE = re.compile(r"Product|Sum|[Cc]ontinued fraction|[Hh]ypergeometric|[Mm]atrix|\.\.\.|[Ss]eries")
+
+_COEF = r"(?:\d+|n|\(\s*n\s*[+-]\s*\d+\s*\)|\(\s*\d+\s*\*\s*n\s*[+-]\s*\d+\s*\))"
+_TERM = rf"(?:(?:{_COEF}\s*\*\s*)*a\(\s*n\s*-\s*\d+\s*\)|\d+)"
+_CONDITION = r"(?:for|with|and|where|if|n\s*(?:>|>=)\s*\d+|a\(\s*\d+\s*\)\s*=\s*-?\d+)"
+RECURRENCE_RE = re.compile(
+    rf"a\(n\)\s*=\s*[+-]?\s*{_TERM}(?:\s*[+-]\s*{_TERM})*(?:[\s,;]+{_CONDITION})*\s*\.?\s*$")
+CLOSED_FORM_RE = re.compile(r"a\(n\)\s*=\s*((?:[0-9n+\-*/^()!,\s]|binomial|floor|ceiling)+?)\s*\.?\s*$")
+_VARIABLE_N_RE = re.compile(r"(?<![a-z])n(?![a-z])")
+
+
+def classify_formula_kind(formula):
+    """
+    返回公式的规则形式（gf / gf_complex / egf / egf_complex / recurrence / closed_form），无法确定时返回 None
+    """
+    if formula.startswith("a(n)"):
+        if "a(n-" in formula.replace(" ", ""):
+            return "recurrence" if RECURRENCE_RE.match(formula) else None
+        match = CLOSED_FORM_RE.match(formula)
+        if match and _VARIABLE_N_RE.search(match.group(1)):
+            return "closed_form"
+        return None
+    if GF_RE.match(formula):
+        return "gf_complex" if GF_COMPLEX_RE.search(formula) else "gf"
+    if EGF_RE.match(formula):
+        return "egf_complex" if GF_COMPLEX_RE.search(formula) else "egf"
+    return None
+
+
+def rule_formula(formula, formula_type):
+    """规则分类得到的单个公式，字段与模型返回的 extracted_formulas 元素相同"""
+    return {
+        "formula_text": formula,
+        "formula_type": formula_type,
+        "formula_latex": "",
+        "confidence": RULE_CONFIDENCE
+    }
+
+
+def split_by_rules(formulas, kinds, taxonomy):
+    """
+    按分类方案的 rule_types 把公式分成 (规则识别的公式结果列表, 剩余公式列表)
+    """
+    rule_types = taxonomy.rule_types
+    classified = []
+    remaining = []
+    for formula, kind in zip(formulas, kinds):
+        formula_type = rule_types.get(kind) if kind else None
+        if formula_type is None:
+            remaining.append(formula)
+        else:
+            classified.append(rule_formula(formula, formula_type))
+    return classified, remaining
+
+
+def open_rule_store(rule_results_dir, reset=False):
+    """
+    打开规则结果存储（JSONL 后端，按序列ID索引）；reset=True 时先清空上一次生成请求时的规则结果
+    """
+    store_dir = os.path.join(rule_results_dir, "results_jsonl")
+    if reset and os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    return open_result_store(rule_results_dir, "jsonl")
+
+
+class RuleMergingResultStore:
+    """
+    包装一个 ResultStore：写入模型结果时合并同一序列中规则已识别的公式（rules_partial），其余操作原样转发
+
+    规则结果按生成请求时记录的 rule_positions 插回原来的位置（没有下标的旧规则结果放在最前面）；
+    规则结果保存在单独的存储中，重复下载同一结果不会重复合并
+    """
+
+    def __init__(self, store, rule_store):
+        self.store = store
+        self.rule_store = rule_store
+
+    def add(self, sequence_id, result, task=""):
+        partial = self.rule_store.get(sequence_id)
+        if partial is not None and isinstance(result, dict):
+            formulas = result.get('extracted_formulas')
+            formulas = list(formulas) if isinstance(formulas, list) else []
+            classified = partial.get('extracted_formulas', [])
+            positions = partial.get('rule_positions')
+            if positions is None:
+                formulas = classified + formulas
+            else:
+                for position, formula in zip(positions, classified):
+                    formulas.insert(position, formula)
+            result = dict(result, extracted_formulas=formulas)
+        self.store.add(sequence_id, result, task)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def materialize_rule_results(rule_store, store):
+    """把完全由规则分类的序列（task="rules"）写入结果存储，返回序列数"""
+    count = 0
+    for sequence_id, task, result in rule_store.iter_results():
+        if task == RULE_TASK:
+            store.add(sequence_id, result, RULE_TASK)
+            count += 1
+    return count
+
+
+def measure_coverage(formulas, taxonomy):
+    """返回 (各公式类型的规则识别数, 未识别数, 每秒分类的公式数)"""
+    start = time.perf_counter()
+    kinds = [classify_formula_kind(formula) for formula in formulas]
+    elapsed = time.perf_counter() - start
+    type_counts = Counter(taxonomy.rule_types[kind] for kind in kinds if kind in taxonomy.rule_types)
+    remaining = len(formulas) - sum(type_counts.values())
+    return type_counts, remaining, len(formulas) / elapsed if elapsed > 0 else float("inf")
+
+
+if __name__ == "__main__":
+    from oeis_classfy.submit_pipeline import read_json_files, read_jsonl_dataset
+
+    parser = argparse.ArgumentParser(description="统计规则快速分类对语料的覆盖率和速度")
+    parser.add_argument("input_dir", help="data_onlyclean_json.py 的输出目录")
+    parser.add_argument("--input-format", choices=["json", "jsonl"], default="json")
+    parser.add_argument("--taxonomy", choices=list_taxonomies(), default=DEFAULT_TAXONOMY, help="分类方案")
+    args = parser.parse_args()
+
+    taxonomy = get_taxonomy(args.taxonomy)
+    records = read_jsonl_dataset(args.input_dir) if args.input_format == "jsonl" else read_json_files(args.input_dir)
+    sequences = [record for record in records if isinstance(record.get('formulas'), list) and record['formulas']]
+    formulas = [formula for record in sequences for formula in record['formulas']]
+
+    type_counts, remaining, rate = measure_coverage(formulas, taxonomy)
+    fully_classified = sum(
+        1 for record in sequences
+        if all(taxonomy.rule_types.get(classify_formula_kind(formula)) for formula in record['formulas']))
+
+    total = len(formulas)
+    print(f"📊 {len(sequences)} 个序列，{total} 个公式，规则分类速度 {rate:,.0f} 公式/秒")
+    for formula_type, count in type_counts.most_common():
+        print(f"    {formula_type}: {count} ({round(count / total * 100, 2)}%)")
+    print(f"    交给模型: {remaining} ({round(remaining / total * 100, 2) if total else 0}%)")
+    print(f"📦 所有公式都被规则识别、无需请求的序列: {fully_classified} "
+          f"({round(fully_classified / len(sequences) * 100, 2) if sequences else 0}%)")
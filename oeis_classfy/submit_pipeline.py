@@ -0,0 +1,899 @@
+"""
+Batch 请求的生成、验证和提交流程，所有分类方案共用（分类方案见 taxonomy.py）
+"""
+
+import os
+import json
+import argparse
+import contextlib
+import time
+import bisect
+import hashlib
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from oeis_classfy.json_backend import loads, dumps, dumps_bytes, decode_request, SchemaError
+from oeis_classfy.taxonomy import DEFAULT_TAXONOMY, get_taxonomy, list_taxonomies, namespace_custom_id
+from oeis_classfy.zhipu_client import get_client
+from oeis_classfy.response_cache import ResponseCache, prompt_version, cache_key
+from oeis_classfy.formula_dedupe import FormulaDedupeIndex
+from oeis_classfy.rule_classifier import (classify_formula_kind, split_by_rules, open_rule_store,
+                                          RULE_TASK, RULE_PARTIAL_TASK)
+
+
+class ProgressReporter:
+    """
+    限频的进度输出：最多每 interval 秒打印一次，代替逐文件 print
+    """
+
+    def __init__(self, label, interval=2.0):
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+
+    def update(self, n=1):
+        self.count += n
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            rate = self.count / (now - self.start_time)
+            print(f"📊 {self.label}: {self.count} ({rate:.0f}/秒)")
+
+    def finish(self):
+        elapsed = time.monotonic() - self.start_time
+        print(f"📊 {self.label}: 共 {self.count}，用时 {elapsed:.1f} 秒")
+
+
+def iter_json_files(input_dir):
+    """
+    使用 os.scandir 递归地按名称顺序逐个产出JSON文件路径，不构建完整列表
+    """
+    with os.scandir(input_dir) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+
+    for entry in entries:
+        if entry.is_dir():
+            yield from iter_json_files(entry.path)
+        elif entry.name.endswith('.json'):
+            yield entry.path
+
+
+def find_all_json_files(input_dir):
+    """
+    递归查找所有JSON文件
+    """
+    print(f"🔍 开始在目录中搜索JSON文件: {input_dir}")
+    json_files = list(iter_json_files(input_dir))
+    print(f"✅ 总共找到 {len(json_files)} 个JSON文件")
+    return json_files
+
+
+def read_json_files(input_dir):
+    """
+    边遍历目录边读取JSON文件，每次产出一个序列的数据；读取失败的文件打印错误后跳过
+    """
+    for json_file_path in iter_json_files(input_dir):
+        try:
+            with open(json_file_path, 'rb') as f:
+                yield loads(f.read())
+        except Exception as e:
+            print(f"  ❌ 读取文件 {json_file_path} 时出错: {e}")
+
+
+def find_all_jsonl_shards(input_dir):
+    """
+    查找 data_onlyclean_json.py 以 jsonl 格式输出的所有分片文件
+    """
+    shard_files = sorted(
+        os.path.join(input_dir, f) for f in os.listdir(input_dir)
+        if f.startswith("formulas_") and f.endswith(".jsonl")
+    )
+    print(f"✅ 在 {input_dir} 中找到 {len(shard_files)} 个JSONL分片")
+    return shard_files
+
+
+def read_jsonl_dataset(input_dir):
+    """
+    逐行读取 jsonl 分片数据集，每次产出一个序列的数据（每个分片只打开一次）
+    """
+    for shard_path in find_all_jsonl_shards(input_dir):
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield loads(line)
+
+
+REQUEST_MODEL = "glm-4-flash"  # 请求使用的模型，同时是响应缓存键的一部分
+
+PACKED_ID_PREFIX = "pack-"  # 打包请求的 custom_id 前缀，格式: pack-{请求序号}-{序列ID}_{序列ID}_...
+MAX_CUSTOM_ID_LENGTH = 64  # Batch 接口对 custom_id 的长度上限；打包请求的 custom_id 将要超出时先写出已累积的序列
+
+# 打包模式追加到 system prompt 末尾的输出格式说明
+PACKED_PROMPT_SUFFIX = """
+
+注意：用户消息中可能包含多个序列（每个以 "Sequence ID:" 开头）。
+此时请输出一个JSON对象，只包含一个字段 "results"：它是一个列表，
+每个序列对应一个元素，元素格式与上面单个序列的输出格式完全相同（包含 "sequence_id" 和 "extracted_formulas"）。"""
+
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 数（公式文本大约每 3 个字符一个 token）"""
+    return len(text) // 3 + 1
+
+
+def format_sequence_block(sequence_id, formulas):
+    """构建单个序列的用户消息文本"""
+    return f"Sequence ID: {sequence_id}\nFormulas to classify:\n" + "\n".join(
+        [f"{i + 1}. {formula}" for i, formula in enumerate(formulas)])
+
+
+def encode_request(template, custom_id, user_prompt):
+    """把 custom_id 和用户消息拼接进 build_request_template 返回的模板"""
+    template_head, template_middle, template_tail = template
+    return b"".join((
+        template_head,
+        dumps_bytes(custom_id),
+        template_middle,
+        dumps_bytes(user_prompt),
+        template_tail
+    ))
+
+
+SHARD_MANIFEST_SUFFIX = ".manifest.json"  # 分片旁路清单文件后缀
+
+
+def shard_manifest_path(jsonl_file_path):
+    """返回分片对应的旁路清单文件路径"""
+    return jsonl_file_path + SHARD_MANIFEST_SUFFIX
+
+
+def write_shard_manifest(jsonl_file_path, request_count, sha256, first_custom_id, last_custom_id, schema_checked):
+    """写出分片的旁路清单，记录文件当前的大小和修改时间用于判断清单是否过期"""
+    st = os.stat(jsonl_file_path)
+    manifest = {
+        "shard": os.path.basename(jsonl_file_path),
+        "request_count": request_count,
+        "byte_size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256,
+        "first_custom_id": first_custom_id,
+        "last_custom_id": last_custom_id,
+        "schema_checked": schema_checked
+    }
+    with open(shard_manifest_path(jsonl_file_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+class BatchShardWriter:
+    """
+    按请求数和文件大小自动分片写出 batch 请求 JSONL，第一个文件在写入第一个请求时才创建
+
+    写入时同步计算每个分片的请求数、SHA-256 和 custom_id 范围，关闭分片时写出旁路清单，
+    提交阶段据此跳过重新解析（请求由固定模板生成，必需字段在写入时即已保证）
+    """
+
+    def __init__(self, output_dir, max_requests_per_file=50000, max_file_size_mb=100):
+        self.output_dir = output_dir
+        self.max_requests_per_file = max_requests_per_file
+        self.max_file_size = max_file_size_mb * 1024 * 1024
+        self.jsonl_files = []
+        self.total_requests = 0
+        self._f_out = None
+        self._current_requests = 0
+        self._current_size = 0
+        self._current_hash = None
+        self._first_custom_id = None
+        self._last_custom_id = None
+
+    def _close_current(self):
+        self._f_out.close()
+        write_shard_manifest(self.jsonl_files[-1], self._current_requests, self._current_hash.hexdigest(),
+                             self._first_custom_id, self._last_custom_id, schema_checked=True)
+        print(f"✅ 已创建: {self.jsonl_files[-1]} (包含 {self._current_requests} 个请求, "
+              f"{self._current_size / 1024 / 1024:.2f} MB)")
+
+    def write(self, request_bytes, custom_id):
+        if len(custom_id) > MAX_CUSTOM_ID_LENGTH:
+            raise ValueError(f"custom_id 超过 {MAX_CUSTOM_ID_LENGTH} 个字符: {custom_id}")
+        request_size = len(request_bytes)
+
+        # 检查是否需要创建新文件
+        if (self._f_out is None or self._current_requests >= self.max_requests_per_file or
+                (self._current_size + request_size) > self.max_file_size):
+            if self._f_out is not None:
+                self._close_current()
+
+            # 创建新文件
+            jsonl_file_path = os.path.join(self.output_dir, f"batch_requests_{len(self.jsonl_files) + 1}.jsonl")
+            self._f_out = open(jsonl_file_path, 'wb')
+            self.jsonl_files.append(jsonl_file_path)
+            self._current_requests = 0
+            self._current_size = 0
+            self._current_hash = hashlib.sha256()
+            self._first_custom_id = custom_id
+            print(f"📝 开始创建JSONL文件: {jsonl_file_path}")
+
+        # 写入请求
+        line = request_bytes + b'\n'
+        self._f_out.write(line)
+        self._current_hash.update(line)
+        self._last_custom_id = custom_id
+        self._current_requests += 1
+        self._current_size += request_size
+        self.total_requests += 1
+
+    def close(self):
+        if self._f_out is not None:
+            self._close_current()
+            self._f_out = None
+
+
+def build_request_template(system_prompt, max_tokens=2000):
+    """
+    预先序列化请求体模板，返回 UTF-8 编码的 (头部, 中部, 尾部) 三段字节
+
+    请求 = 头部 + custom_id 的JSON字符串 + 中部 + 用户消息的JSON字符串 + 尾部，
+    拼接结果与用 json_backend.dumps 序列化完整请求体完全一致（custom_id 和用户消息也必须用同一后端编码）。
+    """
+    custom_id_placeholder = "__CUSTOM_ID__"
+    user_prompt_placeholder = "__USER_PROMPT__"
+
+    # 构造请求体
+    request_body = {
+        "custom_id": custom_id_placeholder,
+        "method": "POST",
+        "url": "/v4/chat/completions",
+        "body": {
+            "model": REQUEST_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt_placeholder}
+            ],
+            "temperature": 0.1,
+            "max_tokens": max_tokens,
+            "response_format": {"type": "json_object"}
+        }
+    }
+
+    template = dumps(request_body)
+    head, rest = template.split(dumps(custom_id_placeholder), 1)
+    middle, tail = rest.split(dumps(user_prompt_placeholder), 1)
+    return head.encode('utf-8'), middle.encode('utf-8'), tail.encode('utf-8')
+
+
+class TaxonomyRequestBuilder:
+    """
+    一种分类方案的请求生成器：持有该方案预编码的请求模板、分片写出器和打包缓冲区
+
+    namespace=True 时 custom_id 带上 "{分类方案名}:" 前缀（见 taxonomy.namespace_custom_id），
+    同一份语料生成的多套请求的结果可以互相区分。
+    指定 cache（ResponseCache）时只为缓存未命中的序列生成请求；
+    指定 rule_store（规则结果存储）且分类方案有 rule_types 时，规则能识别的公式不再发给模型（见 rule_classifier.py）；
+    指定 dedupe（FormulaDedupeIndex）时，规则之外的公式只随第一次出现的序列发送（见 formula_dedupe.py）
+    """
+
+    def __init__(self, taxonomy, output_dir, max_requests_per_file=50000, max_file_size_mb=100,
+                 pack_token_budget=0, pack_max_sequences=20, pack_max_tokens=4000, namespace=False, cache=None,
+                 rule_store=None, dedupe=None):
+        self.taxonomy = get_taxonomy(taxonomy)
+        self.output_dir = output_dir
+        self.namespace = namespace
+        self.pack_token_budget = pack_token_budget
+        self.pack_max_sequences = pack_max_sequences
+        self.cache = cache
+        self.cache_hits = 0
+        self.rule_store = rule_store if self.taxonomy.rule_types else None
+        self.rule_formulas = 0
+        self.rule_sequences = 0
+        self.dedupe = dedupe
+        self.dedupe_sequences = 0
+        if dedupe is not None:
+            dedupe.begin_build(self.taxonomy.name)
+        if cache is not None:
+            self.prompt_version = prompt_version(self.taxonomy.system_prompt)
+            cache.begin_build(self.taxonomy.name)
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # 预先序列化请求模板，循环中只拼接 custom_id 和用户消息
+        system_prompt = self.taxonomy.system_prompt
+        self.template = build_request_template(system_prompt)
+        self.packed_template = build_request_template(system_prompt + PACKED_PROMPT_SUFFIX, max_tokens=pack_max_tokens)
+        self.writer = BatchShardWriter(output_dir, max_requests_per_file, max_file_size_mb)
+
+        # 打包模式下等待合并的序列
+        self.pending_ids = []
+        self.pending_blocks = []
+        self.pending_tokens = 0
+        self.packed_sequences = 0
+
+    def _custom_id(self, custom_id):
+        return namespace_custom_id(self.taxonomy.name, custom_id) if self.namespace else custom_id
+
+    @property
+    def uses_rules(self):
+        return self.rule_store is not None
+
+    def add(self, sequence_id, user_prompt, block_tokens=0, formulas=None, kinds=None):
+        """
+        加入一个序列的用户消息；block_tokens 为打包模式下估算的 token 数，
+        使用规则分类或公式去重时 formulas 为该序列的公式，kinds 为其规则形式（classify_formula_kind）
+        """
+        send = formulas
+        positions = None
+        rule_partial = None
+        if self.rule_store is not None and kinds is not None:
+            classified, remaining = split_by_rules(formulas, kinds, self.taxonomy)
+            if classified:
+                self.rule_formulas += len(classified)
+                result = {"sequence_id": sequence_id, "extracted_formulas": classified}
+                if not remaining:
+                    self.rule_store.add(sequence_id, result, RULE_TASK)
+                    self.rule_sequences += 1
+                    return
+                # 只把规则无法识别的公式发给模型，下载时再按下标与规则结果合并
+                rule_partial = result
+                send = remaining
+                rule_types = self.taxonomy.rule_types
+                rule_positions = [i for i, kind in enumerate(kinds) if kind and rule_types.get(kind)]
+                positions = [i for i, kind in enumerate(kinds) if not (kind and rule_types.get(kind))]
+
+        duplicate_positions = []
+        all_duplicates = False
+        if self.dedupe is not None and formulas is not None:
+            # 之前的序列已经发送过的公式不再发送，下载时从 owner 的结果展开
+            unique = self.dedupe.assign(self.taxonomy.name, sequence_id, send, positions)
+            all_duplicates = not unique
+            if len(unique) < len(send):
+                kept = {position for position, _ in unique}
+                duplicate_positions = [p for p in (positions if positions is not None else range(len(send)))
+                                       if p not in kept]
+                send = [formula for _, formula in unique]
+
+        if rule_partial is not None:
+            # 规则结果的下标按去掉重复公式后的列表计算：合并模型结果时插入规则结果，展开去重标签时再插入重复公式
+            rule_partial["rule_positions"] = [p - bisect.bisect_left(duplicate_positions, p) for p in rule_positions]
+            self.rule_store.add(sequence_id, rule_partial, RULE_PARTIAL_TASK)
+
+        if all_duplicates:
+            self.dedupe_sequences += 1
+            return
+
+        if send is not formulas:
+            user_prompt = format_sequence_block(sequence_id, send)
+            if self.pack_token_budget > 0:
+                block_tokens = estimate_tokens(user_prompt)
+
+        if self.cache is not None:
+            key = cache_key(REQUEST_MODEL, self.taxonomy.name, self.prompt_version, user_prompt)
+            if self.cache.lookup(self.taxonomy.name, sequence_id, key):
+                self.cache_hits += 1
+                return
+
+        if self.pack_token_budget <= 0:
+            # 把 custom_id 和用户消息拼接进预编码的请求模板
+            custom_id = self._custom_id(f"request-{self.writer.total_requests}-{sequence_id}")
+            self.writer.write(encode_request(self.template, custom_id, user_prompt), custom_id)
+            return
+
+        # 打包模式：超出 token 预算、序列数上限或 custom_id 长度上限时先写出已累积的序列
+        if self.pending_ids and (self.pending_tokens + block_tokens > self.pack_token_budget or
+                                 len(self.pending_ids) >= self.pack_max_sequences or
+                                 len(self._packed_custom_id(self.pending_ids + [sequence_id])) > MAX_CUSTOM_ID_LENGTH):
+            self.flush_pending()
+
+        self.pending_ids.append(sequence_id)
+        self.pending_blocks.append(user_prompt)
+        self.pending_tokens += block_tokens
+
+    def _packed_custom_id(self, sequence_ids):
+        return self._custom_id(f"{PACKED_ID_PREFIX}{self.writer.total_requests}-{'_'.join(sequence_ids)}")
+
+    def flush_pending(self):
+        if not self.pending_ids:
+            return
+        custom_id = self._packed_custom_id(self.pending_ids)
+        self.writer.write(encode_request(self.packed_template, custom_id, "\n\n".join(self.pending_blocks)), custom_id)
+        self.packed_sequences += len(self.pending_ids)
+        self.pending_ids.clear()
+        self.pending_blocks.clear()
+        self.pending_tokens = 0
+
+    def close(self):
+        """写出剩余的打包请求并关闭最后一个分片，返回 (JSONL文件列表, 请求数)"""
+        self.flush_pending()
+        self.writer.close()
+
+        if self.rule_store is not None:
+            self.rule_store.flush()
+            print(f"⚡ 规则分类识别 {self.rule_formulas} 个公式，其中 {self.rule_sequences} 个序列无需请求")
+        if self.dedupe is not None:
+            self.dedupe.flush()
+            report = self.dedupe.build_report(self.taxonomy.name)
+            with open(os.path.join(self.output_dir, "dedupe_report.json"), 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"🔁 公式去重: {report['formula_occurrences']} 个公式 -> {report['unique_formulas']} 个唯一公式，"
+                  f"去重率 {report['dedupe_ratio']:.1%}，其中 {report['skipped_sequences']} 个序列无需请求")
+            if report['clustered_formulas']:
+                print(f"🧩 其中 {report['clustered_formulas']} 个公式按近似簇合并到代表公式（见 formula_clustering.py）")
+        if self.cache is not None:
+            self.cache.flush()
+            print(f"🗄️ 响应缓存命中 {self.cache_hits} 个序列，其余序列生成请求")
+
+        if self.writer.total_requests == 0 and (self.cache_hits or self.rule_sequences or self.dedupe_sequences):
+            print("✅ 所有序列都已由规则分类、响应缓存或公式去重得到结果，无需提交")
+            return [], 0
+        if self.writer.total_requests == 0:
+            print("❌ 没有找到任何JSON文件，请检查路径和文件格式")
+            return [], 0
+
+        if self.packed_sequences:
+            print(f"📦 打包模式: {self.packed_sequences} 个序列合并为 {self.writer.total_requests} 个请求")
+        print(f"📊 总共创建 {len(self.writer.jsonl_files)} 个JSONL文件，包含 {self.writer.total_requests} 个请求")
+
+        return self.writer.jsonl_files, self.writer.total_requests
+
+
+def build_requests(input_dir, builders, input_format="json"):
+    """
+    遍历一次语料，把每个序列的用户消息交给所有 builders（TaxonomyRequestBuilder 列表）
+
+    input_format="json" 读取每个序列一个的JSON文件；
+    input_format="jsonl" 直接读取 data_onlyclean_json.py --format jsonl 输出的分片数据集
+    """
+    if input_format == "jsonl":
+        # 逐行读取分片数据集中的序列
+        records = read_jsonl_dataset(input_dir)
+    else:
+        # 边遍历目录边读取JSON文件，第一个分片会立即开始写入
+        records = read_json_files(input_dir)
+
+    pack_tokens = any(builder.pack_token_budget > 0 for builder in builders)
+    use_rules = any(builder.uses_rules for builder in builders)
+    progress = ProgressReporter("已处理序列")
+
+    # 逐个处理序列数据
+    for seq_data in records:
+        progress.update()
+
+        # 检查必要字段
+        if not all(key in seq_data for key in ['sequence_id', 'formulas']):
+            print(f"  ⚠️ 文件缺少必要字段，跳过")
+            continue
+
+        if not isinstance(seq_data['formulas'], list) or len(seq_data['formulas']) == 0:
+            print(f"  ⚠️ {seq_data['sequence_id']} 的formulas字段为空或不是列表，跳过")
+            continue
+
+        # 构建用户消息和公式的规则形式（与分类方案无关，所有 builder 共用）
+        formulas = seq_data['formulas']
+        user_prompt = format_sequence_block(seq_data['sequence_id'], formulas)
+        block_tokens = estimate_tokens(user_prompt) if pack_tokens else 0
+        kinds = [classify_formula_kind(formula) for formula in formulas] if use_rules else None
+
+        for builder in builders:
+            builder.add(seq_data['sequence_id'], user_prompt, block_tokens, formulas, kinds)
+
+    progress.finish()
+
+
+def create_batch_jsonl_with_formula_types(input_dir, output_dir, max_requests_per_file=50000, max_file_size_mb=100,
+                                          input_format="json", pack_token_budget=0, pack_max_sequences=20,
+                                          pack_max_tokens=4000, taxonomy=DEFAULT_TAXONOMY, response_cache=None,
+                                          rule_results_dir=None, dedupe_index=None):
+    """
+    创建多个Batch API所需的JSONL文件，自动分片
+
+    taxonomy 为分类方案名称或 Taxonomy 对象，决定请求中的 system prompt
+    response_cache 为响应缓存数据库路径（见 response_cache.py），指定时只为缓存未命中的序列生成请求
+    rule_results_dir 为规则分类结果目录（见 rule_classifier.py），指定时规则能识别的公式不发给模型
+    dedupe_index 为公式去重索引数据库路径（见 formula_dedupe.py），指定时相同的公式只发送一次
+
+    input_format="json" 读取每个序列一个的JSON文件；
+    input_format="jsonl" 直接读取 data_onlyclean_json.py --format jsonl 输出的分片数据集
+    pack_token_budget > 0 时启用打包模式：把多个序列合并到一个请求中，
+    每个请求的用户消息不超过该 token 预算（估算值）且最多 pack_max_sequences 个序列，
+    custom_id 为 pack-{序号}-{序列ID}_{序列ID}_...（不超过 MAX_CUSTOM_ID_LENGTH 个字符），由 process_results 拆回单个序列
+    """
+    with contextlib.ExitStack() as stack:
+        cache = stack.enter_context(ResponseCache(response_cache)) if response_cache else None
+        rule_store = stack.enter_context(open_rule_store(rule_results_dir, reset=True)) if rule_results_dir else None
+        dedupe = stack.enter_context(FormulaDedupeIndex(dedupe_index)) if dedupe_index else None
+        builder = TaxonomyRequestBuilder(taxonomy, output_dir, max_requests_per_file, max_file_size_mb,
+                                         pack_token_budget, pack_max_sequences, pack_max_tokens, cache=cache,
+                                         rule_store=rule_store, dedupe=dedupe)
+        build_requests(input_dir, [builder], input_format)
+        return builder.close()
+
+
+def create_batch_jsonl_multi_taxonomy(input_dir, output_dir, taxonomies, max_requests_per_file=50000,
+                                      max_file_size_mb=100, input_format="json", pack_token_budget=0,
+                                      pack_max_sequences=20, pack_max_tokens=4000, response_cache=None,
+                                      rule_results_dir=None, dedupe_index=None):
+    """
+    只遍历一次语料，同时为多种分类方案生成请求
+
+    每种方案的分片写入 output_dir/{分类方案名}/，custom_id 带 "{分类方案名}:" 命名空间前缀；
+    其余参数与 create_batch_jsonl_with_formula_types 相同（各分类方案共用同一个响应缓存和公式去重索引，
+    规则分类结果写入 rule_results_dir/{分类方案名}/）。
+    返回 {分类方案名: (JSONL文件列表, 请求数)}
+    """
+    with contextlib.ExitStack() as stack:
+        cache = stack.enter_context(ResponseCache(response_cache)) if response_cache else None
+        dedupe = stack.enter_context(FormulaDedupeIndex(dedupe_index)) if dedupe_index else None
+        builders = []
+        for taxonomy in taxonomies:
+            name = get_taxonomy(taxonomy).name
+            rule_store = (stack.enter_context(open_rule_store(os.path.join(rule_results_dir, name), reset=True))
+                          if rule_results_dir else None)
+            builders.append(TaxonomyRequestBuilder(taxonomy, os.path.join(output_dir, name),
+                                                   max_requests_per_file, max_file_size_mb, pack_token_budget,
+                                                   pack_max_sequences, pack_max_tokens, namespace=True, cache=cache,
+                                                   rule_store=rule_store, dedupe=dedupe))
+        build_requests(input_dir, builders, input_format)
+
+        results = {}
+        for builder in builders:
+            print(f"\n🏷️ 分类方案 {builder.taxonomy.name}:")
+            results[builder.taxonomy.name] = builder.close()
+        return results
+
+
+def validate_jsonl_file(file_path):
+    """验证JSONL文件格式"""
+    print(f"🔍 验证JSONL文件: {file_path}")
+    line_count = 0
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    # 解析并检查必需字段
+                    decode_request(line)
+                    line_count += 1
+                except SchemaError as e:
+                    print(f"❌ 第 {i} 行缺少必需字段: {e}")
+                    return False
+                except ValueError as e:
+                    print(f"❌ 第 {i} 行JSON格式错误: {e}")
+                    return False
+    except Exception as e:
+        print(f"❌ 读取文件时出错: {e}")
+        return False
+
+    print(f"✅ JSONL文件验证通过，包含 {line_count} 个有效请求")
+    return line_count > 0  # 确保文件不为空
+
+
+def load_shard_manifest(jsonl_file_path):
+    """
+    读取分片的旁路清单；清单不存在、损坏或与文件当前大小/修改时间不一致（已过期）时返回 None
+    """
+    manifest_path = shard_manifest_path(jsonl_file_path)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        st = os.stat(jsonl_file_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    if manifest.get("byte_size") != st.st_size or manifest.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return manifest
+
+
+def stream_validate_jsonl_file(file_path):
+    """
+    流式验证JSONL文件（二进制读取，不做逐行 strip/解码），同时重新生成旁路清单
+
+    返回新的清单，验证失败返回 None
+    """
+    sha256 = hashlib.sha256()
+    request_count = 0
+    first_custom_id = None
+    last_custom_id = None
+
+    try:
+        with open(file_path, 'rb') as f:
+            for i, line in enumerate(f, 1):
+                sha256.update(line)
+                if not line.strip():
+                    continue
+                try:
+                    custom_id = decode_request(line)
+                except SchemaError as e:
+                    print(f"❌ 第 {i} 行缺少必需字段: {e}")
+                    return None
+                except ValueError as e:
+                    print(f"❌ 第 {i} 行JSON格式错误: {e}")
+                    return None
+                if first_custom_id is None:
+                    first_custom_id = custom_id
+                last_custom_id = custom_id
+                request_count += 1
+    except OSError as e:
+        print(f"❌ 读取文件时出错: {e}")
+        return None
+
+    if request_count == 0:
+        return None
+    return write_shard_manifest(file_path, request_count, sha256.hexdigest(), first_custom_id, last_custom_id,
+                                schema_checked=True)
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """按块计算文件的 sha256"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def verify_batch_shard(jsonl_file_path):
+    """
+    提交前检查分片：有匹配的旁路清单时只重新计算 sha256 与清单核对（跳过逐行解析），
+    清单缺失、过期或 sha256 不一致时回退到流式验证
+    """
+    manifest = load_shard_manifest(jsonl_file_path)
+    if manifest is not None and manifest.get("schema_checked") and manifest.get("request_count", 0) > 0:
+        try:
+            sha256 = file_sha256(jsonl_file_path)
+        except OSError as e:
+            print(f"❌ 读取文件时出错: {e}")
+            return False
+        if sha256 == manifest.get("sha256"):
+            print(f"✅ 使用旁路清单跳过验证: {os.path.basename(jsonl_file_path)} "
+                  f"({manifest['request_count']} 个请求, {manifest['first_custom_id']} ~ {manifest['last_custom_id']})")
+            return True
+        print(f"⚠️ 文件内容与旁路清单的 sha256 不一致: {os.path.basename(jsonl_file_path)}")
+
+    print(f"🔍 清单缺失、已过期或校验失败，流式验证JSONL文件: {jsonl_file_path}")
+    manifest = stream_validate_jsonl_file(jsonl_file_path)
+    if manifest is None:
+        return False
+    print(f"✅ JSONL文件验证通过，包含 {manifest['request_count']} 个有效请求")
+    return True
+
+
+def submit_batch_task_with_retry(jsonl_file_path, max_retries=3, taxonomy=DEFAULT_TAXONOMY):
+    """带重试机制的任务提交"""
+    client = get_client()
+    label = get_taxonomy(taxonomy).label
+    for attempt in range(max_retries):
+        try:
+            print(f"🔄 尝试 {attempt + 1}/{max_retries}: 上传文件 {os.path.basename(jsonl_file_path)}")
+
+            # 上传文件
+            with open(jsonl_file_path, "rb") as f:
+                upload_result = client.files.create(file=f, purpose="batch")
+            file_id = upload_result.id
+            print(f"  ✅ 文件上传成功，ID: {file_id}")
+
+            # 创建Batch任务
+            batch_create_result = client.batches.create(
+                input_file_id=file_id,
+                endpoint="/v4/chat/completions",
+                completion_window="24h",
+                metadata={
+                    "description": f"OEIS公式分类任务（{label}）" if label else "OEIS公式分类任务",
+                    "original_filename": os.path.basename(jsonl_file_path)
+                }
+            )
+
+            batch_id = batch_create_result.id
+            print(f"  ✅ Batch任务创建成功，ID: {batch_id}")
+            return batch_id
+
+        except Exception as e:
+            print(f"  ❌ 尝试 {attempt + 1} 失败: {e}")
+            if attempt < max_retries - 1:
+                wait_time = 5 * (attempt + 1)  # 递增等待时间
+                print(f"  ⏳ 等待 {wait_time} 秒后重试...")
+                time.sleep(wait_time)
+
+    return None
+
+
+def validate_and_submit(jsonl_file_path, taxonomy=DEFAULT_TAXONOMY):
+    """验证并提交单个JSONL文件，成功返回任务ID，失败返回 None"""
+    # 验证文件格式（优先使用写入时生成的旁路清单）
+    if not verify_batch_shard(jsonl_file_path):
+        print(f"  ⚠️ 文件验证失败，跳过: {jsonl_file_path}")
+        return None
+
+    # 提交任务（带重试）
+    batch_id = submit_batch_task_with_retry(jsonl_file_path, taxonomy=taxonomy)
+
+    if batch_id:
+        print(f"  ✅ 成功创建任务: {batch_id} ({os.path.basename(jsonl_file_path)})")
+    else:
+        print(f"  ❌ 所有重试均失败: {jsonl_file_path}")
+    return batch_id
+
+
+def submit_batch_tasks(jsonl_files, task_id_file, max_workers=1, taxonomy=DEFAULT_TAXONOMY, append=False):
+    """
+    提交多个批量任务并保存所有任务ID
+
+    max_workers > 1 时使用线程池并发验证、上传和创建任务，
+    保存到 task_id_file 的任务ID顺序仍与 jsonl_files 的顺序一致；
+    append=True 时追加到 task_id_file 末尾（如重试任务），否则覆盖
+    """
+    if max_workers > 1:
+        print(f"\n📋 并发提交 {len(jsonl_files)} 个文件（并发数 {max_workers}）")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map 按输入顺序返回结果
+            batch_ids = list(executor.map(partial(validate_and_submit, taxonomy=taxonomy), jsonl_files))
+    else:
+        batch_ids = []
+        for i, jsonl_file_path in enumerate(jsonl_files, 1):
+            print(f"\n📋 处理文件 {i}/{len(jsonl_files)}: {os.path.basename(jsonl_file_path)}")
+            batch_ids.append(validate_and_submit(jsonl_file_path, taxonomy))
+
+    task_ids = [batch_id for batch_id in batch_ids if batch_id]
+    successful_files = len(task_ids)
+
+    # 保存所有任务ID到文件
+    if task_ids:
+        with open(task_id_file, 'a' if append else 'w') as f:
+            for task_id in task_ids:
+                f.write(task_id + '\n')
+
+        print(f"\n📝 成功创建 {successful_files} 个任务，ID已保存到: {task_id_file}")
+    else:
+        print("\n❌ 未能创建任何任务")
+
+    return task_ids
+
+
+def run_submit(input_directory, output_directory, task_id_file, taxonomy=DEFAULT_TAXONOMY, input_format="json",
+               pack_token_budget=0, submit_concurrency=4, response_cache=None, rule_results_dir=None,
+               dedupe_index=None):
+    """
+    完整的提交流程: 创建JSONL请求文件 -> 提交所有任务 -> 打印摘要，供各分类方案的入口脚本调用
+
+    response_cache 为响应缓存数据库路径，指定时只提交缓存未命中的序列
+    （下载时传入同一路径，命中的结果由下载流程从缓存写入结果存储）；
+    rule_results_dir 为规则分类结果目录、dedupe_index 为公式去重索引路径，下载时同样传入同一路径
+    """
+    print("🚀 开始Batch任务提交流程...")
+
+    # 1. 创建JSONL请求文件
+    print("\n" + "=" * 50)
+    print("步骤1: 创建JSONL请求文件")
+    print("=" * 50)
+    jsonl_files, total_requests = create_batch_jsonl_with_formula_types(
+        input_directory,
+        output_directory,
+        max_requests_per_file=50000,  # 每个文件最多50,000个请求
+        max_file_size_mb=100,  # 每个文件最大100MB
+        input_format=input_format,
+        pack_token_budget=pack_token_budget,
+        taxonomy=taxonomy,
+        response_cache=response_cache,
+        rule_results_dir=rule_results_dir,
+        dedupe_index=dedupe_index
+    )
+
+    if total_requests == 0:
+        if not response_cache and not rule_results_dir and not dedupe_index:
+            print("❌ 没有创建任何请求，请检查JSON文件格式和内容")
+        return []
+
+    # 2. 提交所有任务
+    print("\n" + "=" * 50)
+    print("步骤2: 提交Batch任务")
+    print("=" * 50)
+    task_ids = submit_batch_tasks(jsonl_files, task_id_file, max_workers=submit_concurrency, taxonomy=taxonomy)
+
+    print("\n" + "=" * 50)
+    print("任务提交摘要")
+    print("=" * 50)
+    print(f"• 创建的JSONL文件数: {len(jsonl_files)}")
+    print(f"• 总请求数: {total_requests}")
+    print(f"• 成功创建的任务数: {len(task_ids)}")
+    print(f"• 任务ID文件: {task_id_file}")
+
+    if task_ids:
+        print("\n🎉 任务提交完成！")
+    else:
+        print("\n❌ 任务提交失败，请检查错误信息。")
+
+    return task_ids
+
+
+def run_submit_multi(input_directory, output_directory, taxonomies, task_id_file_pattern="batch_task_ids_{taxonomy}.txt",
+                     input_format="json", pack_token_budget=0, submit_concurrency=4, response_cache=None,
+                     rule_results_dir=None, dedupe_index=None):
+    """
+    对比实验的提交流程: 一次遍历语料生成多种分类方案的请求，再分别提交，
+    每种方案的任务ID保存到 task_id_file_pattern.format(taxonomy=分类方案名)
+
+    返回 {分类方案名: 任务ID列表}
+    """
+    print(f"🚀 开始Batch任务提交流程（分类方案: {', '.join(str(t) for t in taxonomies)}）...")
+
+    # 1. 一次遍历语料，创建所有分类方案的JSONL请求文件
+    print("\n" + "=" * 50)
+    print("步骤1: 创建JSONL请求文件")
+    print("=" * 50)
+    request_sets = create_batch_jsonl_multi_taxonomy(
+        input_directory,
+        output_directory,
+        taxonomies,
+        max_requests_per_file=50000,  # 每个文件最多50,000个请求
+        max_file_size_mb=100,  # 每个文件最大100MB
+        input_format=input_format,
+        pack_token_budget=pack_token_budget,
+        response_cache=response_cache,
+        rule_results_dir=rule_results_dir,
+        dedupe_index=dedupe_index
+    )
+
+    # 2. 分别提交各分类方案的任务
+    all_task_ids = {}
+    for name, (jsonl_files, total_requests) in request_sets.items():
+        print("\n" + "=" * 50)
+        print(f"步骤2: 提交Batch任务（分类方案 {name}）")
+        print("=" * 50)
+        if total_requests == 0:
+            if not response_cache and not rule_results_dir and not dedupe_index:
+                print("❌ 没有创建任何请求，请检查JSON文件格式和内容")
+            all_task_ids[name] = []
+            continue
+        task_id_file = task_id_file_pattern.format(taxonomy=name)
+        all_task_ids[name] = submit_batch_tasks(jsonl_files, task_id_file, max_workers=submit_concurrency,
+                                                taxonomy=name)
+
+    print("\n" + "=" * 50)
+    print("任务提交摘要")
+    print("=" * 50)
+    for name, (jsonl_files, total_requests) in request_sets.items():
+        print(f"• 分类方案 {name}: {len(jsonl_files)} 个JSONL文件, {total_requests} 个请求, "
+              f"{len(all_task_ids[name])} 个任务, 任务ID文件 {task_id_file_pattern.format(taxonomy=name)}")
+
+    return all_task_ids
+
+
+if __name__ == "__main__":
+    # 例: python -m oeis_classfy.submit_pipeline oeis_onlyclean_json --taxonomy 4 --taxonomy 11
+    # API Key 从环境变量 ZHIPUAI_API_KEY 读取
+    parser = argparse.ArgumentParser(description="一次遍历语料，为多种分类方案生成并提交 Batch 请求")
+    parser.add_argument("input_directory", help="data_onlyclean_json.py 的输出目录")
+    parser.add_argument("--taxonomy", action="append", dest="taxonomies", choices=list_taxonomies(),
+                        help="分类方案，可重复指定（默认: 所有已注册的方案）")
+    parser.add_argument("--output", default="batch_requests_multi", help="请求文件目录（每种方案一个子目录）")
+    parser.add_argument("--task-id-file", default="batch_task_ids_{taxonomy}.txt",
+                        help="任务ID文件名模板，{taxonomy} 替换为分类方案名")
+    parser.add_argument("--input-format", choices=["json", "jsonl"], default="json")
+    parser.add_argument("--pack-token-budget", type=int, default=0, help="大于0时启用打包模式")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时上传和创建任务的文件数")
+    parser.add_argument("--cache", metavar="PATH", help="响应缓存数据库，只为未命中的序列生成请求")
+    parser.add_argument("--rules", metavar="DIR",
+                        help="启用规则快速分类，规则结果写入 DIR/{分类方案名}（下载时用 --rules DIR/{分类方案名}）")
+    parser.add_argument("--dedupe", metavar="PATH",
+                        help="公式去重索引数据库，相同的公式只发送一次（下载时用 --dedupe PATH 展开）")
+    parser.add_argument("--build-only", action="store_true", help="只生成请求文件，不提交")
+    args = parser.parse_args()
+
+    taxonomies = args.taxonomies or list_taxonomies()
+    if args.build_only:
+        create_batch_jsonl_multi_taxonomy(args.input_directory, args.output, taxonomies,
+                                          input_format=args.input_format, pack_token_budget=args.pack_token_budget,
+                                          response_cache=args.cache, rule_results_dir=args.rules,
+                                          dedupe_index=args.dedupe)
+    else:
+        run_submit_multi(args.input_directory, args.output, taxonomies, args.task_id_file,
+                         input_format=args.input_format, pack_token_budget=args.pack_token_budget,
+                         submit_concurrency=args.concurrency, response_cache=args.cache,
+                         rule_results_dir=args.rules, dedupe_index=args.dedupe)
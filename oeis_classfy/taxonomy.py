@@ -0,0 +1,189 @@
+"""
+公式分类方案注册表
+
+每种分类方案（Taxonomy）描述: 提示词中列出的公式类型、system prompt、
+结果统计时如何归并类型以及报告中显示的名称。提交和下载流程只依赖这里注册的方案，
+新增一种分类只需要 register_taxonomy(Taxonomy(...))，不必复制整套脚本。
+"""
+
+import json
+
+DEFAULT_TAXONOMY = "4"
+
+TAXONOMIES = {}
+
+# 一次生成多种分类方案的请求时，custom_id 加上 "{分类方案名}:" 前缀以区分命名空间
+CUSTOM_ID_NAMESPACE_SEPARATOR = ":"
+
+
+def build_default_prompt(formula_types):
+    """根据公式类型列表生成通用的 system prompt"""
+    return f"""你是一个专业的数学公式解析器。你的任务是从用户提供的文本中精确识别和提取所有数学公式，并对每个公式进行分类。
+
+请将公式分类为以下类型之一：
+{json.dumps(formula_types, indent=2, ensure_ascii=False)}
+
+最终输出请使用JSON格式，包含以下字段：
+- "sequence_id": 序列ID
+- "extracted_formulas": 列表，每个元素包含:
+  - "formula_text": 原始公式文本
+  - "formula_type": 公式类型
+  - "formula_latex": LaTeX表示(如果适用)
+  - "confidence": 置信度(0-1)
+
+请确保提取和分类尽可能准确。"""
+
+
+class Taxonomy:
+    """
+    一种公式分类方案
+
+    name            注册名（如 "4"、"11"）
+    formula_types   {类型: 提示词中的说明}
+    system_prompt   为空时由 build_default_prompt 生成
+    category_names  {类型: 报告中显示的名称}，为空时直接显示类型名
+    fallback_type   不为空时为"封闭"分类：不在 formula_types 中的类型都归入该类型，
+                    统计按 formula_types 的顺序列出（包括数量为 0 的类型）；
+                    为空时按模型返回的类型原样统计，缺少类型记为 "unknown"
+    label           显示在标题和任务描述中的简称（如 "四大类"）
+    rule_types      {规则形式: 类型}，规则快速分类识别出的公式形式对应的类型（见 rule_classifier.py），
+                    为空时该方案不使用规则分类
+    """
+
+    def __init__(self, name, formula_types, system_prompt=None, category_names=None, fallback_type=None, label="",
+                 rule_types=None):
+        self.name = name
+        self.formula_types = formula_types
+        self.system_prompt = system_prompt or build_default_prompt(formula_types)
+        self.category_names = category_names or {t: t for t in formula_types}
+        self.fallback_type = fallback_type
+        self.label = label
+        self.rule_types = rule_types or {}
+
+    @property
+    def closed(self):
+        return self.fallback_type is not None
+
+    @property
+    def default_type(self):
+        """模型没有给出 formula_type 时使用的类型"""
+        return self.fallback_type or "unknown"
+
+    def normalize_type(self, formula_type):
+        """封闭分类中把未知类型归入 fallback_type，开放分类原样返回"""
+        if self.fallback_type is None or formula_type in self.formula_types:
+            return formula_type
+        return self.fallback_type
+
+    def empty_counts(self):
+        """统计用的初始计数：封闭分类预先列出所有类型"""
+        return {t: 0 for t in self.formula_types} if self.closed else {}
+
+    def __repr__(self):
+        return f"Taxonomy({self.name!r}, {len(self.formula_types)} 种类型)"
+
+
+def register_taxonomy(taxonomy):
+    """注册分类方案（同名时覆盖），返回该方案"""
+    TAXONOMIES[taxonomy.name] = taxonomy
+    return taxonomy
+
+
+def get_taxonomy(taxonomy=None):
+    """按名称获取已注册的分类方案；传入 Taxonomy 对象时原样返回，为空时返回默认方案"""
+    if isinstance(taxonomy, Taxonomy):
+        return taxonomy
+    name = DEFAULT_TAXONOMY if taxonomy is None else str(taxonomy)
+    if name not in TAXONOMIES:
+        raise KeyError(f"未注册的分类方案: {name}（已注册: {', '.join(list_taxonomies())}）")
+    return TAXONOMIES[name]
+
+
+def list_taxonomies():
+    return sorted(TAXONOMIES, key=lambda name: (len(name), name))
+
+
+def namespace_custom_id(taxonomy_name, custom_id):
+    """给 custom_id 加上分类方案命名空间，如 11:request-0-A000045"""
+    return f"{taxonomy_name}{CUSTOM_ID_NAMESPACE_SEPARATOR}{custom_id}"
+
+
+def split_custom_id_namespace(custom_id):
+    """返回 (分类方案名, 去掉命名空间的 custom_id)；没有命名空间时分类方案名为 None"""
+    name, separator, rest = custom_id.partition(CUSTOM_ID_NAMESPACE_SEPARATOR)
+    return (name, rest) if separator else (None, custom_id)
+
+
+# 简化的四大类分类
+FOUR_CLASS_TYPES = {
+    "closed_form": "通项公式 (closed form)",
+    "recurrence": "递推公式 (recurrence relation)",
+    "generating_function": "生成函数 (generating function)",
+    "other": "其他类型 (other)"
+}
+
+register_taxonomy(Taxonomy(
+    "4",
+    FOUR_CLASS_TYPES,
+    system_prompt=f"""你是一个专业的数学公式解析器。你的任务是从用户提供的文本中精确识别和提取所有数学公式，并对每个公式进行分类。
+
+请将公式分类为以下四种类型之一：
+{json.dumps(FOUR_CLASS_TYPES, indent=2, ensure_ascii=False)}
+
+分类指南：
+1. 通项公式 (closed_form): 直接给出第n项的表达式，如 F(n) = φ^n/√5 - (1-φ)^n/√5
+2. 递推公式 (recurrence): 描述项与项之间关系的公式，如 F(n) = F(n-1) + F(n-2)
+3. 生成函数 (generating_function): 以幂级数形式表示序列的函数，如 G.f.: x/(1-x-x^2)
+4. 其他 (other): 不属于以上三类的任何公式，如矩阵形式、恒等式、连分数等
+
+最终输出请使用JSON格式，包含以下字段：
+- "sequence_id": 序列ID
+- "extracted_formulas": 列表，每个元素是一个对象，包含:
+  - "formula_text": 原始公式文本
+  - "formula_type": 公式类型（必须从上述四种类型中选择）
+  - "formula_latex": 公式的LaTeX表示（如果适用）
+  - "confidence": 你对分类的置信度（0-1之间的数值）
+
+请确保提取和分类尽可能准确。对于不确定的类型，请选择"other"。""",
+    category_names={
+        "closed_form": "通项公式",
+        "recurrence": "递推公式",
+        "generating_function": "生成函数",
+        "other": "其他类型"
+    },
+    fallback_type="other",
+    label="四大类",
+    rule_types={
+        "gf": "generating_function",
+        "gf_complex": "generating_function",
+        "egf": "generating_function",
+        "egf_complex": "generating_function",
+        "recurrence": "recurrence",
+        "closed_form": "closed_form"
+    }
+))
+
+# 十一类细分类
+register_taxonomy(Taxonomy(
+    "11",
+    {
+        "generating_function": "生成函数 (G.f., generating function)",
+        "closed_form": "通项公式 (closed form)",
+        "recurrence": "递推关系 (recurrence relation)",
+        "identity": "恒等式 (identity)",
+        "matrix_form": "矩阵形式 (matrix form)",
+        "exponential_generating_function": "指数生成函数 (exponential generating function)",
+        "summation_formula": "求和公式 (summation formula)",
+        "product_formula": "乘积公式 (product formula)",
+        "continued_fraction": "连分数表示 (continued fraction)",
+        "hypergeometric_form": "超几何形式 (hypergeometric form)",
+        "other": "其他类型 (other)"
+    },
+    # 含乘积、求和、连分数写法的生成函数在细分类中可能有歧义，交给模型
+    rule_types={
+        "gf": "generating_function",
+        "egf": "exponential_generating_function",
+        "recurrence": "recurrence",
+        "closed_form": "closed_form"
+    }
+))
@@ -0,0 +1,21 @@
+"""
+共用的智谱AI客户端：入口脚本调用 init_client(api_key) 初始化，
+提交和下载流程通过 get_client() 使用同一个客户端
+"""
+
+_client = None
+
+
+def init_client(api_key=None, **kwargs):
+    """创建客户端；api_key 为空时由 SDK 读取环境变量 ZHIPUAI_API_KEY"""
+    from zhipuai import ZhipuAI  # 只在真正需要访问接口时导入 SDK，离线工具（如基准测试）不依赖它
+
+    global _client
+    _client = ZhipuAI(api_key=api_key, **kwargs)
+    return _client
+
+
+def get_client():
+    if _client is None:
+        init_client()
+    return _client
@@ -0,0 +1,37 @@
+"""
+pytest 公共配置：把仓库根目录加入 sys.path（以 oeis_classfy.xxx 形式导入），
+并提供测试数据目录和本地模拟的智谱AI服务
+"""
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(REPO_ROOT, "tests", "fixtures")
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def oeis_fixture_dir():
+    """小型 OEIS 样例数据（oeis/Annn/*.seq）"""
+    return os.path.join(FIXTURES, "oeis")
+
+
+@pytest.fixture
+def fake_zhipuai(monkeypatch):
+    """启动本地模拟服务并让共用客户端指向它；未安装 zhipuai SDK 时跳过"""
+    pytest.importorskip("zhipuai")
+    from oeis_classfy import zhipu_client
+    from oeis_classfy.fake_zhipuai_server import start_server
+
+    server, base_url = start_server()
+    monkeypatch.setenv("ZHIPUAI_BASE_URL", base_url)
+    monkeypatch.setenv("ZHIPUAI_API_KEY", os.environ.get("ZHIPUAI_API_KEY", "test"))
+    monkeypatch.setattr(zhipu_client, "_client", None)
+    zhipu_client.init_client(base_url=base_url)
+    yield base_url
+    server.shutdown()
+    server.server_close()
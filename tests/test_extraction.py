@@ -0,0 +1,63 @@
+"""
+%F 行提取：输出必须与基线版本 data_onlyclean_json.py 逐字节一致
+"""
+import io
+import os
+import json
+import contextlib
+
+import pytest
+
+from conftest import FIXTURES
+from oeis_classfy.data_onlyclean_json import extract_F_lines
+
+EXPECTED_DIR = os.path.join(FIXTURES, "oeis_onlyclean_json")
+
+
+def list_json_files(root):
+    """返回 root 下所有序列 JSON 的相对路径（不含清单等其他文件）"""
+    found = []
+    for folder in sorted(os.listdir(root)):
+        path = os.path.join(root, folder)
+        if os.path.isdir(path):
+            found.extend(f"{folder}/{name}" for name in sorted(os.listdir(path)) if name.endswith(".json"))
+    return found
+
+
+def assert_same_as_baseline(dst_root):
+    expected = list_json_files(EXPECTED_DIR)
+    assert list_json_files(dst_root) == expected
+    for rel in expected:
+        with open(os.path.join(EXPECTED_DIR, rel), "rb") as f_expected, \
+                open(os.path.join(dst_root, rel), "rb") as f_actual:
+            assert f_actual.read() == f_expected.read(), rel
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract_matches_baseline(oeis_fixture_dir, tmp_path, workers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract_F_lines(oeis_fixture_dir, str(tmp_path), workers=workers)
+    assert_same_as_baseline(str(tmp_path))
+
+
+def test_incremental_rerun_matches_baseline(oeis_fixture_dir, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract_F_lines(oeis_fixture_dir, str(tmp_path), incremental=True)
+        extract_F_lines(oeis_fixture_dir, str(tmp_path), incremental=True)
+    assert_same_as_baseline(str(tmp_path))
+
+
+def test_jsonl_output_has_same_records(oeis_fixture_dir, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract_F_lines(oeis_fixture_dir, str(tmp_path), output_format="jsonl")
+    records = []
+    for name in sorted(os.listdir(tmp_path)):
+        if name.endswith(".jsonl"):
+            with open(os.path.join(tmp_path, name), encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+
+    expected = []
+    for rel in list_json_files(EXPECTED_DIR):
+        with open(os.path.join(EXPECTED_DIR, rel), encoding="utf-8") as f:
+            expected.append(json.load(f))
+    assert records == expected
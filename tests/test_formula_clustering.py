@@ -0,0 +1,39 @@
+"""
+近似公式聚类：与桶内多个成员比较不降低召回率，召回率估计与暴力比较一致
+"""
+import random
+
+from oeis_classfy.bench_pipeline import FORMULA_TEMPLATES
+from oeis_classfy.formula_clustering import (FormulaCorpus, compute_signatures, cluster_formulas,
+                                             sample_neighbors, estimate_recall, jaccard_similarity)
+
+
+def generated_corpus(size, seed=1):
+    rng = random.Random(seed)
+    corpus = FormulaCorpus()
+    while len(corpus) < size:
+        corpus.add(rng.choice(FORMULA_TEMPLATES).format(a=rng.randint(1, 999), b=rng.randint(1, 999)))
+    return corpus
+
+
+def test_bucket_members_improve_recall():
+    corpus = generated_corpus(2000)
+    signatures = compute_signatures(corpus.texts)
+    pairs = sample_neighbors(corpus.texts, 50, 0.9)
+    leader_only, _ = cluster_formulas(corpus.texts, signatures, threshold=0.9, max_bucket_size=1)
+    members, similarities = cluster_formulas(corpus.texts, signatures, threshold=0.9)
+    assert estimate_recall(pairs, members, 0.9) > estimate_recall(pairs, leader_only, 0.9)
+
+    # 成员与代表的精确相似度都不低于阈值
+    for i, representative in enumerate(members):
+        if representative != i:
+            assert similarities[i] >= 0.9 - 1e-6
+
+
+def test_sample_neighbors_matches_brute_force():
+    texts = ["a(n) = 3*a(n-1) - a(n-2).", "a(n) = 4*a(n-1) - a(n-2).", "G.f.: 1/(1-x)."]
+    pairs = sample_neighbors(texts, sample_size=3, min_similarity=0.0)
+    assert len(pairs) == 6
+    for i, j, similarity in pairs:
+        assert abs(similarity - jaccard_similarity(texts[i], texts[j])) < 1e-9
+    assert estimate_recall(pairs, [0, 1, 2], 0.99) is None
@@ -0,0 +1,108 @@
+"""
+公式去重：展开标签时重复公式按 %F 下标插回原来的位置，重复展开结果不变
+"""
+import io
+import json
+import contextlib
+
+from oeis_classfy.formula_dedupe import FormulaDedupeIndex, DedupeRecordingResultStore
+from oeis_classfy.result_store import open_result_store
+from oeis_classfy.reconcile import reconcile_batch_results
+from oeis_classfy.submit_pipeline import build_request_template, encode_request
+
+
+def model_result(sequence_id, formulas):
+    return {"sequence_id": sequence_id,
+            "extracted_formulas": [{"formula_text": text, "formula_type": "other", "formula_latex": "",
+                                    "confidence": 0.9} for text in formulas]}
+
+
+def stored_texts(store, sequence_id):
+    return [f["formula_text"] for f in store.get(sequence_id)["extracted_formulas"]]
+
+
+def test_repeat_within_sequence_keeps_order(tmp_path):
+    formulas = ["x = 1 + y", "x = 1 + y", "foo bar"]
+    with FormulaDedupeIndex(str(tmp_path / "dedupe.sqlite")) as index, \
+            open_result_store(str(tmp_path / "results"), "jsonl") as store:
+        index.begin_build("4")
+        unique = index.assign("4", "A000001", formulas)
+        assert unique == [(0, "x = 1 + y"), (2, "foo bar")]
+        index.flush()
+
+        DedupeRecordingResultStore(store, index, "4").add(
+            "A000001", model_result("A000001", [text for _, text in unique]), "task")
+        assert index.materialize("4", store) == 1
+        assert stored_texts(store, "A000001") == formulas
+
+        # 再次展开不会重复插入
+        index.materialize("4", store)
+        assert stored_texts(store, "A000001") == formulas
+
+
+def test_duplicates_across_sequences_keep_order(tmp_path):
+    with FormulaDedupeIndex(str(tmp_path / "dedupe.sqlite")) as index, \
+            open_result_store(str(tmp_path / "results"), "jsonl") as store:
+        index.begin_build("4")
+        index.assign("4", "A000001", ["a(n) = n", "b"])
+        unique = index.assign("4", "A000002", ["c", "a(n) = n", "d", "b"])
+        assert unique == [(0, "c"), (2, "d")]
+        index.flush()
+
+        recording = DedupeRecordingResultStore(store, index, "4")
+        recording.add("A000001", model_result("A000001", ["a(n) = n", "b"]), "task")
+        recording.add("A000002", model_result("A000002", ["c", "d"]), "task")
+        index.materialize("4", store)
+        index.materialize("4", store)
+        assert stored_texts(store, "A000002") == ["c", "a(n) = n", "d", "b"]
+
+
+def output_line(custom_id, result):
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"content": json.dumps(result)}, "finish_reason": "stop"}]}}})
+
+
+def test_unresolved_owner_is_reported_and_retried(tmp_path):
+    index_path = str(tmp_path / "dedupe.sqlite")
+    with FormulaDedupeIndex(index_path) as index, \
+            open_result_store(str(tmp_path / "results"), "jsonl") as store:
+        index.begin_build("4")
+        index.assign("4", "A000001", ["a(n) = n", "b"])
+        index.assign("4", "A000002", ["c", "a(n) = n"])
+        index.flush()
+
+        # owner 的结果中缺少 "a(n) = n"，A000002 中的重复公式无法展开
+        recording = DedupeRecordingResultStore(store, index, "4")
+        recording.add("A000001", model_result("A000001", ["b"]), "task")
+        recording.add("A000002", model_result("A000002", ["c"]), "task")
+        index.materialize("4", store)
+        assert stored_texts(store, "A000002") == ["c"]
+        assert index.unresolved_owners("4") == {"A000001": 1}
+
+    request_dir = tmp_path / "requests"
+    request_dir.mkdir()
+    template = build_request_template("prompt")
+    with open(request_dir / "batch_requests_1.jsonl", "wb") as f:
+        for custom_id in ("request-0-A000001", "request-1-A000002"):
+            f.write(encode_request(template, custom_id, "user") + b"\n")
+    task_dir = tmp_path / "results" / "task_batch-1"
+    task_dir.mkdir(parents=True)
+    with open(task_dir / "batch_output.jsonl", "w", encoding="utf-8") as f:
+        f.write(output_line("request-0-A000001", model_result("A000001", ["b"])) + "\n")
+        f.write(output_line("request-1-A000002", model_result("A000002", ["c"])) + "\n")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, report = reconcile_batch_results(str(request_dir), str(tmp_path / "results"), taxonomy="4",
+                                            dedupe_index=index_path)
+    assert report["dedupe_unresolved_owners"] == ["A000001"]
+    assert report["retry_custom_ids"]["partial"] == ["request-0-A000001"]
+    assert report["status_counts"]["ok"] == 1
+
+    # 重试后 owner 有了标签，重复公式展开到 A000002
+    with FormulaDedupeIndex(index_path) as index, \
+            open_result_store(str(tmp_path / "results"), "jsonl") as store:
+        DedupeRecordingResultStore(store, index, "4").add(
+            "A000001", model_result("A000001", ["a(n) = n", "b"]), "retry")
+        index.materialize("4", store)
+        assert stored_texts(store, "A000002") == ["c", "a(n) = n"]
+        assert index.unresolved_owners("4") == {}
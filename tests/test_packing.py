@@ -0,0 +1,40 @@
+"""
+打包请求：custom_id 不超过 Batch 接口的长度上限，且能拆回全部序列
+"""
+import io
+import os
+import json
+import contextlib
+
+from oeis_classfy.bench_pipeline import generate_corpus
+from oeis_classfy.data_onlyclean_json import extract_F_lines
+from oeis_classfy.download_pipeline import parse_packed_custom_id
+from oeis_classfy.submit_pipeline import create_batch_jsonl_multi_taxonomy, MAX_CUSTOM_ID_LENGTH
+
+
+def test_packed_custom_ids_fit_length_limit(tmp_path):
+    clean_dir = str(tmp_path / "clean")
+    with contextlib.redirect_stdout(io.StringIO()):
+        src_root, _ = generate_corpus(str(tmp_path), 500, ["other"])
+        extract_F_lines(src_root, clean_dir)
+        results = create_batch_jsonl_multi_taxonomy(clean_dir, str(tmp_path / "requests"), ["4", "11"],
+                                                    pack_token_budget=100000, pack_max_sequences=50)
+
+    expected = set()
+    for root, _, files in os.walk(clean_dir):
+        for name in files:
+            if name.endswith(".json"):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    record = json.load(f)
+                if record["formulas"]:
+                    expected.add(record["sequence_id"])
+
+    for files, _ in results.values():
+        packed = []
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    custom_id = json.loads(line)["custom_id"]
+                    assert len(custom_id) <= MAX_CUSTOM_ID_LENGTH, custom_id
+                    packed.extend(parse_packed_custom_id(custom_id))
+        assert sorted(packed) == sorted(expected)
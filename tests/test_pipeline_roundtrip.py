@@ -0,0 +1,61 @@
+"""
+提交 -> 下载 完整流程（本地模拟服务）：规则分类、公式去重、响应缓存和打包请求同时开启时，
+每个序列得到的公式及顺序必须与不开启这些优化时一致
+"""
+import io
+import os
+import glob
+import contextlib
+
+import pytest
+
+from oeis_classfy import submit_pipeline, download_pipeline
+from oeis_classfy.data_onlyclean_json import extract_F_lines
+from oeis_classfy.result_store import open_result_store
+
+
+def run_pipeline(clean_dir, work_dir, tag, taxonomy="4", store_backend="jsonl", **options):
+    """提交并下载一轮，返回 ({序列ID: [(公式, 类型), ...]}, 请求数)"""
+    request_dir = os.path.join(work_dir, f"requests_{tag}")
+    task_id_file = os.path.join(work_dir, f"ids_{tag}.txt")
+    output_dir = os.path.join(work_dir, f"results_{tag}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        submit_pipeline.run_submit(clean_dir, request_dir, task_id_file, taxonomy=taxonomy, **options)
+        download_pipeline.check_and_download_results(task_id_file, output_dir, store_backend=store_backend,
+                                                     taxonomy=taxonomy, **{k: v for k, v in options.items()
+                                                                          if k != "pack_token_budget"})
+    request_count = 0
+    for path in glob.glob(os.path.join(request_dir, "*.jsonl")):
+        with open(path, encoding="utf-8") as f:
+            request_count += sum(1 for line in f if line.strip())
+
+    with open_result_store(output_dir, store_backend) as store:
+        results = {sequence_id: [(f["formula_text"], f["formula_type"]) for f in result["extracted_formulas"]]
+                   for sequence_id, task, result in store.iter_results()}
+    return results, request_count
+
+
+@pytest.mark.parametrize("store_backend", ["jsonl", "sqlite"])
+def test_roundtrip_with_all_optimizations(fake_zhipuai, oeis_fixture_dir, tmp_path, store_backend):
+    clean_dir = str(tmp_path / "clean")
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract_F_lines(oeis_fixture_dir, clean_dir)
+
+    base, base_requests = run_pipeline(clean_dir, str(tmp_path), "base", store_backend=store_backend)
+    assert base
+
+    options = dict(pack_token_budget=3000,
+                   rule_results_dir=str(tmp_path / "rules"),
+                   dedupe_index=str(tmp_path / "dedupe.sqlite"),
+                   response_cache=str(tmp_path / "cache.sqlite"))
+    first, first_requests = run_pipeline(clean_dir, str(tmp_path), "first", store_backend=store_backend, **options)
+    assert first_requests < base_requests
+    assert first.keys() == base.keys()
+    for sequence_id, formulas in base.items():
+        assert [text for text, _ in first[sequence_id]] == [text for text, _ in formulas], sequence_id
+
+    # 第二轮全部命中缓存，不再发送请求，结果不变
+    second, second_requests = run_pipeline(clean_dir, str(tmp_path), "second", store_backend=store_backend,
+                                           **options)
+    assert second_requests == 0
+    assert second == first
@@ -0,0 +1,35 @@
+"""
+请求文件：OEIS_JSON_BACKEND=json 时 4 类和 11 类方案生成的请求行必须与基线版本逐字节一致
+
+JSON 后端在导入时选定，所以在子进程中生成请求文件
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+from conftest import FIXTURES, REPO_ROOT
+
+GENERATE = """
+import io, sys, contextlib
+from oeis_classfy.submit_pipeline import create_batch_jsonl_with_formula_types
+with contextlib.redirect_stdout(io.StringIO()):
+    create_batch_jsonl_with_formula_types(sys.argv[1], sys.argv[2], taxonomy=sys.argv[3])
+"""
+
+
+@pytest.mark.parametrize("taxonomy", ["4", "11"])
+def test_request_lines_match_baseline(tmp_path, taxonomy):
+    env = dict(os.environ, OEIS_JSON_BACKEND="json",
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    subprocess.run([sys.executable, "-c", GENERATE, os.path.join(FIXTURES, "oeis_onlyclean_json"),
+                    str(tmp_path), taxonomy], check=True, env=env, cwd=REPO_ROOT)
+
+    expected_dir = os.path.join(FIXTURES, f"requests_{taxonomy}")
+    expected = sorted(name for name in os.listdir(expected_dir) if name.endswith(".jsonl"))
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".jsonl")) == expected
+    for name in expected:
+        with open(os.path.join(expected_dir, name), "rb") as f_expected, \
+                open(os.path.join(tmp_path, name), "rb") as f_actual:
+            assert f_actual.read() == f_expected.read(), name
@@ -0,0 +1,39 @@
+"""
+结果分析命令行：模块文档中的示例命令都能运行
+"""
+import sys
+import shlex
+import subprocess
+
+import pytest
+
+from conftest import REPO_ROOT
+from oeis_classfy import result_analytics
+from oeis_classfy.result_store import open_result_store
+
+EXAMPLES = [line.strip() for line in result_analytics.__doc__.splitlines()
+            if line.strip().startswith("python -m oeis_classfy.result_analytics")]
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    root = tmp_path / "batch_results"
+    with open_result_store(str(root), "jsonl") as store:
+        for i, types in enumerate([["recurrence", "other"], ["generating_function"], []]):
+            store.add(f"A00{i}045", {"sequence_id": f"A00{i}045", "extracted_formulas": [
+                {"formula_text": f"f{j}", "formula_type": t, "formula_latex": "", "confidence": 0.5 + j / 10}
+                for j, t in enumerate(types)]}, "task_1")
+    return str(root)
+
+
+def test_docstring_has_examples():
+    assert EXAMPLES
+
+
+@pytest.mark.parametrize("example", EXAMPLES)
+def test_docstring_example_runs(results_dir, example):
+    args = shlex.split(example)[3:]
+    args = [results_dir if arg == "batch_results" else arg for arg in args]
+    completed = subprocess.run([sys.executable, "-m", "oeis_classfy.result_analytics"] + args,
+                               cwd=REPO_ROOT, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
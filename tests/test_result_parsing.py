@@ -0,0 +1,54 @@
+"""
+结果文件解析：进程池并行解析与串行解析的结果和统计完全一致
+"""
+import io
+import os
+import json
+import contextlib
+
+from oeis_classfy import download_pipeline
+from oeis_classfy.bench_parsing import generate_batch_output
+from oeis_classfy.result_store import open_result_store
+from oeis_classfy.taxonomy import get_taxonomy
+
+
+def parse(output_path, result_dir, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        download_pipeline.process_results(output_path, result_dir, taxonomy="4", **options)
+    with open(os.path.join(result_dir, "formula_type_statistics.json"), encoding="utf-8") as f:
+        stats = json.load(f)
+    with open_result_store(result_dir, "jsonl") as store:
+        return stats, list(store.iter_results())
+
+
+def test_parallel_parsing_matches_serial(tmp_path, monkeypatch):
+    output_path = str(tmp_path / "batch_output.jsonl")
+    generate_batch_output(output_path, 3000, list(get_taxonomy("4").formula_types))
+    serial = parse(output_path, str(tmp_path / "serial" / "task"))
+
+    # 单核机器上进程数会被限制为 1，这里按双核运行以覆盖并行路径
+    monkeypatch.setattr(os, "cpu_count", lambda: 2)
+    parallel = parse(output_path, str(tmp_path / "parallel" / "task"), workers=2, min_parallel_bytes=0)
+    assert parallel == serial
+
+
+def test_small_file_is_parsed_serially(tmp_path, monkeypatch):
+    output_path = str(tmp_path / "batch_output.jsonl")
+    generate_batch_output(output_path, 100, list(get_taxonomy("4").formula_types))
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(download_pipeline, "Pool", None)  # 低于阈值时不应创建进程池
+    stats, results = parse(output_path, str(tmp_path / "out"), workers=4)
+    assert stats["total_sequences"] == 100
+    assert len(results) == stats["successful_sequences"]
+
+
+def test_results_without_sequence_id_do_not_collide_across_tasks(tmp_path):
+    content = json.dumps({"extracted_formulas": [{"formula_text": "a(n) = n", "formula_type": "other"}]})
+    line = json.dumps({"custom_id": "request-0-A000001",
+                       "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}})
+    with open_result_store(str(tmp_path), "jsonl") as store:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for task in ("task_a", "task_b"):
+                download_pipeline.process_result_lines([line], str(tmp_path / task), store, taxonomy="4")
+        assert sorted(sequence_id for sequence_id, _, _ in store.iter_results()) == \
+            ["unknown_task_a_1", "unknown_task_b_1"]
@@ -0,0 +1,59 @@
+"""
+分片旁路清单：大小和修改时间一致但内容被改动的分片不能通过清单跳过验证
+"""
+import io
+import os
+import json
+import contextlib
+
+from conftest import FIXTURES
+from oeis_classfy.submit_pipeline import (create_batch_jsonl_with_formula_types, verify_batch_shard,
+                                          shard_manifest_path, file_sha256)
+
+
+def build_shard(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        files, _ = create_batch_jsonl_with_formula_types(os.path.join(FIXTURES, "oeis_onlyclean_json"),
+                                                         str(tmp_path), taxonomy="4")
+    return files[0]
+
+
+def overwrite_keeping_stat(path, old, new):
+    """替换文件中的一段同样长度的内容，并恢复原来的修改时间"""
+    assert len(old) == len(new)
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    assert old in data
+    with open(path, "wb") as f:
+        f.write(data.replace(old, new, 1))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def verify(path):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        ok = verify_batch_shard(path)
+    return ok, output.getvalue()
+
+
+def test_matching_manifest_skips_validation(tmp_path):
+    ok, output = verify(build_shard(tmp_path))
+    assert ok and "跳过验证" in output
+
+
+def test_modified_content_is_revalidated(tmp_path):
+    path = build_shard(tmp_path)
+    overwrite_keeping_stat(path, b"A000045", b"A999999")
+
+    ok, output = verify(path)
+    assert ok and "sha256 不一致" in output
+    with open(shard_manifest_path(path), encoding="utf-8") as f:
+        assert json.load(f)["sha256"] == file_sha256(path)
+
+
+def test_corrupted_content_is_rejected(tmp_path):
+    path = build_shard(tmp_path)
+    overwrite_keeping_stat(path, b'"custom_id"', b'"custom_xx"')
+    ok, _ = verify(path)
+    assert not ok
@@ -0,0 +1,108 @@
+"""
+流式下载：中断后的下一次运行改用可断点续传的下载，结果与普通下载一致
+"""
+import io
+import os
+import json
+import hashlib
+import contextlib
+
+import pytest
+
+from conftest import FIXTURES
+from oeis_classfy import submit_pipeline, download_pipeline, fake_zhipuai_server
+from oeis_classfy.result_store import open_result_store
+
+
+def download(task_id_file, output_dir, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        download_pipeline.check_and_download_results(task_id_file, output_dir, taxonomy="4", **options)
+    with open_result_store(output_dir, "jsonl") as store:
+        return {sequence_id: result for sequence_id, _, result in store.iter_results()}
+
+
+def read_state(output_dir):
+    with open(os.path.join(output_dir, download_pipeline.DOWNLOAD_STATE_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_interrupted_stream_falls_back_to_resumable_download(fake_zhipuai, tmp_path, monkeypatch):
+    task_id_file = str(tmp_path / "ids.txt")
+    with contextlib.redirect_stdout(io.StringIO()):
+        submit_pipeline.run_submit(os.path.join(FIXTURES, "oeis_onlyclean_json"), str(tmp_path / "requests"),
+                                   task_id_file, taxonomy="4")
+    expected = download(task_id_file, str(tmp_path / "plain"))
+
+    def interrupted(lines, *args, **kwargs):
+        next(iter(lines))
+        raise ConnectionError("模拟的连接中断")
+
+    output_dir = str(tmp_path / "streamed")
+    with monkeypatch.context() as patch:
+        patch.setattr(download_pipeline, "process_result_lines", interrupted)
+        download(task_id_file, output_dir, stream_results=True)
+    (entry,) = read_state(output_dir).values()
+    assert entry["status"] == "streaming"
+
+    assert download(task_id_file, output_dir, stream_results=True) == expected
+    (entry,) = read_state(output_dir).values()
+    assert entry["status"] == "finished"
+    task_dir = download_pipeline.batch_output_dir(output_dir, next(iter(read_state(output_dir))))
+    result_path = os.path.join(task_dir, "batch_output.jsonl")
+    assert entry["output_sha256"] == download_pipeline.file_sha256(result_path)
+    assert not os.path.exists(result_path + ".gz")
+
+
+def test_stream_records_size_and_checksum(fake_zhipuai, tmp_path):
+    task_id_file = str(tmp_path / "ids.txt")
+    with contextlib.redirect_stdout(io.StringIO()):
+        submit_pipeline.run_submit(os.path.join(FIXTURES, "oeis_onlyclean_json"), str(tmp_path / "requests"),
+                                   task_id_file, taxonomy="4")
+    output_dir = str(tmp_path / "streamed")
+    assert download(task_id_file, output_dir, stream_results=True)
+    (batch_id, entry), = read_state(output_dir).items()
+    assert entry["status"] == "finished"
+    assert entry["output_bytes"] > 0 and len(entry["output_sha256"]) == 64
+
+
+def test_lines_are_yielded_before_the_body_is_complete(fake_zhipuai):
+    content = b"".join(b'{"line": %d}\n' % i for i in range(1000))
+    fake_zhipuai_server.FILES["file-stream"] = {"filename": "output.jsonl", "purpose": "batch",
+                                                "content": content, "created_at": 0}
+    # 服务端只先发送前 100 字节，在测试放行前不发送剩余内容
+    fake_zhipuai_server.CONFIG["pause_after"] = 100
+    with download_pipeline.open_file_chunks("file-stream", chunk_size=16) as chunks:
+        lines = download_pipeline.iter_lines_from_chunks(chunks)
+        assert next(lines) == '{"line": 0}'
+        fake_zhipuai_server.BODY_RESUMED.set()
+        rest = list(lines)
+    assert not fake_zhipuai_server.CONFIG["pause_timed_out"]
+    assert "\n".join(['{"line": 0}'] + rest) + "\n" == content.decode("utf-8")
+
+
+def test_cut_download_resumes_from_written_bytes(fake_zhipuai, tmp_path, monkeypatch):
+    content = b"".join(b'{"line": %d}\n' % i for i in range(1000))
+    fake_zhipuai_server.FILES["file-cut"] = {"filename": "output.jsonl", "purpose": "batch",
+                                             "content": content, "created_at": 0}
+    dest_path = str(tmp_path / "batch_output.jsonl")
+    fake_zhipuai_server.CONFIG["cut_after"] = 5000
+    with pytest.raises(Exception):
+        download_pipeline.download_file_resumable("file-cut", dest_path, chunk_size=1024)
+    written = os.path.getsize(dest_path + ".part")
+    assert 0 < written <= 5000
+    assert not os.path.exists(dest_path)
+
+    requested = []
+    open_file_response = download_pipeline.open_file_response
+
+    def recording(file_id, headers=None):
+        requested.append(headers)
+        return open_file_response(file_id, headers)
+
+    monkeypatch.setattr(download_pipeline, "open_file_response", recording)
+    with contextlib.redirect_stdout(io.StringIO()):
+        size, sha256 = download_pipeline.download_file_resumable("file-cut", dest_path, chunk_size=1024)
+    assert requested == [{"Range": f"bytes={written}-"}]
+    assert (size, sha256) == (len(content), hashlib.sha256(content).hexdigest())
+    with open(dest_path, "rb") as f:
+        assert f.read() == content